@@ -1,8 +1,54 @@
-from fastapi import FastAPI
-from routes.chat_routes import router as chat_router
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from routes.chat_routes import router as chat_router, warm_up_model_configs, greeting_prompt
 from fastapi.middleware.cors import CORSMiddleware
+from models.db import init_motor_client, close_motor_client
+from models.indexes import bootstrap_indexes
+from utils.transcript_writer import transcript_writer
+from utils.session_manager import get_session_store
+from utils.session_counts import session_counter
+from utils.response_cache import response_cache
+from services.http_clients import init_http_clients, close_http_clients
+from services import calendar_service
+from services.crm_outbox import crm_outbox
+from services.resilience import upstream_stats
+from services.greeting_pool import greeting_pool
+from config import settings
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from utils.metrics import REQUEST_SECONDS, server_timing_header, start_request_timings
 
-app = FastAPI(title="SDR Agent Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_motor_client()
+    init_http_clients()
+    store = get_session_store()
+    await bootstrap_indexes()
+    await store.start()
+    transcript_writer.start()
+    if settings.SESSION_COUNT_ABANDONED:
+        session_counter.start()
+    if settings.CRM_OUTBOX_ENABLED:
+        await crm_outbox.ensure_indexes()
+        await crm_outbox.start()
+    calendar_service.AVAILABILITY.start([settings.CAL_EVENT_TYPE_ID])
+    await warm_up_model_configs()
+    greeting_pool.start(greeting_prompt())
+    try:
+        yield
+    finally:
+        await greeting_pool.stop()
+        await transcript_writer.stop()
+        await session_counter.stop()
+        await crm_outbox.stop()
+        await store.stop()
+        await calendar_service.AVAILABILITY.stop()
+        await close_http_clients()
+        close_motor_client()
+
+
+app = FastAPI(title="SDR Agent Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +62,56 @@ app.add_middleware(
 app.include_router(chat_router, prefix="/api")
 
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", response.status_code).observe(elapsed)
+    # Em /message/stream o cabeçalho sai antes do corpo, então cobre só o trabalho feito antes do primeiro evento.
+    response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+
 @app.get('/')
 async def root():
-    return {"ok": True, "msg": "SDR Agent Backend running"}
\ No newline at end of file
+    return {"ok": True, "msg": "SDR Agent Backend running"}
+
+
+@app.get('/stats')
+async def stats():
+    return {
+        "transcript_writer": transcript_writer.stats(),
+        "sessions": get_session_store().stats(),
+        "availability": calendar_service.AVAILABILITY.stats(),
+        "crm_outbox": crm_outbox.stats(),
+        "upstreams": upstream_stats(),
+        "greetings": greeting_pool.stats(),
+        "session_counts": session_counter.stats(),
+        "response_cache": response_cache.stats(),
+    }
+
+
+@app.get('/metrics')
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get('/sessions/counts/{day}')
+async def session_counts(day: str):
+    return await session_counter.daily(day)
+
+
+@app.get('/outbox')
+async def outbox_status():
+    return {"jobs": await crm_outbox.status_counts(), **crm_outbox.stats()}
+
+
+@app.get('/outbox/{job_id}')
+async def outbox_job(job_id: str):
+    job = await crm_outbox.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
\ No newline at end of file
@@ -0,0 +1,93 @@
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_crm_outbox --turns 100 --concurrency 20 --latency-ms 50 400 1500
+#   python -m benchmarks.bench_crm_outbox --mongomock   # sem servidor
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import respx
+
+from models import db
+from services import pipefy_service
+from services.crm_outbox import crm_outbox
+from services.tool_executor import execute_tool_calls
+
+
+def stand_in(latency_ms: float):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency_ms / 1000)
+        body = request.content.decode()
+        if "findCards" in body:
+            return httpx.Response(200, json={"data": {"findCards": {"edges": [{"node": {"id": "1", "fields": []}}]}}})
+        return httpx.Response(200, json={"data": {}})
+    return handler
+
+
+async def turn(i: int) -> float:
+    lead = {"nome": f"Lead {i}", "email": f"lead{i % 25}@acme.com", "empresa": "Acme", "necessidade": "CRM"}
+    start = time.perf_counter()
+    await execute_tool_calls([("create_or_update_card_pipefy", {"lead": lead})], session_id=f"bench-{i}")
+    return (time.perf_counter() - start) * 1000
+
+
+async def run(label: str, turns: int, concurrency: int) -> None:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int) -> float:
+        async with gate:
+            return await turn(i)
+
+    samples = await asyncio.gather(*[limited(i) for i in range(turns)])
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    print(f"  {label:<10} p50={cuts[49]:.1f}ms p95={cuts[94]:.1f}ms max={max(samples):.1f}ms")
+
+
+async def drain() -> float:
+    start = time.perf_counter()
+    while True:
+        counts = await crm_outbox.status_counts()
+        if not counts["pending"] and not counts["processing"]:
+            return time.perf_counter() - start
+        await asyncio.sleep(0.05)
+
+
+async def main(turns: int, concurrency: int, latencies: list[float]) -> None:
+    db.init_motor_client()
+    await crm_outbox.collection.delete_many({})
+    try:
+        for latency_ms in latencies:
+            print(f"Pipefy com {latency_ms:.0f}ms por requisição:")
+            with respx.mock:
+                respx.post(pipefy_service.PIPEFY_URL).mock(side_effect=stand_in(latency_ms))
+                pipefy_service.CARD_ID_CACHE.clear()
+                await run("inline", turns, concurrency)
+
+                pipefy_service.CARD_ID_CACHE.clear()
+                processed = crm_outbox.metrics["processed"]
+                await crm_outbox.start()
+                await run("outbox", turns, concurrency)
+                drained = await drain()
+                await crm_outbox.stop()
+                counts = await crm_outbox.status_counts()
+                print(f"  outbox drenada em {drained:.2f}s, {counts['done']} jobs concluídos, {crm_outbox.metrics['processed'] - processed} upserts")
+            await crm_outbox.collection.delete_many({})
+    finally:
+        db.close_motor_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[50, 400, 1500])
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        db.create_motor_client = lambda: AsyncMongoMockClient()
+
+    asyncio.run(main(args.turns, args.concurrency, args.latency_ms))
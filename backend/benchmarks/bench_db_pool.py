@@ -0,0 +1,79 @@
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_db_pool --turns 200             # mongod em MONGODB_URI
+#   python -m benchmarks.bench_db_pool --turns 200 --mongomock # sem servidor
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from config import settings
+from models import db
+
+
+def _percentiles(samples: list[float]) -> tuple[float, float]:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[98]
+
+
+async def _legacy_op(op):
+    client = db.create_motor_client()
+    try:
+        await op(client[settings.MONGODB_DB])
+    finally:
+        client.close()
+
+
+async def legacy_turn(session_id: str):
+    now = datetime.utcnow()
+    msg = {"role": "user", "content": "Olá"}
+    await _legacy_op(lambda d: d.sessions.update_one({"session_id": session_id}, {"$push": {"messages": msg}, "$set": {"updated_at": now}}))
+    await _legacy_op(lambda d: d.sessions.update_one({"session_id": session_id}, {"$push": {"messages": msg}, "$set": {"updated_at": now}}))
+    await _legacy_op(lambda d: d.sessions.update_one({"session_id": session_id}, {"$set": {"lead_email": "bench@example.com", "updated_at": now}}))
+    await _legacy_op(lambda d: d.sessions.find_one({"session_id": session_id}))
+
+
+async def pooled_turn(session_id: str):
+    msg = {"role": "user", "content": "Olá"}
+    await db.add_message_db(session_id, msg)
+    await db.add_message_db(session_id, msg)
+    await db.update_session_lead_email(session_id, "bench@example.com")
+    await db.get_session_db(session_id)
+
+
+async def run(turn, turns: int) -> list[float]:
+    session_id = f"bench-{uuid.uuid4()}"
+    await db.create_session_db(session_id, "")
+    samples = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        await turn(session_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    await db.get_database().sessions.delete_one({"session_id": session_id})
+    return samples
+
+
+async def main(turns: int):
+    db.init_motor_client()
+    try:
+        for name, turn in (("por operação (antes)", legacy_turn), ("pool compartilhado (depois)", pooled_turn)):
+            samples = await run(turn, turns)
+            p50, p99 = _percentiles(samples)
+            print(f"{name:<28} turns={turns} p50={p50:.2f}ms p99={p99:.2f}ms")
+    finally:
+        db.close_motor_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        db.create_motor_client = lambda: AsyncMongoMockClient()
+
+    asyncio.run(main(args.turns))
@@ -0,0 +1,140 @@
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_lead_extraction --repeat 200
+import argparse
+import statistics
+import time
+
+from utils.lead_extractor import extract
+
+# (etapa, mensagem, campos esperados ou None quando a mensagem deve ir para o modelo)
+CORPUS = [
+    ("initial", "João", {"nome": "João"}),
+    ("initial", "Maria Eduarda", {"nome": "Maria Eduarda"}),
+    ("initial", "Carlos Alberto de Souza", {"nome": "Carlos Alberto de Souza"}),
+    ("initial", "meu nome é Fernanda", {"nome": "Fernanda"}),
+    ("initial", "Meu nome e Ricardo Lima", {"nome": "Ricardo Lima"}),
+    ("initial", "me chamo Paulo", {"nome": "Paulo"}),
+    ("initial", "Oi! Me chamo Juliana Prado", {"nome": "Juliana Prado"}),
+    ("initial", "pode me chamar de Bia", {"nome": "Bia"}),
+    ("initial", "aqui é o Marcos, da Acme", {"nome": "Marcos"}),
+    ("initial", "sou a Camila", {"nome": "Camila"}),
+    ("initial", "Lucas.", {"nome": "Lucas"}),
+    ("initial", "oi", None),
+    ("initial", "Olá", None),
+    ("initial", "bom dia", None),
+    ("initial", "quanto custa?", None),
+    ("initial", "vocês fazem app mobile?", None),
+    ("initial", "prefiro não dizer meu nome", None),
+    ("ask_email", "joao@acme.com", {"email": "joao@acme.com"}),
+    ("ask_email", "maria.eduarda@empresa.com.br", {"email": "maria.eduarda@empresa.com.br"}),
+    ("ask_email", "meu email é carlos_souza@gmail.com", {"email": "carlos_souza@gmail.com"}),
+    ("ask_email", "claro! fernanda+vendas@startup.io", {"email": "fernanda+vendas@startup.io"}),
+    ("ask_email", "Segue: ricardo.lima@lima-consultoria.com.br.", {"email": "ricardo.lima@lima-consultoria.com.br"}),
+    ("ask_email", "é paulo@padaria.com", {"email": "paulo@padaria.com"}),
+    ("ask_email", "juliana@prado.adv.br", {"email": "juliana@prado.adv.br"}),
+    ("ask_email", "BIA@LOJA.COM", {"email": "BIA@loja.com"}),
+    ("ask_email", "pode ser o marcos@acme.com?", {"email": "marcos@acme.com"}),
+    ("ask_email", "camila arroba gmail", None),
+    ("ask_email", "prefiro não passar", None),
+    ("ask_email", "lucas@", None),
+    ("ask_email", "por que vocês precisam do meu email?", None),
+    ("ask_empresa", "Acme", {"empresa": "Acme"}),
+    ("ask_empresa", "Tech Solutions Ltda", {"empresa": "Tech Solutions Ltda"}),
+    ("ask_empresa", "Padaria Pão Quente ME", {"empresa": "Padaria Pão Quente ME"}),
+    ("ask_empresa", "trabalho na Magazine Luiza", {"empresa": "Magazine Luiza"}),
+    ("ask_empresa", "sou da Prado Advogados", {"empresa": "Prado Advogados"}),
+    ("ask_empresa", "a empresa se chama Lima Consultoria", {"empresa": "Lima Consultoria"}),
+    ("ask_empresa", "Minha empresa é a Construtora Horizonte S.A.", {"empresa": "Construtora Horizonte S.A"}),
+    ("ask_empresa", "Globex Inc", {"empresa": "Globex Inc"}),
+    ("ask_empresa", "3M do Brasil", {"empresa": "3M do Brasil"}),
+    ("ask_empresa", "Startup XYZ", {"empresa": "Startup XYZ"}),
+    ("ask_empresa", "é uma empresa pequena de varejo, ainda sem nome", None),
+    ("ask_empresa", "prefiro não dizer", None),
+    ("ask_empresa", "Não tenho empresa ainda", None),
+    ("ask_empresa", "sou autônomo", None),
+    ("ask_prazo", "30 dias", {"prazo": "30 dias"}),
+    ("ask_prazo", "em 2 meses", {"prazo": "em 2 meses"}),
+    ("ask_prazo", "até dezembro", {"prazo": "até dezembro"}),
+    ("ask_prazo", "daqui a três semanas", {"prazo": "daqui a três semanas"}),
+    ("ask_prazo", "é urgente", {"prazo": "urgente"}),
+    ("ask_prazo", "o quanto antes", {"prazo": "o quanto antes"}),
+    ("ask_prazo", "pra ontem kkk", {"prazo": "pra ontem"}),
+    ("ask_prazo", "até o fim do ano", {"prazo": "até o fim do ano"}),
+    ("ask_prazo", "no próximo trimestre", {"prazo": "no próximo trimestre"}),
+    ("ask_prazo", "uns 6 meses", {"prazo": "uns 6 meses"}),
+    ("ask_prazo", "sem pressa", {"prazo": "sem pressa"}),
+    ("ask_prazo", "até março de 2026", {"prazo": "até março de 2026"}),
+    ("ask_prazo", "não sei ainda", None),
+    ("ask_prazo", "depende do orçamento", None),
+    ("ask_prazo", "quanto tempo vocês levam?", None),
+    ("confirm_interest", "não", None),
+    ("confirm_interest", "agora não, obrigado", None),
+    ("confirm_interest", "Não tenho interesse", None),
+    ("confirm_interest", "talvez depois", None),
+    ("confirm_interest", "sim", None),
+    ("confirm_interest", "pode agendar", None),
+    ("confirm_interest", "claro, vamos marcar", None),
+    ("confirm_interest", "qual seria o valor?", None),
+    ("ask_necessidade", "precisamos de um CRM para o time comercial", None),
+    ("ask_necessidade", "controle de estoque", None),
+    ("initial", "Obrigado", None),
+    ("initial", "Preço", None),
+    ("initial", "Entendi", None),
+    ("initial", "Sou a responsável pela compra", None),
+    ("ask_empresa", "Trabalho sozinho", None),
+    ("ask_empresa", "Ainda estou abrindo", None),
+    ("ask_empresa", "Nenhuma", None),
+    ("ask_prazo", "em 2 dias não, prefiro em 3 meses", None),
+]
+
+
+def evaluate() -> dict:
+    counts = {"correct": 0, "wrong": 0, "missed": 0, "false_positive": 0, "deferred": 0, "complete": 0}
+    mismatches = []
+    for stage, message, expected in CORPUS:
+        extraction = extract(stage, message)
+        got = extraction.info if extraction else None
+        if expected is None:
+            counts["false_positive" if got else "deferred"] += 1
+        elif got is None:
+            counts["missed"] += 1
+        elif got == expected:
+            counts["correct"] += 1
+            counts["complete"] += int(extraction.complete)
+        else:
+            counts["wrong"] += 1
+        if got != expected:
+            mismatches.append((stage, message, expected, got))
+    return {**counts, "mismatches": mismatches}
+
+
+def latency_us(repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        for stage, message, _ in CORPUS:
+            start = time.perf_counter()
+            extract(stage, message)
+            samples.append((time.perf_counter() - start) * 1_000_000)
+    return samples
+
+
+def main(repeat: int) -> None:
+    result = evaluate()
+    answerable = sum(1 for *_, expected in CORPUS if expected is not None)
+    extracted = result["correct"] + result["wrong"] + result["false_positive"]
+    print(f"mensagens={len(CORPUS)} com resposta extraível={answerable}")
+    print(f"precisão={result['correct'] / max(1, extracted):.1%} cobertura={result['correct'] / answerable:.1%} "
+          f"falsos positivos={result['false_positive']} respondidas por template={result['complete']}")
+    for stage, message, expected, got in result["mismatches"]:
+        print(f"  [{stage}] {message!r}: esperado={expected} obtido={got}")
+
+    samples = latency_us(repeat)
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    print(f"latência por mensagem p50={cuts[49]:.1f}µs p99={cuts[98]:.1f}µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    main(args.repeat)
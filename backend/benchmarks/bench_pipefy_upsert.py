@@ -0,0 +1,75 @@
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_pipefy_upsert --upserts 50 --latency-ms 40
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import respx
+
+from services import pipefy_service
+
+LEAD = {
+    "nome": "João da Silva",
+    "email": "joao@acme.com",
+    "empresa": "Acme",
+    "necessidade": "CRM",
+    "interesse_confirmado": True,
+    "meeting_link": "https://meet.link/abc",
+    "meeting_datetime": "2025-12-01T12:00:00Z",
+}
+
+
+def stand_in(latency_ms: float):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency_ms / 1000)
+        body = request.content.decode()
+        if "findCards" in body:
+            return httpx.Response(200, json={"data": {"findCards": {"edges": [{"node": {"id": "1", "fields": []}}]}}})
+        return httpx.Response(200, json={"data": {}})
+    return handler
+
+
+async def legacy_update_card(client: httpx.AsyncClient, card_id: str, fields_to_update: list) -> dict:
+    results = []
+    for field in fields_to_update:
+        if field['field_id'] in ('email', 'interesse_confirmado'):
+            continue
+        mutation = {"query": f'mutation {{ updateCardField(input: {{card_id: "{card_id}", field_id: "{field["field_id"]}", new_value: "{field["field_value"]}"}}) {{ card {{ id }} }} }}'}
+        response = await client.post(pipefy_service.PIPEFY_URL, headers=pipefy_service.HEADERS, json=mutation)
+        results.append({"field_id": field["field_id"], "status": "ok" if "errors" not in response.json() else "error"})
+    return {"message": "Processo concluído", "results": results}
+
+
+async def run(label: str, upserts: int, latency_ms: float):
+    with respx.mock:
+        route = respx.post(pipefy_service.PIPEFY_URL).mock(side_effect=stand_in(latency_ms))
+        samples = []
+        async with httpx.AsyncClient() as client:
+            for _ in range(upserts):
+                start = time.perf_counter()
+                await pipefy_service.upsert_lead_card(client, LEAD)
+                samples.append((time.perf_counter() - start) * 1000)
+        print(
+            f"{label:<22} requisições/upsert={route.call_count / upserts:.1f} "
+            f"p50={statistics.median(samples):.1f}ms max={max(samples):.1f}ms"
+        )
+
+
+async def main(upserts: int, latency_ms: float):
+    batched = pipefy_service.update_card
+    pipefy_service.update_card = legacy_update_card
+    try:
+        await run("campo a campo (antes)", upserts, latency_ms)
+    finally:
+        pipefy_service.update_card = batched
+    await run("mutation única (depois)", upserts, latency_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--upserts", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    args = parser.parse_args()
+    asyncio.run(main(args.upserts, args.latency_ms))
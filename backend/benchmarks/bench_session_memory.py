@@ -0,0 +1,64 @@
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_session_memory --sessions 10000 100000 --turns 6
+import argparse
+import gc
+import tracemalloc
+from datetime import datetime, timedelta
+
+from models.lead import Lead
+from models.session import Message, Role, Session
+
+TURNS = [
+    ("user", "Olá, meu nome é João"),
+    ("assistant", "Prazer, João! Qual é o seu e-mail?"),
+    ("user", "joao@acme.com"),
+    ("assistant", "Obrigado! Qual é o nome da sua empresa?"),
+]
+
+
+def legacy_session(turns: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        "messages": [{"role": role, "content": content} for role, content in TURNS * turns],
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=30),
+        "stage": "ask_empresa",
+        "lead": Lead(nome="João", email="joao@acme.com"),
+    }
+
+
+def slotted_session(turns: int) -> Session:
+    now = datetime.utcnow()
+    return Session(
+        created_at=now,
+        expires_at=now + timedelta(minutes=30),
+        stage="ask_empresa",
+        lead=Lead(nome="João", email="joao@acme.com"),
+        messages=[Message(Role(role), content) for role, content in TURNS * turns],
+    )
+
+
+def measure(factory, count: int, turns: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    table = {str(i): factory(turns) for i in range(count)}
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del table
+    return (after - before) / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+
+    for count in args.sessions:
+        legacy = measure(legacy_session, count, args.turns)
+        slotted = measure(slotted_session, count, args.turns)
+        print(
+            f"sessions={count:<7} dict={legacy:,.0f} B/sessão  slots={slotted:,.0f} B/sessão  "
+            f"economia={(1 - slotted / legacy) * 100:.1f}%"
+        )
@@ -0,0 +1,73 @@
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_transcript_buckets --messages 2000             # mongod em MONGODB_URI
+#   python -m benchmarks.bench_transcript_buckets --messages 2000 --mongomock # sem servidor
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from models import db
+
+
+def _ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+async def legacy_append(session_id: str, message: dict):
+    await db.get_database().sessions.update_one(
+        {"session_id": session_id},
+        {"$push": {"messages": message}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+async def legacy_tail(session_id: str, limit: int):
+    doc = await db.get_database().sessions.find_one({"session_id": session_id})
+    return doc["messages"][-limit:]
+
+
+async def bucketed_tail(session_id: str, limit: int):
+    return (await db.get_session_db(session_id, limit=limit, tail=True))["messages"]
+
+
+async def run(label: str, append, tail, messages: int, tail_size: int) -> None:
+    session_id = f"bench-{uuid.uuid4()}"
+    await db.create_session_db(session_id, "")
+    writes = []
+    for i in range(messages):
+        start = time.perf_counter()
+        await append(session_id, {"role": "user", "content": f"mensagem {i} " + "x" * 200})
+        writes.append(_ms(start))
+    start = time.perf_counter()
+    await tail(session_id, tail_size)
+    read = _ms(start)
+    first, last = statistics.mean(writes[:100]), statistics.mean(writes[-100:])
+    print(f"{label:<10} msgs={messages} escrita(100 primeiras)={first:.2f}ms escrita(100 últimas)={last:.2f}ms tail({tail_size})={read:.2f}ms")
+    await db.get_database().sessions.delete_one({"session_id": session_id})
+    await db.get_database().session_messages.delete_many({"session_id": session_id})
+
+
+async def main(messages: int, tail_size: int):
+    db.init_motor_client()
+    try:
+        await run("array", legacy_append, legacy_tail, messages, tail_size)
+        await run("buckets", db.add_message_db, bucketed_tail, messages, tail_size)
+    finally:
+        db.close_motor_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--tail", type=int, default=20)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        db.create_motor_client = lambda: AsyncMongoMockClient()
+
+    asyncio.run(main(args.messages, args.tail))
\ No newline at end of file
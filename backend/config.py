@@ -5,16 +5,89 @@ from datetime import timedelta
 
 class Settings(BaseSettings):
     SESSION_TIMEOUT: int = Field(30, env="SESSION_TIMEOUT")
+    SESSION_STORE: str = Field("memory", env="SESSION_STORE")
+    SESSION_CACHE_TTL_SECONDS: float = Field(2.0, env="SESSION_CACHE_TTL_SECONDS")
+    SESSION_RETENTION_SECONDS: int = Field(7 * 24 * 3600, env="SESSION_RETENTION_SECONDS")
+    SESSION_MAX_COUNT: int = Field(10000, env="SESSION_MAX_COUNT")
+    SESSION_SWEEP_INTERVAL_SECONDS: float = Field(30.0, env="SESSION_SWEEP_INTERVAL_SECONDS")
+    SESSION_LAZY_PERSISTENCE: bool | None = Field(None, env="SESSION_LAZY_PERSISTENCE")
+    SESSION_COUNT_ABANDONED: bool = Field(True, env="SESSION_COUNT_ABANDONED")
+    SESSION_COUNTS_FLUSH_SECONDS: float = Field(10.0, env="SESSION_COUNTS_FLUSH_SECONDS")
     MONGODB_DB: str = Field("dbname", env="MONGODB_DB")
     MONGODB_URI: str = Field("mongodb://localhost:27017", env="MONGODB_URI")
+    MONGODB_MAX_POOL_SIZE: int = Field(50, env="MONGODB_MAX_POOL_SIZE")
+    MONGODB_MIN_POOL_SIZE: int = Field(0, env="MONGODB_MIN_POOL_SIZE")
+    MONGODB_MAX_IDLE_TIME_MS: int = Field(60000, env="MONGODB_MAX_IDLE_TIME_MS")
+    MONGODB_CONNECT_TIMEOUT_MS: int = Field(5000, env="MONGODB_CONNECT_TIMEOUT_MS")
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = Field(5000, env="MONGODB_SERVER_SELECTION_TIMEOUT_MS")
+    MONGODB_SOCKET_TIMEOUT_MS: int = Field(10000, env="MONGODB_SOCKET_TIMEOUT_MS")
+    TRANSCRIPT_FLUSH_INTERVAL_MS: int = Field(200, env="TRANSCRIPT_FLUSH_INTERVAL_MS")
+    TRANSCRIPT_BATCH_SIZE: int = Field(100, env="TRANSCRIPT_BATCH_SIZE")
+    TRANSCRIPT_QUEUE_MAXSIZE: int = Field(10000, env="TRANSCRIPT_QUEUE_MAXSIZE")
+    TRANSCRIPT_BUCKET_SIZE: int = Field(100, env="TRANSCRIPT_BUCKET_SIZE")
+    TRANSCRIPT_MAX_RETRIES: int = Field(5, env="TRANSCRIPT_MAX_RETRIES")
     AI_API_KEY: str | None = Field(None, env="AI_API_KEY")
     AI_MODEL: str = Field("gpt-4", env="AI_MODEL")
+    AI_CONTEXT_CACHE_ENABLED: bool = Field(True, env="AI_CONTEXT_CACHE_ENABLED")
+    AI_CONTEXT_CACHE_TTL_SECONDS: int = Field(3600, env="AI_CONTEXT_CACHE_TTL_SECONDS")
+    AI_MAX_TOOL_ROUNDS: int = Field(1, env="AI_MAX_TOOL_ROUNDS")
+    GREETING_POOL_SIZE: int = Field(8, env="GREETING_POOL_SIZE")
+    GREETING_POOL_REFRESH_SECONDS: float = Field(3600.0, env="GREETING_POOL_REFRESH_SECONDS")
+    CONTEXT_RECENT_MESSAGES: int = Field(12, env="CONTEXT_RECENT_MESSAGES")
+    CONTEXT_MAX_TOKENS: int = Field(3000, env="CONTEXT_MAX_TOKENS")
+    CONTEXT_ACTION_RESULT_CHARS: int = Field(800, env="CONTEXT_ACTION_RESULT_CHARS")
+    LOCAL_EXTRACTION_ENABLED: bool = Field(True, env="LOCAL_EXTRACTION_ENABLED")
+    LOCAL_TEMPLATE_REPLIES: bool = Field(True, env="LOCAL_TEMPLATE_REPLIES")
+    RESPONSE_CACHE_ENABLED: bool = Field(True, env="RESPONSE_CACHE_ENABLED")
+    RESPONSE_CACHE_STAGES: str = Field("initial,ask_email,ask_empresa,ask_necessidade,ask_prazo", env="RESPONSE_CACHE_STAGES")
+    RESPONSE_CACHE_SIZE: int = Field(2048, env="RESPONSE_CACHE_SIZE")
+    RESPONSE_CACHE_TTL_SECONDS: float = Field(3600.0, env="RESPONSE_CACHE_TTL_SECONDS")
     PIPEFY_API_URL: str | None = Field("https://api.pipefy.com/graphql", env="PIPEFY_API_URL")
     PIPEFY_TOKEN: str | None = Field(None, env="PIPEFY_TOKEN")
+    PIPEFY_CARD_CACHE_SIZE: int = Field(10000, env="PIPEFY_CARD_CACHE_SIZE")
+    PIPEFY_CARD_CACHE_TTL_SECONDS: int = Field(3600, env="PIPEFY_CARD_CACHE_TTL_SECONDS")
+    CRM_OUTBOX_ENABLED: bool = Field(True, env="CRM_OUTBOX_ENABLED")
+    CRM_OUTBOX_WORKERS: int = Field(4, env="CRM_OUTBOX_WORKERS")
+    CRM_OUTBOX_POLL_INTERVAL_MS: int = Field(500, env="CRM_OUTBOX_POLL_INTERVAL_MS")
+    CRM_OUTBOX_MAX_ATTEMPTS: int = Field(8, env="CRM_OUTBOX_MAX_ATTEMPTS")
+    CRM_OUTBOX_BACKOFF_SECONDS: float = Field(1.0, env="CRM_OUTBOX_BACKOFF_SECONDS")
+    CRM_OUTBOX_MAX_BACKOFF_SECONDS: float = Field(60.0, env="CRM_OUTBOX_MAX_BACKOFF_SECONDS")
+    CRM_OUTBOX_LEASE_SECONDS: float = Field(120.0, env="CRM_OUTBOX_LEASE_SECONDS")
     CALENDAR_BASE_URL: str | None = Field(None, env="CALENDAR_BASE_URL")
     CALENDAR_API_KEY: str | None = Field(None, env="CALENDAR_API_KEY")
+    HTTP2_ENABLED: bool = Field(True, env="HTTP2_ENABLED")
+    HTTP_MAX_CONNECTIONS: int = Field(20, env="HTTP_MAX_CONNECTIONS")
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(10, env="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = Field(30.0, env="HTTP_KEEPALIVE_EXPIRY_SECONDS")
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = Field(5.0, env="HTTP_CONNECT_TIMEOUT_SECONDS")
+    HTTP_READ_TIMEOUT_SECONDS: float = Field(10.0, env="HTTP_READ_TIMEOUT_SECONDS")
+    PIPEFY_TOOL_TIMEOUT_SECONDS: float = Field(8.0, env="PIPEFY_TOOL_TIMEOUT_SECONDS")
+    CALENDAR_TOOL_TIMEOUT_SECONDS: float = Field(8.0, env="CALENDAR_TOOL_TIMEOUT_SECONDS")
+    UPSTREAM_QUEUE_TIMEOUT_SECONDS: float = Field(2.0, env="UPSTREAM_QUEUE_TIMEOUT_SECONDS")
+    CIRCUIT_FAILURE_THRESHOLD: int = Field(5, env="CIRCUIT_FAILURE_THRESHOLD")
+    CIRCUIT_RESET_SECONDS: float = Field(30.0, env="CIRCUIT_RESET_SECONDS")
+    CIRCUIT_HALF_OPEN_PROBES: int = Field(1, env="CIRCUIT_HALF_OPEN_PROBES")
+    AI_RATE_LIMIT_PER_MINUTE: float = Field(1000, env="AI_RATE_LIMIT_PER_MINUTE")
+    AI_RATE_LIMIT_BURST: int = Field(50, env="AI_RATE_LIMIT_BURST")
+    AI_MAX_CONCURRENCY: int = Field(64, env="AI_MAX_CONCURRENCY")
+    AI_LATENCY_TARGET_SECONDS: float = Field(15.0, env="AI_LATENCY_TARGET_SECONDS")
+    PIPEFY_RATE_LIMIT_PER_MINUTE: float = Field(1000, env="PIPEFY_RATE_LIMIT_PER_MINUTE")
+    PIPEFY_RATE_LIMIT_BURST: int = Field(50, env="PIPEFY_RATE_LIMIT_BURST")
+    PIPEFY_MAX_CONCURRENCY: int = Field(16, env="PIPEFY_MAX_CONCURRENCY")
+    PIPEFY_LATENCY_TARGET_SECONDS: float = Field(3.0, env="PIPEFY_LATENCY_TARGET_SECONDS")
+    CALENDAR_RATE_LIMIT_PER_MINUTE: float = Field(120, env="CALENDAR_RATE_LIMIT_PER_MINUTE")
+    CALENDAR_RATE_LIMIT_BURST: int = Field(20, env="CALENDAR_RATE_LIMIT_BURST")
+    CALENDAR_MAX_CONCURRENCY: int = Field(16, env="CALENDAR_MAX_CONCURRENCY")
+    CALENDAR_LATENCY_TARGET_SECONDS: float = Field(3.0, env="CALENDAR_LATENCY_TARGET_SECONDS")
     
     CAL_EVENT_TYPE_ID: str = Field("test_event_type_id", env="CAL_EVENT_TYPE_ID")
+    CAL_AVAILABILITY_TTL_SECONDS: float = Field(120.0, env="CAL_AVAILABILITY_TTL_SECONDS")
+    CAL_AVAILABILITY_REFRESH_SECONDS: float = Field(60.0, env="CAL_AVAILABILITY_REFRESH_SECONDS")
+    CAL_BOOKING_MAX_ATTEMPTS: int = Field(4, env="CAL_BOOKING_MAX_ATTEMPTS")
+    CAL_BOOKING_BACKOFF_SECONDS: float = Field(0.5, env="CAL_BOOKING_BACKOFF_SECONDS")
+    CAL_BOOKING_MAX_BACKOFF_SECONDS: float = Field(5.0, env="CAL_BOOKING_MAX_BACKOFF_SECONDS")
+    CAL_BOOKING_CACHE_SIZE: int = Field(10000, env="CAL_BOOKING_CACHE_SIZE")
+    CAL_BOOKING_CACHE_TTL_SECONDS: float = Field(86400.0, env="CAL_BOOKING_CACHE_TTL_SECONDS")
     PIPEFY_PIPE_ID: str = Field("test_pipe_id", env="PIPEFY_PIPE_ID")
 
     class Config:
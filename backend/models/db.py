@@ -1,58 +1,189 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from config import settings
+from utils.metrics import timed_fn
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
+
+_client: AsyncIOMotorClient | None = None
+
 
 def create_motor_client() -> AsyncIOMotorClient:
     if not settings.MONGODB_URI:
         raise ValueError("MONGODB_URI não definida nas configurações.")
-    return AsyncIOMotorClient(settings.MONGODB_URI)
+    return AsyncIOMotorClient(
+        settings.MONGODB_URI,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGODB_SOCKET_TIMEOUT_MS,
+    )
+
+
+def init_motor_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        _client = create_motor_client()
+    return _client
+
+
+def close_motor_client() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
 
 
+def get_database() -> AsyncIOMotorDatabase:
+    return init_motor_client()[settings.MONGODB_DB]
+
+
+@timed_fn("db")
 async def create_session_db(session_id: str, lead_email: str):
-    client = create_motor_client()
-    try:
-        db = client[settings.MONGODB_DB]
-        await db.sessions.insert_one({
-            "session_id": session_id,
-            "lead_email": lead_email,
-            "messages": [],
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        })
-    finally:
-        client.close() 
+    db = get_database()
+    await db.sessions.update_one(
+        {"session_id": session_id},
+        {
+            "$set": {"lead_email": lead_email, "updated_at": datetime.utcnow()},
+            "$setOnInsert": {"created_at": datetime.utcnow(), "message_count": 0}
+        },
+        upsert=True
+    )
 
 
+@timed_fn("db")
 async def update_session_lead_email(session_id: str, email: str):
-    client = create_motor_client()
+    db = get_database()
+    await db.sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"lead_email": email, "updated_at": datetime.utcnow()}}
+    )
+
+# Transcrição em buckets de TRANSCRIPT_BUCKET_SIZE mensagens na coleção session_messages.
+# O contador message_count do documento da sessão reserva os números de sequência, então cada
+# gravação é um $inc + um $push em um bucket de tamanho fixo, sem reescrever o histórico.
+# Sessões antigas guardam a transcrição no array messages do próprio documento: na primeira gravação
+# o contador começa em len(messages) e legacy_count marca as sequências que continuam no array.
+async def seed_message_count(session_id: str) -> None:
+    db = get_database()
+    legacy = await db.sessions.find_one({"session_id": session_id}, {"_id": 0, "messages": 1})
+    count = len((legacy or {}).get("messages") or [])
     try:
-        db = client[settings.MONGODB_DB]
         await db.sessions.update_one(
-            {"session_id": session_id},
-            {"$set": {"lead_email": email, "updated_at": datetime.utcnow()}}
+            {"session_id": session_id, "message_count": {"$exists": False}},
+            {"$set": {"message_count": count, "legacy_count": count}},
+            upsert=True
         )
-    finally:
-        client.close()
+    except DuplicateKeyError:
+        # Outro worker semeou o contador ao mesmo tempo.
+        pass
 
-async def add_message_db(session_id: str, message: dict):
-    client = create_motor_client()
-    try:
-        db = client[settings.MONGODB_DB]
-        await db.sessions.update_one(
-            {"session_id": session_id},
-            {
-                "$push": {"messages": message},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+async def reserve_message_seqs(session_id: str, count: int, now: datetime) -> int:
+    db = get_database()
+    for _ in range(2):
+        doc = await db.sessions.find_one_and_update(
+            {"session_id": session_id, "message_count": {"$exists": True}},
+            {"$inc": {"message_count": count}, "$set": {"updated_at": now}},
+            projection={"_id": 0, "message_count": 1},
+            return_document=ReturnDocument.AFTER
         )
-    finally:
-        client.close()
+        if doc is not None:
+            return doc["message_count"] - count
+        await seed_message_count(session_id)
+    raise RuntimeError(f"Não foi possível reservar sequência de mensagens para {session_id}")
 
-async def get_session_db(session_id: str) -> Dict[str, Any] | None:
-    client = create_motor_client()
-    try:
-        db = client[settings.MONGODB_DB]
-        return await db.sessions.find_one({"session_id": session_id})
-    finally:
-        client.close()
\ No newline at end of file
+
+class TranscriptWriteError(Exception):
+    # pending traz as mensagens ainda não gravadas, já numeradas se a sequência foi reservada.
+    def __init__(self, session_id: str, pending: List[dict], error: Exception):
+        super().__init__(f"{session_id}: {error}")
+        self.session_id = session_id
+        self.pending = pending
+
+
+async def append_session_messages(session_id: str, messages: List[dict], now: datetime):
+    db = get_database()
+    size = settings.TRANSCRIPT_BUCKET_SIZE
+    # Mensagens que voltam de uma falha mantêm a sequência já reservada; só as novas reservam números.
+    numbered = [m for m in messages if "seq" in m]
+    fresh = [m for m in messages if "seq" not in m]
+    if fresh:
+        try:
+            first_seq = await reserve_message_seqs(session_id, len(fresh), now)
+        except Exception as e:
+            raise TranscriptWriteError(session_id, messages, e) from e
+        numbered += [{**message, "seq": seq} for seq, message in enumerate(fresh, start=first_seq)]
+    buckets: Dict[int, List[dict]] = {}
+    for message in numbered:
+        buckets.setdefault(message["seq"] // size, []).append(message)
+    for bucket, items in buckets.items():
+        try:
+            await db.session_messages.update_one(
+                {"session_id": session_id, "bucket": bucket},
+                {
+                    "$push": {"messages": {"$each": items}},
+                    "$inc": {"count": len(items)},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            raise TranscriptWriteError(session_id, [m for m in numbered if m["seq"] // size >= bucket], e) from e
+
+@timed_fn("db")
+async def add_message_db(session_id: str, message: dict):
+    await append_session_messages(session_id, [message], datetime.utcnow())
+
+# Cada sessão é gravada de forma independente; devolve as falhas por sessão para o chamador tentar de novo.
+@timed_fn("db")
+async def add_messages_bulk_db(batches: Dict[str, List[dict]]) -> Dict[str, TranscriptWriteError]:
+    if not batches:
+        return {}
+    now = datetime.utcnow()
+    results = await asyncio.gather(
+        *[append_session_messages(session_id, messages, now) for session_id, messages in batches.items()],
+        return_exceptions=True
+    )
+    failures: Dict[str, TranscriptWriteError] = {}
+    for session_id, result in zip(batches, results):
+        if isinstance(result, TranscriptWriteError):
+            failures[session_id] = result
+        elif isinstance(result, BaseException):
+            failures[session_id] = TranscriptWriteError(session_id, batches[session_id], result)
+    return failures
+
+async def get_session_messages(session_id: str, start: int, end: int) -> List[dict]:
+    if end <= start:
+        return []
+    db = get_database()
+    size = settings.TRANSCRIPT_BUCKET_SIZE
+    cursor = db.session_messages.find(
+        {"session_id": session_id, "bucket": {"$gte": start // size, "$lte": (end - 1) // size}},
+        {"_id": 0, "messages": 1}
+    )
+    messages = [m async for bucket in cursor for m in bucket["messages"] if start <= m["seq"] < end]
+    return sorted(messages, key=lambda m: m["seq"])
+
+@timed_fn("db")
+async def get_session_db(session_id: str, offset: int = 0, limit: int | None = None, tail: bool = False) -> Dict[str, Any] | None:
+    db = get_database()
+    doc = await db.sessions.find_one({"session_id": session_id})
+    if doc is None:
+        return None
+    # Sequências abaixo de legacy_count estão no array messages de sessões gravadas antes dos buckets.
+    legacy = doc.pop("messages", None) or []
+    if "message_count" in doc:
+        total, legacy_count = doc["message_count"], doc.pop("legacy_count", 0)
+    else:
+        total = legacy_count = len(legacy)
+    start = max(0, total - limit) if tail and limit is not None else offset
+    end = total if limit is None else min(total, start + limit)
+    head = [{**m, "seq": seq} for seq, m in enumerate(legacy[start:min(end, legacy_count)], start=start)]
+    doc["message_count"] = total
+    doc["messages"] = head + await get_session_messages(session_id, max(start, legacy_count), end)
+    return doc
\ No newline at end of file
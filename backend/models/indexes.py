@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from config import settings
+from models.db import get_database
+
+# Opções que fazem parte da definição do índice; o resto de index_information() (v, ns...) é ignorado.
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+@dataclass(slots=True)
+class IndexSpec:
+    collection: str
+    name: str
+    keys: List[Tuple[str, int]]
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+def session_retention_seconds() -> int:
+    # Mesmo prazo do antigo TTL em expires_at: a sessão expira SESSION_TIMEOUT após a última atividade e fica retida mais SESSION_RETENTION_SECONDS.
+    return settings.SESSION_TIMEOUT * 60 + settings.SESSION_RETENTION_SECONDS
+
+
+def index_specs() -> List[IndexSpec]:
+    retention = session_retention_seconds()
+    return [
+        IndexSpec("sessions", "session_id_unique", [("session_id", ASCENDING)], {"unique": True}),
+        IndexSpec("sessions", "lead_email", [("lead_email", ASCENDING)]),
+        IndexSpec("sessions", "updated_at_ttl", [("updated_at", ASCENDING)], {"expireAfterSeconds": retention}),
+        IndexSpec("session_messages", "session_bucket", [("session_id", ASCENDING), ("bucket", ASCENDING)], {"unique": True}),
+        IndexSpec("session_messages", "updated_at_ttl", [("updated_at", ASCENDING)], {"expireAfterSeconds": retention}),
+    ]
+
+
+# Índices criados por versões anteriores e substituídos pelos acima.
+DEPRECATED_INDEXES: Dict[str, List[str]] = {
+    "sessions": ["expires_at_ttl"],
+}
+
+
+def _shape(keys: List[Tuple[str, int]], options: Dict[str, Any]) -> Tuple[Any, ...]:
+    # O prazo do TTL fica de fora: mudá-lo não exige recriar o índice.
+    return (
+        [tuple(k) for k in keys],
+        {k: options[k] for k in INDEX_OPTIONS if k != "expireAfterSeconds" and options.get(k) not in (None, False)},
+        "expireAfterSeconds" in options,
+    )
+
+
+def plan_index_changes(collection: str, existing: Dict[str, Dict[str, Any]], specs: List[IndexSpec]) -> List[Tuple[str, Any]]:
+    actions: List[Tuple[str, Any]] = []
+    wanted = {spec.name: spec for spec in specs}
+    wanted_keys = [[tuple(k) for k in spec.keys] for spec in specs]
+    rebuild = set()
+    for name, info in existing.items():
+        if name == "_id_":
+            continue
+        spec = wanted.get(name)
+        if name in DEPRECATED_INDEXES.get(collection, []):
+            actions.append(("drop", name))
+        elif spec is None:
+            # Mesmas chaves com outro nome impedem a criação do índice esperado.
+            if [tuple(k) for k in info["key"]] in wanted_keys:
+                actions.append(("drop", name))
+        elif _shape(info["key"], info) != _shape(spec.keys, spec.options):
+            actions.append(("drop", name))
+            rebuild.add(name)
+        elif info.get("expireAfterSeconds") != spec.options.get("expireAfterSeconds"):
+            actions.append(("ttl", spec))
+    for spec in specs:
+        if spec.name not in existing or spec.name in rebuild:
+            actions.append(("create", spec))
+    return actions
+
+
+async def bootstrap_indexes() -> Dict[str, List[str]]:
+    db = get_database()
+    report: Dict[str, List[str]] = {"created": [], "dropped": [], "ttl_updated": []}
+    specs_by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in index_specs():
+        specs_by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection, specs in specs_by_collection.items():
+        existing = await db[collection].index_information()
+        for action, target in plan_index_changes(collection, existing, specs):
+            if action == "drop":
+                print(f"Índice divergente removido: {collection}.{target}")
+                await db[collection].drop_index(target)
+                report["dropped"].append(f"{collection}.{target}")
+            elif action == "ttl":
+                # collMod altera o prazo do TTL sem reconstruir o índice.
+                await db.command({"collMod": collection, "index": {"name": target.name, "expireAfterSeconds": target.options["expireAfterSeconds"]}})
+                report["ttl_updated"].append(f"{collection}.{target.name}")
+            else:
+                try:
+                    await db[collection].create_index(target.keys, name=target.name, **target.options)
+                    report["created"].append(f"{collection}.{target.name}")
+                except OperationFailure as e:
+                    # Ex.: session_id duplicado impede o índice único; a aplicação sobe mesmo assim.
+                    print(f"Erro ao criar índice {collection}.{target.name}: {e}")
+    return report
\ No newline at end of file
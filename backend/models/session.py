@@ -0,0 +1,43 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List
+from models.lead import Lead
+
+
+class Role(str, Enum):
+    USER = "user"
+    ASSISTANT = "assistant"
+    SYSTEM = "system"
+
+
+@dataclass(slots=True)
+class Message:
+    role: Role
+    content: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role.value, "content": self.content}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        return cls(Role(data["role"]), data.get("content") or "")
+
+
+@dataclass(slots=True)
+class Session:
+    created_at: datetime
+    expires_at: datetime
+    stage: str = "initial"
+    lead: Lead = field(default_factory=Lead)
+    messages: List[Message] = field(default_factory=list)
+    pipefy_card_id: str | None = None
+    # Mensagens já fora da janela de contexto guardada na sessão (a transcrição completa fica em session_messages).
+    omitted_messages: int = 0
+    omitted_actions: List[str] = field(default_factory=list)
+    # Versão do documento no MongoDB lida por este processo; save() só grava sobre ela.
+    version: int = 0
+    # Tarefas em segundo plano disparadas por mudança de etapa; não são persistidas.
+    prefetch: Dict[str, Any] = field(default_factory=dict, metadata={"transient": True})
+    # False enquanto a sessão só existe em memória (nenhuma mensagem do usuário ainda).
+    persisted: bool = field(default=True, metadata={"transient": True})
@@ -1,12 +1,24 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Any, List, Dict
-from utils.session_manager import create_session, get_session, add_message, end_session, update_lead_info
-from services import ai_service, pipefy_service, calendar_service
+from utils.session_manager import create_session, get_session, add_message, end_session, update_lead_info, set_pipefy_card_id, persist_session
+from services import ai_service, pipefy_service
+from services.tool_executor import execute_tool_calls
+from services.greeting_pool import greeting_pool
 from google.genai import types
-from models.db import add_message_db, create_session_db, update_session_lead_email
+from models.db import create_session_db, update_session_lead_email
+from models.session import Message, Role, Session
+from utils.context_window import build_context
+from utils import lead_extractor
+from utils.response_cache import response_cache
+from utils.transcript_writer import transcript_writer
+from utils.session_counts import session_counter
+from utils.session_store import SessionConflictError, lazy_persistence_enabled
 import json
+from functools import lru_cache
+from config import settings
 
 router = APIRouter()
 
@@ -14,23 +26,30 @@ class StartResponse(BaseModel):
     session_id: str
     messages: str
 
+GREETING_PRODUCT = "Sistema de CRM e gestão comercial"
+
+def greeting_prompt() -> str:
+    return ai_service.system_prompt_for_agent(GREETING_PRODUCT)
+
 @router.post("/start-session", response_model=StartResponse)
 async def start_session():
     try:
-        sid = create_session()
-        await create_session_db(session_id=sid, lead_email="")
+        lazy = lazy_persistence_enabled()
+        sid = await create_session(persist=not lazy)
+        if not lazy:
+            await create_session_db(session_id=sid, lead_email="")
         
-        init_prompt = ai_service.system_prompt_for_agent("Sistema de CRM e gestão comercial")
-        
-        ai_response = await ai_service.chat_with_ai(
-            messages=[{"role": "system", "content": init_prompt}],
-            system_instructions=init_prompt
-        )
-        await add_message_db(sid, {"role": "assistant", "content": ai_response.get("reply", '')})
+        greeting = Message(Role.ASSISTANT, await greeting_pool.get(greeting_prompt()))
+        await add_message(sid, greeting)
+        if lazy:
+            if settings.SESSION_COUNT_ABANDONED:
+                session_counter.record("started")
+        else:
+            await transcript_writer.enqueue(sid, greeting)
         
         return {
             "session_id": sid,
-            "messages": ai_response.get("reply", "")
+            "messages": greeting.content
         }
     except Exception as e:
         print(f"Error in /start-session endpoint: {e}")
@@ -46,11 +65,12 @@ class AssistantOut(BaseModel):
     
 PRODUCT_DESCRIPTION = "Nossa solução é um software de gestão de equipes de alta performance que integra comunicação, tarefas e análise de produtividade em uma única plataforma."
 
-def build_message(history: List[Dict[str, Any]]):
+def build_message(session: Session):
     system_instructions = ai_service.system_prompt_for_agent(PRODUCT_DESCRIPTION)
     
-    return history, system_instructions
+    return build_context(session), system_instructions
 
+@lru_cache(maxsize=None)
 def get_gemini_functions_schema() -> List[Dict[str, Any]]:
     return [
         {
@@ -83,143 +103,297 @@ def get_gemini_functions_schema() -> List[Dict[str, Any]]:
         },
     ]
     
-@router.post("/message", response_model=AssistantOut)
-async def message_endpoint(payload: UserMessageIn):
-    try:
-        session = get_session(payload.session_id)
-        if not session:
-            return JSONResponse(status_code=404, content={"detail": "Session not found or expired."})
+async def warm_up_model_configs():
+    system_instructions = ai_service.system_prompt_for_agent(PRODUCT_DESCRIPTION)
+    await ai_service.CONFIG_REGISTRY.warm_up(
+        ai_service.CLIENT.aio, settings.AI_MODEL, system_instructions, get_gemini_functions_schema()
+    )
 
-        add_message(payload.session_id, {"role": "user", "content": payload.message})
-        await add_message_db(payload.session_id, {"role": "user", "content": payload.message})
-        
-        messages, system_instructions = build_message(session['messages'])
+FUNCTION_CALLING_STAGES = {"confirm_interest", "completed"}
+
+def plan_turn(session: Session) -> List[Dict[str, Any]] | None:
+    if session.stage in FUNCTION_CALLING_STAGES:
+        return get_gemini_functions_schema()
+    return None
+
+async def apply_lead_info(session_id: str, info: dict):
+    await update_lead_info(session_id, info)
+    if info.get("email"):
+        await update_session_lead_email(session_id, info["email"])
+
+def last_user_message(session: Session) -> str | None:
+    if session.messages and session.messages[-1].role == Role.USER:
+        return session.messages[-1].content
+    return None
 
-        functions = None
+# Caminho rápido: respostas curtas e previsíveis (e-mail, empresa, prazo...) são extraídas localmente e,
+# quando a próxima pergunta já está determinada, respondidas por template sem chamar o modelo.
+async def local_turn(session_id: str, session: Session) -> str | None:
+    text = last_user_message(session)
+    if not settings.LOCAL_EXTRACTION_ENABLED or text is None:
+        return None
+    stage = session.stage
+    extraction = lead_extractor.extract(stage, text)
+    # Extrações parciais (a mensagem tinha mais coisa, ex.: uma pergunta) ficam com o modelo.
+    if extraction is None or not extraction.complete:
+        return None
+    await apply_lead_info(session_id, extraction.info)
+    if not settings.LOCAL_TEMPLATE_REPLIES:
+        return None
+    updated = await get_session(session_id)
+    if updated is None or updated.stage == stage:
+        return None
+    return lead_extractor.template_reply(stage, updated.lead)
 
-        if session['stage'] == "completed":
-            functions = get_gemini_functions_schema()
+async def run_turn(session_id: str, session: Session):
+    local_reply = await local_turn(session_id, session)
+    if local_reply:
+        return local_reply, []
 
+    messages, system_instructions = build_message(session)
+    functions = plan_turn(session)
+
+    if functions is None:
+        cache_key = response_cache.key(session, last_user_message(session) or "")
+        cached_reply = response_cache.get(cache_key)
+        if cached_reply is not None:
+            return cached_reply, []
         gemini_resp = await ai_service.chat_with_ai(
             messages=messages,
             system_instructions=system_instructions,
-            functions=functions
+            functions=None
         )
-        await add_message_db(payload.session_id, {"role": "assistant", "content": gemini_resp.get("reply", '')})
-        
-        if "info" in gemini_resp:
-            update_lead_info(payload.session_id, gemini_resp["info"])
-            if "email" in gemini_resp["info"]:
-                await update_session_lead_email(payload.session_id, gemini_resp["info"]["email"])
-
-        if session['stage'] == "completed" and functions is None:
-            gemini_resp = None
-            functions = get_gemini_functions_schema()
-            gemini_resp = await ai_service.chat_with_ai(
-                messages=messages,
-                system_instructions=system_instructions,
-                functions=functions
-            )
-            await add_message_db(payload.session_id, {"role": "assistant", "content": gemini_resp.get("reply", '')})
-
-        text_content, actions = "", []
-        if functions != None:
-            text_content, actions = await process_ai_response(payload.session_id, gemini_resp)
-
-        if session['stage'] != "completed" and not text_content:
-            text_content = gemini_resp.get("reply", '')
-
-
-        if actions:
-            for action in actions:
-                add_message(payload.session_id, {"role": "assistant", "content": f"Action: {action['action']}, Result: {action['result']}"})
-                await add_message_db(payload.session_id, {"role": "assistant", "content": f"Action: {action['action']}, Result: {action['result']}"})
-            
-            messages, system_instructions = build_message(session['messages'])
-            gemini_resp = await ai_service.chat_with_ai(
-                messages=messages,
-                system_instructions=system_instructions,
-                functions=None
-            )
-            final_reply = gemini_resp.get("reply", '')
-            if final_reply:
-                add_message(payload.session_id, {"role": "assistant", "content": final_reply})
-                await add_message_db(payload.session_id, {"role": "assistant", "content": gemini_resp.get("reply", '')})
-                text_content += final_reply
-            return {"reply": text_content, "actions": actions}
-            
+        response_cache.put(cache_key, session, gemini_resp.get("reply", ""), gemini_resp.get("info"))
+        if gemini_resp.get("info"):
+            await apply_lead_info(session_id, gemini_resp["info"])
+        return gemini_resp.get("reply", ""), []
+
+    actions = []
+    tool_turns: List[types.Content] = []
+    for _ in range(settings.AI_MAX_TOOL_ROUNDS):
+        gemini_resp = await ai_service.chat_with_ai(
+            messages=messages,
+            system_instructions=system_instructions,
+            functions=functions,
+            extra_contents=tool_turns
+        )
+        text_content, round_actions, tool_parts = await process_ai_response(session_id, gemini_resp)
+        actions.extend(round_actions)
+        if not tool_parts:
+            return text_content, actions
+        tool_turns = tool_turns + [
+            types.Content(role="model", parts=gemini_resp.candidates[0].content.parts),
+            types.Content(role="user", parts=tool_parts),
+        ]
+
+    # Esgotadas as rodadas, a última chamada não pode pedir outra ferramenta; senão a resposta sairia vazia.
+    gemini_resp = await ai_service.chat_with_ai(
+        messages=messages,
+        system_instructions=system_instructions,
+        functions=functions,
+        extra_contents=tool_turns,
+        tool_calls=False
+    )
+    return response_text(gemini_resp), actions
+
+ACTION_EVENTS = {
+    "create_or_update_card_pipefy": "lead_saved",
+    "get_available_slots_next_7_days": "slots_offered",
+    "schedule_meeting": "meeting_scheduled",
+}
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def stream_turn(session_id: str, session: Session, outcome: Dict[str, Any]):
+    local_reply = await local_turn(session_id, session)
+    if local_reply:
+        outcome["reply"] = local_reply
+        yield sse_event("token", {"text": local_reply})
+        return
+
+    messages, system_instructions = build_message(session)
+    functions = plan_turn(session)
+
+    if functions is None:
+        cache_key = response_cache.key(session, last_user_message(session) or "")
+        cached_reply = response_cache.get(cache_key)
+        if cached_reply is not None:
+            outcome["reply"] = cached_reply
+            yield sse_event("token", {"text": cached_reply})
+            return
+        parser = ai_service.ReplyStreamParser()
+        async for chunk in ai_service.stream_chat_with_ai(
+            messages=messages,
+            system_instructions=system_instructions,
+            functions=None
+        ):
+            delta = parser.feed(chunk.text or "")
+            if delta:
+                yield sse_event("token", {"text": delta})
+        gemini_resp = parser.result()
+        outcome["reply"] = gemini_resp.get("reply", "")
+        if outcome["reply"] and not parser.emitted:
+            yield sse_event("token", {"text": outcome["reply"]})
+        response_cache.put(cache_key, session, outcome["reply"], gemini_resp.get("info"))
+        if gemini_resp.get("info"):
+            await apply_lead_info(session_id, gemini_resp["info"])
+        return
+
+    tool_turns: List[types.Content] = []
+    for round_number in range(settings.AI_MAX_TOOL_ROUNDS + 1):
+        model_parts: List[types.Part] = []
+        async for chunk in ai_service.stream_chat_with_ai(
+            messages=messages,
+            system_instructions=system_instructions,
+            functions=functions,
+            extra_contents=tool_turns,
+            tool_calls=round_number < settings.AI_MAX_TOOL_ROUNDS
+        ):
+            if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+                continue
+            for part in chunk.candidates[0].content.parts:
+                if part.text:
+                    outcome["reply"] += part.text
+                    yield sse_event("token", {"text": part.text})
+                model_parts.append(part)
+
+        if round_number == settings.AI_MAX_TOOL_ROUNDS or not any(p.function_call for p in model_parts):
+            return
+
+        model_content = types.Content(role="model", parts=model_parts)
+        gemini_resp = types.GenerateContentResponse(candidates=[types.Candidate(content=model_content)])
+        _, round_actions, tool_parts = await process_ai_response(session_id, gemini_resp)
+        for action in round_actions:
+            outcome["actions"].append(action)
+            yield sse_event(ACTION_EVENTS.get(action["action"], "action"), action["result"])
+        tool_turns = tool_turns + [model_content, types.Content(role="user", parts=tool_parts)]
+
+async def record_turn(session_id: str, text_content: str, actions: List[dict]):
+    for action in actions:
+        action_message = Message(Role.ASSISTANT, f"Action: {action['action']}, Result: {action['result']}")
+        await add_message(session_id, action_message)
+        await transcript_writer.enqueue(session_id, action_message)
+
+    if text_content:
+        reply_message = Message(Role.ASSISTANT, text_content)
+        await add_message(session_id, reply_message)
+        await transcript_writer.enqueue(session_id, reply_message)
+
+# Com persistência preguiçosa, o documento da sessão só nasce na primeira mensagem do usuário,
+# levando junto a saudação que estava só em memória.
+async def materialize_session(session_id: str) -> None:
+    session = await persist_session(session_id)
+    if session is None:
+        return
+    await create_session_db(session_id=session_id, lead_email=session.lead.email or "")
+    for buffered in session.messages:
+        await transcript_writer.enqueue(session_id, buffered)
+    if settings.SESSION_COUNT_ABANDONED:
+        session_counter.record("engaged")
+
+@router.post("/message", response_model=AssistantOut)
+async def message_endpoint(payload: UserMessageIn):
+    try:
+        session = await get_session(payload.session_id)
+        if not session:
+            return JSONResponse(status_code=404, content={"detail": "Session not found or expired."})
+
+        await materialize_session(payload.session_id)
+        user_message = Message(Role.USER, payload.message)
+        await add_message(payload.session_id, user_message)
+        await transcript_writer.enqueue(payload.session_id, user_message)
+
+        text_content, actions = await run_turn(payload.session_id, session)
+        await record_turn(payload.session_id, text_content, actions)
+
         return {"reply": text_content, "actions": actions}
+    except SessionConflictError as e:
+        print(f"Conflito de gravação em /message: {e}")
+        raise HTTPException(status_code=409, detail="Session was updated by another request, please retry.")
     except Exception as e:
         print(f"Error in /message endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    
-async def process_ai_response(session_id: str, gemini_resp: dict):
-    actions = []
-    text_content = ""
-    
+
+@router.post("/message/stream")
+async def message_stream_endpoint(payload: UserMessageIn):
+    session = await get_session(payload.session_id)
+    if not session:
+        return JSONResponse(status_code=404, content={"detail": "Session not found or expired."})
+
+    user_message = Message(Role.USER, payload.message)
+    try:
+        await materialize_session(payload.session_id)
+        await add_message(payload.session_id, user_message)
+    except SessionConflictError as e:
+        print(f"Conflito de gravação em /message/stream: {e}")
+        return JSONResponse(status_code=409, content={"detail": "Session was updated by another request, please retry."})
+    outcome: Dict[str, Any] = {"reply": "", "actions": []}
+
+    async def events():
+        try:
+            async for event in stream_turn(payload.session_id, session, outcome):
+                yield event
+            yield sse_event("done", outcome)
+        except Exception as e:
+            print(f"Error in /message/stream endpoint: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    async def persist():
+        await transcript_writer.enqueue(payload.session_id, user_message)
+        await record_turn(payload.session_id, outcome["reply"], outcome["actions"])
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist),
+    )
+
+def response_text(gemini_resp) -> str:
     if isinstance(gemini_resp, dict):
-        return gemini_resp.get("reply", ""), []
+        return gemini_resp.get("reply", "")
+    if not getattr(gemini_resp, "candidates", None):
+        return ""
+    content = gemini_resp.candidates[0].content
+    if not content or not content.parts:
+        return ""
+    return "".join(part.text for part in content.parts if part.text)
 
-    if not hasattr(gemini_resp, "candidates") or not gemini_resp.candidates:
-        return gemini_resp.get("reply", ""), []
+async def process_ai_response(session_id: str, gemini_resp):
+    actions = []
+    tool_parts = []
+    text_content = response_text(gemini_resp)
+
+    if isinstance(gemini_resp, dict) or not getattr(gemini_resp, "candidates", None):
+        return text_content, actions, tool_parts
 
     first_candidate = gemini_resp.candidates[0]
 
-    if (
-        not hasattr(first_candidate, "content") 
-        or not hasattr(first_candidate.content, "parts") 
-        or not first_candidate.content.parts
-    ):
-        return gemini_resp.get("reply", ""), []
+    if not first_candidate.content or not first_candidate.content.parts:
+        return text_content, actions, tool_parts
 
-    
+    calls = [
+        (part.function_call.name, dict(part.function_call.args or {}))
+        for part in first_candidate.content.parts
+        if part.function_call
+    ]
+    for fname, fargs in calls:
+        if fname == 'create_or_update_card_pipefy' and fargs.get('lead'):
+            await apply_lead_info(session_id, fargs['lead'])
 
-    first_candidate = gemini_resp.candidates[0]
-    content_len = len(first_candidate.content.parts)
-    for i in range(content_len):
-        
-        parts = first_candidate.content.parts[i]
-
-        function_calls = parts.function_call
-        text_content = parts.text or ""
-
-        if function_calls:
-
-           
-            fname = function_calls.name
-            fargs = dict(function_calls.args)
-            function_result = None
-
-            if fname == 'create_or_update_card_pipefy':
-                lead_data = fargs['lead']
-                result = await pipefy_service.create_or_update_card_pipefy(client=None, lead=lead_data)
-                function_result = {"status": "sucesso", "card_id": result.get('card', {}).get('id', 'N/A')}
-                actions.append({"action": fname, "result": result})
-
-            elif fname == 'get_available_slots_next_7_days':
-                slots = await calendar_service.get_available_slots_next_7_days()
-                offered = slots[:3]
-                function_result = {"available_slots": offered}
-                actions.append({"action": fname, "result": offered})
-
-            elif fname == 'schedule_meeting':
-                slot = fargs.get('slot', {})
-                lead = fargs.get('lead', {})
-                result = await calendar_service.schedule_meeting(slot, lead)
-                
-                if result['data']['meetingUrl'] is None:
-                    function_result = {"status": "falha", "meeting_link": None, "datetime": None}
-                    actions.append({"action": fname, "result": function_result})
-                    continue
-                
-                meeting_link = result['data']['meetingUrl']
-                meeting_datetime = slot.get('time')
-
-                lead['meeting_link'] = meeting_link
-                lead['meeting_datetime'] = meeting_datetime
-                await pipefy_service.create_or_update_card_pipefy(client=None, lead=lead)
-            
-                function_result = {"status": "sucesso", "meeting_link": meeting_link, "datetime": meeting_datetime}
-                actions.append({"action": fname, "result": function_result})
-
-    return text_content, actions
\ No newline at end of file
+    # O card_id vive na sessão para que qualquer worker pule a busca por e-mail no Pipefy.
+    session = await get_session(session_id)
+    if session and session.pipefy_card_id:
+        pipefy_service.remember_card_id(session.lead.email, session.pipefy_card_id)
+
+    results = await execute_tool_calls(calls, session.prefetch if session else None, session_id)
+
+    if session and session.lead.email:
+        await set_pipefy_card_id(session_id, pipefy_service.cached_card_id(session.lead.email))
+    for (fname, _), (function_result, action) in zip(calls, results):
+        if action:
+            actions.append(action)
+        tool_parts.append(types.Part.from_function_response(name=fname, response=function_result))
+
+    return text_content, actions, tool_parts
\ No newline at end of file
@@ -1,10 +1,17 @@
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any, Union
+import time
+from typing import AsyncIterator, List, Dict, Any, Union
 from google import genai
 from google.genai import types
 from config import settings
+from models.session import Message, Role
+from services.resilience import get_upstream
+from utils.metrics import timed
 import re
 import json
+from functools import lru_cache
 
 CLIENT = genai.Client(api_key=settings.AI_API_KEY)
 
@@ -31,48 +38,137 @@ RESPONSE_SCHEMA = types.Schema(
     required=["reply"]
 )
 
-async def chat_with_ai(messages: List[Dict[str, Any]], system_instructions: str, functions: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
-    aclient = CLIENT.aio
-    
-    contents = []
-    
-    for msg in messages:
-        role = msg.get("role")
-        text_content = msg.get("content")
-        
-        if role and text_content:
-            gemini_role = "model" if role == "assistant" else "user"
-            contents.append(types.Content(role=gemini_role, parts=[{"text": text_content}]))
-    
+def to_content(message: Message) -> types.Content:
+    gemini_role = "model" if message.role is Role.ASSISTANT else "user"
+    return types.Content(role=gemini_role, parts=[types.Part(text=message.content)])
+
+
+def build_contents(messages: List[Message], extra_contents: List[types.Content] | None = None) -> List[types.Content]:
+    contents = [to_content(msg) for msg in messages if msg.content]
+    contents.extend(extra_contents or [])
+    return contents
+
+
+def build_tools(functions: List[Dict[str, Any]] | None) -> List[types.Tool]:
     tools = []
-    if functions:
-        for f in functions:
-            func_decl = types.FunctionDeclaration(
-                name=f["name"],
-                description=f.get("description", ""),
-                parameters=types.Schema(
-                    **f.get("parameters", {"type": "object", "properties": {}, "required": []})
-                )
+    for f in functions or []:
+        func_decl = types.FunctionDeclaration(
+            name=f["name"],
+            description=f.get("description", ""),
+            parameters=types.Schema(
+                **f.get("parameters", {"type": "object", "properties": {}, "required": []})
             )
-            tools.append(types.Tool(function_declarations=[func_decl]))
-
-    generation_config = types.GenerateContentConfig(
-        temperature=0.5,
-        tools=tools if tools else None,
-        system_instruction=system_instructions,
-        **(
-            {} if tools else {
-                "response_mime_type": "application/json",
-                "response_schema": RESPONSE_SCHEMA
-            }
         )
-    )
+        tools.append(types.Tool(function_declarations=[func_decl]))
+    return tools
+
+
+class GenerationConfigRegistry:
+    def __init__(self, cache_enabled: bool, cache_ttl_seconds: int):
+        self.cache_enabled = cache_enabled
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._configs: Dict[tuple, types.GenerateContentConfig] = {}
+        self._cached_configs: Dict[tuple, tuple[types.GenerateContentConfig, float]] = {}
+        self._cache_retry_at: Dict[tuple, float] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def key(model: str, system_instructions: str, functions: List[Dict[str, Any]] | None, tool_calls: bool = True) -> tuple:
+        return (model, hashlib.sha256(system_instructions.encode()).hexdigest(), tuple(f["name"] for f in functions or []), tool_calls)
+
+    def get(self, model: str, system_instructions: str, functions: List[Dict[str, Any]] | None, tool_calls: bool = True) -> types.GenerateContentConfig:
+        key = self.key(model, system_instructions, functions, tool_calls)
+        config = self._configs.get(key)
+        if config is None:
+            tools = build_tools(functions)
+            config = types.GenerateContentConfig(
+                temperature=0.5,
+                tools=tools if tools else None,
+                system_instruction=system_instructions,
+                **(
+                    {} if tools else {
+                        "response_mime_type": "application/json",
+                        "response_schema": RESPONSE_SCHEMA
+                    }
+                ),
+                # As declarações continuam presentes para o histórico com chamadas de função, mas o modelo só pode responder em texto.
+                **(
+                    {"tool_config": types.ToolConfig(function_calling_config=types.FunctionCallingConfig(mode=types.FunctionCallingConfigMode.NONE))}
+                    if tools and not tool_calls else {}
+                )
+            )
+            self._configs[key] = config
+        return config
+
+    async def resolve(self, aclient, model: str, system_instructions: str, functions: List[Dict[str, Any]] | None, tool_calls: bool = True) -> types.GenerateContentConfig:
+        config = self.get(model, system_instructions, functions, tool_calls)
+        # O cache de contexto não aceita tool_config na requisição; a chamada final após as ferramentas usa o prompt completo.
+        if not self.cache_enabled or config.tool_config is not None:
+            return config
+
+        key = self.key(model, system_instructions, functions)
+        now = time.monotonic()
+        cached = self._cached_configs.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        if self._cache_retry_at.get(key, 0) > now:
+            return config
+
+        async with self._lock:
+            cached = self._cached_configs.get(key)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+            try:
+                cache = await aclient.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=config.system_instruction,
+                        tools=config.tools,
+                        ttl=f"{self.cache_ttl_seconds}s",
+                        display_name="sdr-agent-static-prompt",
+                    )
+                )
+            except Exception as e:
+                print(f"Cache de contexto do Gemini indisponível, usando prompt completo: {e}")
+                self._cache_retry_at[key] = time.monotonic() + self.cache_ttl_seconds
+                return config
+
+            cached_config = config.model_copy(update={
+                "system_instruction": None,
+                "tools": None,
+                "cached_content": cache.name,
+            })
+            # Renova um pouco antes do TTL para não enviar requisições com um cache já expirado.
+            self._cached_configs[key] = (cached_config, time.monotonic() + self.cache_ttl_seconds * 0.9)
+            return cached_config
+
+    async def warm_up(self, aclient, model: str, system_instructions: str, functions: List[Dict[str, Any]]) -> None:
+        for variant in (None, functions):
+            await self.resolve(aclient, model, system_instructions, variant)
+
+
+GEMINI = get_upstream("gemini")
+
+CONFIG_REGISTRY = GenerationConfigRegistry(
+    cache_enabled=settings.AI_CONTEXT_CACHE_ENABLED,
+    cache_ttl_seconds=settings.AI_CONTEXT_CACHE_TTL_SECONDS,
+)
+
+
+async def chat_with_ai(messages: List[Message], system_instructions: str, functions: List[Dict[str, Any]] | None = None, extra_contents: List[types.Content] | None = None, tool_calls: bool = True) -> Dict[str, Any]:
+    aclient = CLIENT.aio
     
-    response = await aclient.models.generate_content(
-        model=settings.AI_MODEL,
-        contents=contents,
-        config=generation_config
-    )
+    contents = build_contents(messages, extra_contents)
+
+    generation_config = await CONFIG_REGISTRY.resolve(aclient, settings.AI_MODEL, system_instructions, functions, tool_calls)
+    
+    with timed("model", "chat_with_ai"):
+        async with GEMINI.guard():
+            response = await aclient.models.generate_content(
+                model=settings.AI_MODEL,
+                contents=contents,
+                config=generation_config
+            )
     
     
     try:
@@ -91,6 +187,89 @@ async def chat_with_ai(messages: List[Dict[str, Any]], system_instructions: str,
         print(f"ERRO CRÍTICO DE JSON DECODE (JSON MODE): {e}")
         return {"reply": response.text or "Erro ao processar resposta do modelo."}
 
+async def stream_chat_with_ai(messages: List[Message], system_instructions: str, functions: List[Dict[str, Any]] | None = None, extra_contents: List[types.Content] | None = None, tool_calls: bool = True) -> AsyncIterator[types.GenerateContentResponse]:
+    aclient = CLIENT.aio
+    contents = build_contents(messages, extra_contents)
+    generation_config = await CONFIG_REGISTRY.resolve(aclient, settings.AI_MODEL, system_instructions, functions, tool_calls)
+
+    with timed("model", "stream_chat_with_ai"):
+        async with GEMINI.guard():
+            stream = await aclient.models.generate_content_stream(
+                model=settings.AI_MODEL,
+                contents=contents,
+                config=generation_config
+            )
+            async for chunk in stream:
+                yield chunk
+
+
+# Extrai incrementalmente o valor de "reply" do JSON gerado em modo JSON, para enviar tokens ao usuário.
+class ReplyStreamParser:
+    KEY_RE = re.compile(r'"reply"\s*:\s*"')
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.raw = ""
+        self.emitted = ""
+        self._pos = 0
+        self._state = "search"
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        out = []
+        if self._state == "search":
+            match = self.KEY_RE.search(self.raw)
+            if not match:
+                return ""
+            self._pos = match.end()
+            self._state = "value"
+
+        while self._state == "value" and self._pos < len(self.raw):
+            char = self.raw[self._pos]
+            if char == '"':
+                self._state = "done"
+                self._pos += 1
+            elif char == "\\":
+                decoded, size = self._decode_escape(self._pos)
+                if decoded is None:
+                    break
+                out.append(decoded)
+                self._pos += size
+            else:
+                out.append(char)
+                self._pos += 1
+
+        delta = "".join(out)
+        self.emitted += delta
+        return delta
+
+    def _decode_escape(self, pos: int) -> tuple[str | None, int]:
+        if pos + 1 >= len(self.raw):
+            return None, 0
+        kind = self.raw[pos + 1]
+        if kind != "u":
+            return self.ESCAPES.get(kind, kind), 2
+        size = 6
+        if pos + size > len(self.raw):
+            return None, 0
+        if 0xD800 <= int(self.raw[pos + 2:pos + 6], 16) <= 0xDBFF:
+            size = 12
+            if pos + size > len(self.raw):
+                return None, 0
+        return json.loads(f'"{self.raw[pos:pos + size]}"'), size
+
+    def result(self) -> Dict[str, Any]:
+        try:
+            parsed = json.loads(self.raw.strip())
+        except json.JSONDecodeError as e:
+            print(f"ERRO CRÍTICO DE JSON DECODE (JSON MODE): {e}")
+            return {"reply": self.emitted or self.raw or "Erro ao processar resposta do modelo."}
+        if isinstance(parsed, dict) and "reply" in parsed:
+            return parsed
+        return {"reply": self.raw.strip()}
+
+
+@lru_cache(maxsize=None)
 def system_prompt_for_agent(product_desc: str) -> str:
     return (
         "Você é um assistente de pré-vendas virtual chamado **Assistente Virtual Selly-IA** e sempre deve se apresentar ao iniciar a conversa e conduzir o usuário durante todo o processo de vendas de sistemas.\n"
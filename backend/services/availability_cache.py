@@ -0,0 +1,135 @@
+import asyncio
+import bisect
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+
+def parse_slot_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+class SlotIndex:
+    def __init__(self, slots: List[dict] | None = None):
+        self._keys: List[datetime] = []
+        self._slots: List[dict] = []
+        self.fetched_at = 0.0
+        if slots:
+            self.replace(slots)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def replace(self, slots: List[dict], booked: set | None = None) -> None:
+        entries: List[Tuple[datetime, dict]] = []
+        for slot in slots:
+            try:
+                start = parse_slot_time(slot["time"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if booked and start in booked:
+                continue
+            entries.append((start, slot))
+        entries.sort(key=lambda e: e[0])
+        self._keys = [e[0] for e in entries]
+        self._slots = [e[1] for e in entries]
+        self.fetched_at = time.monotonic()
+
+    def upcoming(self, after: datetime) -> List[dict]:
+        return self._slots[bisect.bisect_right(self._keys, after):]
+
+    def remove(self, start: datetime) -> bool:
+        i = bisect.bisect_left(self._keys, start)
+        if i < len(self._keys) and self._keys[i] == start:
+            del self._keys[i]
+            del self._slots[i]
+            return True
+        return False
+
+
+class AvailabilityCache:
+    def __init__(self, fetcher: Callable[[str], Awaitable[List[dict]]], ttl_seconds: float, refresh_seconds: float):
+        self.fetcher = fetcher
+        self.ttl = ttl_seconds
+        self.refresh_interval = refresh_seconds
+        self._indexes: Dict[str, SlotIndex] = {}
+        self._booked: Dict[str, set] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._task: asyncio.Task | None = None
+        self.metrics = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def clear(self) -> None:
+        self._indexes.clear()
+        self._booked.clear()
+
+    async def refresh(self, event_type_id: str) -> SlotIndex:
+        lock = self._locks.setdefault(event_type_id, asyncio.Lock())
+        async with lock:
+            slots = await self.fetcher(event_type_id)
+            now = datetime.now(timezone.utc)
+            booked = {t for t in self._booked.get(event_type_id, set()) if t > now}
+            self._booked[event_type_id] = booked
+            index = self._indexes.setdefault(event_type_id, SlotIndex())
+            index.replace(slots, booked)
+            self.metrics["refreshes"] += 1
+            return index
+
+    async def slots(self, event_type_id: str) -> SlotIndex:
+        index = self._indexes.get(event_type_id)
+        if index is not None and time.monotonic() - index.fetched_at < self.ttl:
+            self.metrics["hits"] += 1
+            return index
+        self.metrics["misses"] += 1
+        try:
+            return await self.refresh(event_type_id)
+        except Exception:
+            if index is None:
+                raise
+            print(f"Falha ao atualizar horários do Cal.com, usando cache: {event_type_id}")
+            return index
+
+    async def offer(self, event_type_id: str, count: int = 3) -> List[dict]:
+        index = await self.slots(event_type_id)
+        upcoming = index.upcoming(datetime.now(timezone.utc))
+        if len(upcoming) <= count:
+            return list(upcoming)
+        return sorted(random.sample(upcoming, count), key=lambda s: parse_slot_time(s["time"]))
+
+    def mark_booked(self, event_type_id: str, slot_time: str) -> None:
+        start = parse_slot_time(slot_time)
+        self._booked.setdefault(event_type_id, set()).add(start)
+        index = self._indexes.get(event_type_id)
+        if index is not None:
+            index.remove(start)
+
+    def start(self, event_type_ids: List[str]) -> None:
+        for event_type_id in event_type_ids:
+            self._indexes.setdefault(event_type_id, SlotIndex())
+        if self.refresh_interval and self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            for event_type_id in list(self._indexes):
+                try:
+                    await self.refresh(event_type_id)
+                except Exception as e:
+                    self.metrics["refresh_errors"] += 1
+                    print(f"Erro ao atualizar horários do Cal.com ({event_type_id}): {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"event_types": {k: len(v) for k, v in self._indexes.items()}, **self.metrics}
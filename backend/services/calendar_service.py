@@ -1,89 +1,207 @@
+import asyncio
+import random
 import httpx
+from cachetools import TTLCache
+from typing import Dict, Tuple
 from datetime import datetime, timedelta
 from config import settings
-import random
+from services.http_clients import get_http_client
+from services.availability_cache import AvailabilityCache, parse_slot_time
 
 BASE_URL = settings.CALENDAR_BASE_URL
 
-async def get_available_slots_next_7_days() -> list:
+def event_type_id_param(event_type_id: str):
+    return int(event_type_id) if str(event_type_id).isdigit() else event_type_id
+
+
+async def fetch_slots(event_type_id: str, client: httpx.AsyncClient | None = None) -> list:
     now = datetime.utcnow()
     end = now + timedelta(days=7)
-    async with httpx.AsyncClient() as client:
-        r = await client.get(
-            f"{BASE_URL}/v1/slots",
-            params={
-                "apiKey": settings.CALENDAR_API_KEY,
-                "startTime": now.isoformat(),
-                "endTime": end.isoformat(),
-                "eventTypeId": 3758694,
-            },
-        )
-        r.raise_for_status()
-        data = r.json()
-        slots = data.get("slots", [])
-        
-        if isinstance(slots, dict):
-            slots = [slot for day_slots in slots.values() for slot in day_slots]
-            
-        if len(slots) <= 3:
-            return slots
-        
-        random.shuffle(slots)
-        return slots[:3]
-
-
-async def schedule_meeting(slot: dict, lead: dict) -> dict:
-    try:
-        payload = {
-            "eventTypeId": 3758694,
-            "start": slot["time"],
-            "attendee": {
-                "name": lead.get("nome"),
-                "email": lead.get("email"),
-                "timeZone": "America/Sao_Paulo",
-                "language": "pt-BR",
-            },
-            "location":{
-                "type": "integration",
-                "integration": "google-meet"  
-            },
-            "metadata": {
-                "empresa": lead.get("empresa"),
-                "description": lead.get("necessidade"),
-            },
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "cal-api-version": "2024-08-13",
-            "Authorization": f"Bearer {settings.CALENDAR_API_KEY}",
-            
-        }
-        async with httpx.AsyncClient() as client:
+    client = client or get_http_client("calendar")
+    r = await client.get(
+        f"{BASE_URL}/v1/slots",
+        params={
+            "apiKey": settings.CALENDAR_API_KEY,
+            "startTime": now.isoformat(),
+            "endTime": end.isoformat(),
+            "eventTypeId": event_type_id_param(event_type_id),
+        },
+    )
+    r.raise_for_status()
+    data = r.json()
+    slots = data.get("slots", [])
+    
+    if isinstance(slots, dict):
+        slots = [slot for day_slots in slots.values() for slot in day_slots]
+    return slots
+
+
+AVAILABILITY = AvailabilityCache(
+    fetcher=fetch_slots,
+    ttl_seconds=settings.CAL_AVAILABILITY_TTL_SECONDS,
+    refresh_seconds=settings.CAL_AVAILABILITY_REFRESH_SECONDS,
+)
+
+
+async def get_available_slots_next_7_days(client: httpx.AsyncClient | None = None) -> list:
+    return await AVAILABILITY.offer(settings.CAL_EVENT_TYPE_ID, count=3)
+
+
+BOOKINGS: TTLCache = TTLCache(maxsize=settings.CAL_BOOKING_CACHE_SIZE, ttl=settings.CAL_BOOKING_CACHE_TTL_SECONDS)
+_inflight_bookings: Dict[Tuple[str, str, str], asyncio.Task] = {}
+
+
+def slot_start(slot: dict) -> str | None:
+    # Os horários oferecidos vêm com "time"; o schema da ferramenta descreve "start".
+    start = slot.get("time") or slot.get("start")
+    return str(start) if start else None
+
+
+def booking_key(session_id: str | None, start: str, lead: dict) -> Tuple[str, str, str]:
+    return (session_id or "", start, (lead.get("email") or "").strip().lower())
+
+
+# Falhas em que a reserva comprovadamente não foi processada: dá para repetir o POST sem risco de duplicar.
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def is_retryable(status_code: int, retry_after: str | None = None) -> bool:
+    return status_code == 429 or (status_code == 503 and bool(retry_after))
+
+
+def is_ambiguous(status_code: int) -> bool:
+    return status_code >= 500
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.CAL_BOOKING_MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    cap = min(settings.CAL_BOOKING_MAX_BACKOFF_SECONDS, settings.CAL_BOOKING_BACKOFF_SECONDS * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def booking_headers() -> dict:
+    return {
+        "Content-Type": "application/json",
+        "cal-api-version": "2024-08-13",
+        "Authorization": f"Bearer {settings.CALENDAR_API_KEY}",
+    }
+
+
+async def find_booking(start: str, lead: dict, client: httpx.AsyncClient) -> dict | None:
+    r = await client.get(
+        f"{BASE_URL}/v2/bookings",
+        headers=booking_headers(),
+        params={"attendeeEmail": lead.get("email"), "eventTypeId": event_type_id_param(settings.CAL_EVENT_TYPE_ID)},
+    )
+    r.raise_for_status()
+    start = parse_slot_time(start)
+    for booking in r.json().get("data") or []:
+        if booking.get("status") in ("cancelled", "rejected") or not booking.get("start"):
+            continue
+        if parse_slot_time(booking["start"]) == start:
+            return {"status": "success", "data": booking}
+    return None
+
+
+async def _book(start: str, lead: dict, client: httpx.AsyncClient | None) -> dict:
+    payload = {
+        "eventTypeId": event_type_id_param(settings.CAL_EVENT_TYPE_ID),
+        "start": start,
+        "attendee": {
+            "name": lead.get("nome"),
+            "email": lead.get("email"),
+            "timeZone": "America/Sao_Paulo",
+            "language": "pt-BR",
+        },
+        "location":{
+            "type": "integration",
+            "integration": "google-meet"  
+        },
+        "metadata": {
+            "empresa": lead.get("empresa"),
+            "description": lead.get("necessidade"),
+        },
+    }
+    
+    headers = booking_headers()
+    client = client or get_http_client("calendar")
+    attempts = max(1, settings.CAL_BOOKING_MAX_ATTEMPTS)
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        retry_after = None
+        try:
             r = await client.post(
                 f"{BASE_URL}/v2/bookings",
                 headers=headers,
                 json=payload,
             )
-            if r.status_code >= 400:
-                print("\n❌ Erro ao agendar reunião!")
-                print(f"Status: {r.status_code}")
+        except NOT_SENT_ERRORS as e:
+            print(f"🚫 Erro de conexão com a API: {e}")
+            ambiguous = False
+        except httpx.RequestError as e:
+            # A requisição pode ter chegado ao Cal.com (ex.: timeout de leitura).
+            print(f"🚫 Erro de conexão com a API: {e}")
+            ambiguous = True
+        else:
+            if r.status_code < 400:
                 try:
-                    print("Resposta JSON:", r.json())
-                except Exception:
-                    print("Resposta texto:", r.text)
-                print("Payload enviado:", payload)
-                print("Headers:", headers)
-
-            r.raise_for_status()
-            return r.json()
-
-    except httpx.RequestError as e:
-        print(f"🚫 Erro de conexão com a API: {e}")
-    except httpx.HTTPStatusError as e:
-        print(f"⚠️ Erro HTTP: {e.response.status_code}")
-        print("Corpo do erro:", e.response.text)
-    except Exception as e:
-        print(f"💥 Erro inesperado: {e}")
+                    result = r.json()
+                except ValueError as e:
+                    print(f"💥 Erro inesperado: {e}")
+                    return {}
+                AVAILABILITY.mark_booked(settings.CAL_EVENT_TYPE_ID, start)
+                return result
+            print("\n❌ Erro ao agendar reunião!")
+            print(f"Status: {r.status_code}")
+            try:
+                print("Resposta JSON:", r.json())
+            except Exception:
+                print("Resposta texto:", r.text)
+            print("Payload enviado:", payload)
+            retry_after = r.headers.get("Retry-After")
+            if is_retryable(r.status_code, retry_after):
+                ambiguous = False
+            elif is_ambiguous(r.status_code):
+                ambiguous = True
+            else:
+                return {}
 
+        if ambiguous:
+            # Antes de repetir, confere se a reserva já foi criada; sem essa confirmação não há nova tentativa.
+            try:
+                existing = await find_booking(start, lead, client)
+            except Exception as e:
+                print(f"Não foi possível confirmar se a reserva foi criada, sem nova tentativa: {e}")
+                return {}
+            if existing:
+                AVAILABILITY.mark_booked(settings.CAL_EVENT_TYPE_ID, start)
+                return existing
+        if last:
+            return {}
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
     return {}
+
+
+async def schedule_meeting(slot: dict, lead: dict, client: httpx.AsyncClient | None = None, session_id: str | None = None) -> dict:
+    start = slot_start(slot or {})
+    if not start:
+        print(f"❌ Horário sem início, reunião não agendada: {slot}")
+        return {}
+    key = booking_key(session_id, start, lead)
+    if key in BOOKINGS:
+        return BOOKINGS[key]
+
+    # Tentativas simultâneas para o mesmo (sessão, horário, e-mail) compartilham uma única chamada.
+    task = _inflight_bookings.get(key)
+    if task is None:
+        task = asyncio.create_task(_book(start, lead, client))
+        _inflight_bookings[key] = task
+        task.add_done_callback(lambda _: _inflight_bookings.pop(key, None))
+    result = await asyncio.shield(task)
+    if result:
+        BOOKINGS[key] = result
+    return result
\ No newline at end of file
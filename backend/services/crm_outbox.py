@@ -0,0 +1,256 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from models.db import get_database
+from services import pipefy_service
+from utils.session_manager import set_pipefy_card_id
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+
+def merge_leads(jobs: List[dict]) -> dict:
+    lead: Dict[str, Any] = {}
+    for job in sorted(jobs, key=lambda j: j["created_at"]):
+        lead.update({k: v for k, v in (job.get("lead") or {}).items() if v not in (None, "")})
+    return lead
+
+
+class CrmOutbox:
+    def __init__(self, workers: int, poll_interval_ms: int, max_attempts: int, backoff_seconds: float, max_backoff_seconds: float, lease_seconds: float):
+        self.workers = workers
+        self.poll_interval = poll_interval_ms / 1000
+        self.max_attempts = max_attempts
+        self.backoff = backoff_seconds
+        self.max_backoff = max_backoff_seconds
+        self.lease = lease_seconds
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        # E-mails com lease deste processo; a exclusão entre processos vem da coleção crm_outbox_leases.
+        self._active: set = set()
+        self._running = False
+        self.metrics = {"enqueued": 0, "processed": 0, "coalesced": 0, "retries": 0, "failed": 0}
+
+    @property
+    def collection(self):
+        return get_database().crm_outbox
+
+    @property
+    def leases(self):
+        return get_database().crm_outbox_leases
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+        await self.collection.create_index([("email", ASCENDING), ("status", ASCENDING)])
+        await self.collection.create_index("claim_id")
+        await self.leases.create_index("expires_at", expireAfterSeconds=0)
+
+    async def start(self) -> None:
+        if self._running:
+            return
+        await self.requeue_stale(datetime.utcnow())
+        self._wakeup = asyncio.Event()
+        self._running = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, lead: dict, session_id: str | None = None) -> str:
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        await self.collection.insert_one({
+            "_id": job_id,
+            "kind": "create_or_update_card_pipefy",
+            "email": pipefy_service.normalize_email(lead.get("email")),
+            "lead": lead,
+            "session_id": session_id,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+            "updated_at": now,
+        })
+        self.metrics["enqueued"] += 1
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    async def get_job(self, job_id: str) -> dict | None:
+        return await self.collection.find_one({"_id": job_id}, {"lead": 0})
+
+    async def status_counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, PROCESSING: 0, DONE: 0, FAILED: 0}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self._running, "workers": self.workers, "active_emails": len(self._active), **self.metrics}
+
+    def backoff_delay(self, attempts: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempts))
+
+    async def acquire_lease(self, email: str, claim_id: str) -> bool:
+        now = datetime.utcnow()
+        # Lease vencido é sobrescrito; lease vigente de outro worker faz o upsert colidir no _id.
+        try:
+            await self.leases.update_one(
+                {"_id": email, "expires_at": {"$lte": now}},
+                {"$set": {"owner": claim_id, "expires_at": now + timedelta(seconds=self.lease)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_lease(self, email: str, claim_id: str) -> None:
+        await self.leases.delete_one({"_id": email, "owner": claim_id})
+
+    async def requeue_stale(self, now: datetime) -> None:
+        # Jobs presos em "processing" além do lease (worker ou processo que morreu) voltam para a fila.
+        await self.collection.update_many(
+            {"status": PROCESSING, "claimed_at": {"$lt": now - timedelta(seconds=self.lease)}},
+            {"$set": {"status": PENDING}, "$unset": {"claim_id": ""}},
+        )
+
+    async def claim(self) -> List[dict]:
+        now = datetime.utcnow()
+        await self.requeue_stale(now)
+        busy = set(self._active)
+        while True:
+            candidate = await self.collection.find_one(
+                {"status": PENDING, "next_attempt_at": {"$lte": now}, "email": {"$nin": list(busy)}},
+                {"email": 1},
+                sort=[("next_attempt_at", ASCENDING)],
+            )
+            if not candidate:
+                return []
+            claim_id = str(uuid.uuid4())
+            email = candidate["email"]
+            if not email:
+                job = await self.collection.find_one_and_update(
+                    {"_id": candidate["_id"], "status": PENDING},
+                    {"$set": {"status": PROCESSING, "claimed_at": now, "claim_id": claim_id}},
+                    return_document=ReturnDocument.AFTER,
+                )
+                if job:
+                    return [job]
+                continue
+            if not await self.acquire_lease(email, claim_id):
+                busy.add(email)
+                continue
+            self._active.add(email)
+            # Todos os jobs pendentes do mesmo e-mail viram um único upsert no Pipefy.
+            await self.collection.update_many(
+                {"email": email, "status": PENDING},
+                {"$set": {"status": PROCESSING, "claimed_at": now, "claim_id": claim_id}},
+            )
+            jobs = await self.collection.find({"claim_id": claim_id}).to_list(length=None)
+            if jobs:
+                return jobs
+            self._active.discard(email)
+            await self.release_lease(email, claim_id)
+            busy.add(email)
+
+    async def process(self, jobs: List[dict]) -> None:
+        if not jobs:
+            return
+        email = jobs[0]["email"]
+        try:
+            await self._upsert(jobs)
+        finally:
+            if email:
+                self._active.discard(email)
+                try:
+                    await self.release_lease(email, jobs[0]["claim_id"])
+                except Exception as e:
+                    print(f"Erro ao liberar o lease da outbox do CRM ({email}): {e}")
+
+    async def _upsert(self, jobs: List[dict]) -> None:
+        ids = [job["_id"] for job in jobs]
+        try:
+            result = await pipefy_service.create_or_update_card_pipefy(client=None, lead=merge_leads(jobs))
+            if result.get("error"):
+                raise RuntimeError(result["error"])
+            # Erros por campo no update também contam: o card ficaria com dados parciais.
+            field_errors = [r for r in result.get("results", []) if r.get("error")]
+            if field_errors:
+                raise RuntimeError(f"Erro nos campos {[r.get('field_id') for r in field_errors]}: {field_errors[0]['error']}")
+        except Exception as e:
+            await self._fail(jobs, str(e))
+            return
+
+        card_id = (result.get("card") or {}).get("id")
+        await self.collection.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"status": DONE, "card_id": card_id, "updated_at": datetime.utcnow()}, "$unset": {"claim_id": ""}},
+        )
+        self.metrics["processed"] += 1
+        self.metrics["coalesced"] += len(jobs) - 1
+        for session_id in {job.get("session_id") for job in jobs if job.get("session_id")}:
+            try:
+                await set_pipefy_card_id(session_id, card_id)
+            except Exception as e:
+                print(f"Erro ao salvar o card do Pipefy na sessão {session_id}: {e}")
+
+    async def _fail(self, jobs: List[dict], error: str) -> None:
+        attempts = max(job.get("attempts", 0) for job in jobs) + 1
+        if attempts >= self.max_attempts:
+            update = {"status": FAILED}
+            self.metrics["failed"] += 1
+            print(f"Falha definitiva ao enviar lead ao Pipefy ({jobs[0]['email']}): {error}")
+        else:
+            update = {"status": PENDING, "next_attempt_at": datetime.utcnow() + timedelta(seconds=self.backoff_delay(attempts))}
+            self.metrics["retries"] += 1
+            print(f"Erro ao enviar lead ao Pipefy, nova tentativa {attempts} ({jobs[0]['email']}): {error}")
+        await self.collection.update_many(
+            {"_id": {"$in": [job["_id"] for job in jobs]}},
+            {"$set": {**update, "attempts": attempts, "last_error": error, "updated_at": datetime.utcnow()}, "$unset": {"claim_id": ""}},
+        )
+
+    async def _worker(self) -> None:
+        while self._running:
+            try:
+                jobs = await self.claim()
+            except Exception as e:
+                print(f"Erro ao ler a outbox do CRM: {e}")
+                jobs = []
+            if not jobs:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Um erro aqui não pode derrubar o worker; os jobs em "processing" voltam após o lease.
+            try:
+                await self.process(jobs)
+            except Exception as e:
+                print(f"Erro ao processar a outbox do CRM ({jobs[0]['email']}): {e}")
+
+
+crm_outbox = CrmOutbox(
+    workers=settings.CRM_OUTBOX_WORKERS,
+    poll_interval_ms=settings.CRM_OUTBOX_POLL_INTERVAL_MS,
+    max_attempts=settings.CRM_OUTBOX_MAX_ATTEMPTS,
+    backoff_seconds=settings.CRM_OUTBOX_BACKOFF_SECONDS,
+    max_backoff_seconds=settings.CRM_OUTBOX_MAX_BACKOFF_SECONDS,
+    lease_seconds=settings.CRM_OUTBOX_LEASE_SECONDS,
+)
\ No newline at end of file
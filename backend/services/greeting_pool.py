@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import random
+from typing import Any, Dict, List
+from config import settings
+from models.session import Message, Role
+from services import ai_service
+from utils.response_cache import STAGE_QUESTIONS
+
+# Usada quando o pool está vazio (início, troca de prompt ou modelo): o /start-session nunca espera o Gemini.
+FALLBACK_GREETING = f"Olá! Sou o Assistente Virtual Selly-IA. {STAGE_QUESTIONS['initial']}"
+
+
+def greeting_key(prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+
+class GreetingPool:
+    def __init__(self, size: int, refresh_seconds: float):
+        self.size = size
+        self.refresh_interval = refresh_seconds
+        self._pools: Dict[str, List[str]] = {}
+        self._prompt: str | None = None
+        self._task: asyncio.Task | None = None
+        self._filling: asyncio.Task | None = None
+        self.metrics = {"hits": 0, "misses": 0, "fallbacks": 0, "generated": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def generate(self, prompt: str) -> str:
+        ai_response = await ai_service.chat_with_ai(
+            messages=[Message(Role.SYSTEM, prompt)],
+            system_instructions=prompt
+        )
+        return ai_response.get("reply", "")
+
+    async def fill(self, prompt: str) -> None:
+        key = greeting_key(prompt, settings.AI_MODEL)
+        results = await asyncio.gather(*[self.generate(prompt) for _ in range(self.size)], return_exceptions=True)
+        greetings = [r for r in results if isinstance(r, str) and r]
+        self.metrics["generated"] += len(greetings)
+        self.metrics["errors"] += len(results) - len(greetings)
+        if greetings:
+            # Só o par prompt+modelo atual fica em memória; pools antigos são descartados.
+            self._pools = {key: greetings}
+
+    def pick(self, prompt: str) -> str | None:
+        pool = self._pools.get(greeting_key(prompt, settings.AI_MODEL))
+        return random.choice(pool) if pool else None
+
+    async def get(self, prompt: str) -> str:
+        greeting = self.pick(prompt)
+        if greeting is not None:
+            self.metrics["hits"] += 1
+            return greeting
+        self.metrics["misses"] += 1
+        if self.running and (self._filling is None or self._filling.done()):
+            self._filling = asyncio.create_task(self.fill(prompt))
+        self.metrics["fallbacks"] += 1
+        return FALLBACK_GREETING
+
+    def start(self, prompt: str) -> None:
+        if self._task is None:
+            self._prompt = prompt
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._filling):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = None
+        self._filling = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.fill(self._prompt)
+            except Exception as e:
+                print(f"Erro ao gerar saudações: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pooled": sum(len(p) for p in self._pools.values()), "size": self.size, **self.metrics}
+
+
+greeting_pool = GreetingPool(
+    size=settings.GREETING_POOL_SIZE,
+    refresh_seconds=settings.GREETING_POOL_REFRESH_SECONDS,
+)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import httpx
+from typing import Dict
+from config import settings
+from services.resilience import ResilientTransport, get_upstream
+
+INTEGRATIONS = ("pipefy", "calendar")
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def build_http_client(name: str | None = None) -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(
+        http2=settings.HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=ResilientTransport(get_upstream(name), transport) if name else transport,
+        timeout=httpx.Timeout(
+            settings.HTTP_READ_TIMEOUT_SECONDS,
+            connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        ),
+    )
+
+
+def init_http_clients() -> None:
+    for name in INTEGRATIONS:
+        get_http_client(name)
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = build_http_client(name)
+        _clients[name] = client
+    return client
+
+
+async def close_http_clients() -> None:
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
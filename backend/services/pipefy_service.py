@@ -1,6 +1,8 @@
 import httpx
+from cachetools import TTLCache
 from typing import Any, List, Dict
 from config import settings
+from services.http_clients import get_http_client
 import json
 
 HEADERS = {
@@ -10,73 +12,96 @@ HEADERS = {
 
 PIPEFY_URL = settings.PIPEFY_API_URL
 
-async def find_card_by_email(email: str) -> str | None:
-    async with httpx.AsyncClient() as client:
-        query = {
-            "query": """
-                query FindCards($pipe_id: ID!, $email: String!) {
-                    findCards(pipeId: $pipe_id, search: {fieldId: "email", fieldValue: $email}){
-                        edges{
-                            node{
-                                id
-                                fields{
-                                    name,
-                                    value
-                                }
+CARD_ID_CACHE: TTLCache = TTLCache(
+    maxsize=settings.PIPEFY_CARD_CACHE_SIZE,
+    ttl=settings.PIPEFY_CARD_CACHE_TTL_SECONDS,
+)
+
+async def find_card_by_email(client: httpx.AsyncClient, email: str) -> dict:
+    query = {
+        "query": """
+            query FindCards($pipe_id: ID!, $email: String!) {
+                findCards(pipeId: $pipe_id, search: {fieldId: "email", fieldValue: $email}){
+                    edges{
+                        node{
+                            id
+                            fields{
+                                name,
+                                value
                             }
                         }
                     }
                 }
-                    
-            """,
-            "variables": {
-                "pipe_id": settings.PIPEFY_PIPE_ID,
-                "email": email,
-            },
-        }
+            }
+                
+        """,
+        "variables": {
+            "pipe_id": settings.PIPEFY_PIPE_ID,
+            "email": email,
+        },
+    }
 
-        response = await client.post(PIPEFY_URL, headers=HEADERS, json=query)
-        data = response.json()
+    response = await client.post(PIPEFY_URL, headers=HEADERS, json=query)
+    data = response.json()
 
-        if "data" in data and data["data"]["findCards"] and data["data"]["findCards"]["edges"]:
-            edges = data["data"]["findCards"]["edges"]
-            for edge in edges:
-                card = edge["node"]
-                return {"id": card["id"], "fields": card["fields"]}
-        
-        return {"error": "Card not found"}
+    if "data" in data and data["data"]["findCards"] and data["data"]["findCards"]["edges"]:
+        edges = data["data"]["findCards"]["edges"]
+        for edge in edges:
+            card = edge["node"]
+            return {"id": card["id"], "fields": card["fields"]}
+    
+    return {"error": "Card not found"}
+
+UPDATE_CARD_FIELD_SELECTION = """
+    card {
+        id
+        title
+    }
+"""
+
+def build_update_card_mutation(card_id: str, fields: List[Dict[str, str]]) -> dict:
+    declarations = ", ".join(f"$f{i}: UpdateCardFieldInput!" for i in range(len(fields)))
+    selections = "\n".join(
+        f"f{i}: updateCardField(input: $f{i}) {{{UPDATE_CARD_FIELD_SELECTION}}}" for i in range(len(fields))
+    )
+    return {
+        "query": f"mutation UpdateCardFields({declarations}) {{\n{selections}\n}}",
+        "variables": {
+            f"f{i}": {"card_id": card_id, "field_id": field["field_id"], "new_value": field["field_value"]}
+            for i, field in enumerate(fields)
+        },
+    }
 
 async def update_card(client: httpx.AsyncClient, card_id: str, fields_to_update: List[Dict[str, str]]) -> dict:
     
     if not fields_to_update:
         return {"message": "Nenhum campo para atualizar."}
 
-    results = []
-
-    for field in fields_to_update:
-        if field['field_id'] == 'email' or field['field_id'] == 'interesse_confirmado': continue
-        mutation = {
-            "query": f"""
-                mutation {{
-                    updateCardField(input: {{
-                        card_id: "{card_id}",
-                        field_id: "{field['field_id']}",
-                        new_value: "{field['field_value']}"
-                    }}) {{
-                        card {{
-                            id
-                            title
-                        }}
-                    }}
-                }}
-            """
-        }
-
-        response = await client.post(PIPEFY_URL, headers=HEADERS, json=mutation)
-        data = response.json()
+    fields = [
+        field for field in fields_to_update
+        if field['field_id'] != 'email' and field['field_id'] != 'interesse_confirmado'
+    ]
+    if not fields:
+        return {"message": "Processo concluído", "results": []}
+
+    mutation = build_update_card_mutation(card_id, fields)
+    response = await client.post(PIPEFY_URL, headers=HEADERS, json=mutation)
+    data = response.json()
+
+    errors_by_alias: Dict[str, list] = {}
+    global_errors = []
+    for error in data.get("errors") or []:
+        path = error.get("path") or []
+        if path and isinstance(path[0], str) and path[0].startswith("f"):
+            errors_by_alias.setdefault(path[0], []).append(error)
+        else:
+            global_errors.append(error)
 
-        if "errors" in data:
-            results.append({"field_id": field["field_id"], "error": data["errors"]})
+    results = []
+    for i, field in enumerate(fields):
+        field_errors = errors_by_alias.get(f"f{i}", []) + global_errors
+        if field_errors:
+            results.append({"field_id": field["field_id"], "error": field_errors})
         else:
             results.append({"field_id": field["field_id"], "status": "ok"})
 
@@ -85,10 +110,40 @@ async def update_card(client: httpx.AsyncClient, card_id: str, fields_to_update:
         "results": results
     }
 
+def normalize_email(email: str | None) -> str:
+    return (email or "").strip().lower()
+
+def remember_card_id(email: str | None, card_id: str | None) -> None:
+    key = normalize_email(email)
+    if key and card_id:
+        CARD_ID_CACHE[key] = card_id
+
+def cached_card_id(email: str | None) -> str | None:
+    return CARD_ID_CACHE.get(normalize_email(email))
+
+def forget_card_id(email: str | None) -> None:
+    CARD_ID_CACHE.pop(normalize_email(email), None)
+
+async def prefetch_card_id(email: str | None, client: httpx.AsyncClient | None = None) -> str | None:
+    if not normalize_email(email):
+        return None
+    card_id = cached_card_id(email)
+    if card_id:
+        return card_id
+    card = await find_card_by_email(client or get_http_client("pipefy"), email)
+    remember_card_id(email, card.get("id"))
+    return card.get("id")
+
 async def upsert_lead_card(client: httpx.AsyncClient, lead: dict) -> dict:
     pipe_id = settings.PIPEFY_PIPE_ID
     email = lead.get("email", "")
-    existing_card = await find_card_by_email(email)
+    card_id = cached_card_id(email)
+    if card_id:
+        existing_card = {"id": card_id}
+    else:
+        existing_card = await find_card_by_email(client, email)
+        if "id" in existing_card:
+            remember_card_id(email, existing_card["id"])
     
     fields_data = [
         {"field_id": "nome", "field_value": lead.get("nome", "")},
@@ -110,7 +165,10 @@ async def upsert_lead_card(client: httpx.AsyncClient, lead: dict) -> dict:
             for f in fields_data
         ]
         
-        return await update_card(client, card_id, fields_for_update_mutation)
+        result = await update_card(client, card_id, fields_for_update_mutation)
+        if any("error" in r for r in result.get("results", [])):
+            forget_card_id(email)
+        return {**result, "card": {"id": card_id}}
     
     else:
         fields_attributes = [
@@ -144,17 +202,16 @@ async def upsert_lead_card(client: httpx.AsyncClient, lead: dict) -> dict:
         create_data = create_response.json()
 
         if "errors" in create_data:
+            forget_card_id(email)
             return {"error": create_data["errors"]}
 
+        card = create_data.get("data", {}).get("createCard", {}).get("card")
+        remember_card_id(email, (card or {}).get("id"))
         return {
             "message": "Card criado com sucesso",
-            "card": create_data.get("data", {}).get("createCard", {}).get("card"),
+            "card": card,
         }
         
-async def create_or_update_card_pipefy(client: httpx.AsyncClient, lead: dict) -> dict:
-    if client is None:
-        async with httpx.AsyncClient() as client:
-            return await upsert_lead_card(client, lead)
-    else:
-        return await upsert_lead_card(client, lead)
+async def create_or_update_card_pipefy(client: httpx.AsyncClient | None, lead: dict) -> dict:
+    return await upsert_lead_card(client or get_http_client("pipefy"), lead)
 
@@ -0,0 +1,253 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+import httpx
+from config import settings
+from utils.metrics import UPSTREAM_ERRORS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} indisponível: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class OverloadedError(UpstreamUnavailable):
+    pass
+
+
+class AIMDLimiter:
+    # Aumenta o limite em ~1 por janela enquanto a latência está no alvo e corta pela metade em erro ou lentidão.
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_target_seconds: float, backoff_ratio: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target_seconds
+        self.backoff_ratio = backoff_ratio
+        self.inflight = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, timeout: float) -> bool:
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.inflight < int(self.limit)), timeout)
+            except asyncio.TimeoutError:
+                return False
+            self.inflight += 1
+            return True
+
+    async def release(self, latency: float, dropped: bool) -> None:
+        if dropped or latency > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        async with self._changed:
+            self.inflight -= 1
+            self._changed.notify_all()
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    return False
+                await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout_seconds: float, half_open_probes: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = CLOSED
+
+    def record_abandoned(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class Call:
+    __slots__ = ("failed",)
+
+    def __init__(self):
+        self.failed = False
+
+    def mark_failure(self) -> None:
+        self.failed = True
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    code = getattr(exc, "code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+class Upstream:
+    def __init__(self, name: str, limiter: AIMDLimiter, bucket: TokenBucket, breaker: CircuitBreaker, queue_timeout_seconds: float):
+        self.name = name
+        self.limiter = limiter
+        self.bucket = bucket
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout_seconds
+        self.metrics = {"calls": 0, "failures": 0, "rejected_open": 0, "rejected_overload": 0, "rejected_rate": 0}
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[Call]:
+        if not self.breaker.allow():
+            self.metrics["rejected_open"] += 1
+            UPSTREAM_ERRORS.labels(self.name, "circuit_open").inc()
+            raise CircuitOpenError(self.name, "circuito aberto")
+        try:
+            if not await self.bucket.acquire(self.queue_timeout):
+                self.metrics["rejected_rate"] += 1
+                UPSTREAM_ERRORS.labels(self.name, "rate_limited").inc()
+                raise OverloadedError(self.name, "limite de requisições")
+            if not await self.limiter.acquire(self.queue_timeout):
+                self.metrics["rejected_overload"] += 1
+                UPSTREAM_ERRORS.labels(self.name, "overloaded").inc()
+                raise OverloadedError(self.name, "limite de concorrência")
+        except BaseException:
+            # A chamada não chegou ao provedor: devolve a sondagem half-open que allow() reservou.
+            self.breaker.record_abandoned()
+            raise
+
+        call = Call()
+        start = time.monotonic()
+        cancelled = False
+        timed_out = False
+        try:
+            yield call
+        except asyncio.CancelledError:
+            # Cancelamento (ex.: timeout da ferramenta) reduz a concorrência, mas não conta como falha do provedor.
+            cancelled = True
+            raise
+        except BaseException as e:
+            call.failed = call.failed or is_upstream_failure(e)
+            timed_out = isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError))
+            raise
+        finally:
+            self.metrics["calls"] += 1
+            if call.failed:
+                self.metrics["failures"] += 1
+                UPSTREAM_ERRORS.labels(self.name, "timeout" if timed_out else "error").inc()
+                self.breaker.record_failure()
+            elif cancelled:
+                self.breaker.record_abandoned()
+            else:
+                self.breaker.record_success()
+            await self.limiter.release(time.monotonic() - start, call.failed or cancelled)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "inflight": self.limiter.inflight,
+            "tokens": round(self.bucket.tokens, 2),
+            **self.metrics,
+        }
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, upstream: Upstream, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async with self.upstream.guard() as call:
+            response = await self.transport.handle_async_request(request)
+            if response.status_code == 429 or response.status_code >= 500:
+                call.mark_failure()
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def build_upstream(name: str, rate_per_minute: float, burst: int, max_concurrency: int, latency_target_seconds: float) -> Upstream:
+    return Upstream(
+        name,
+        limiter=AIMDLimiter(
+            initial=max(1, max_concurrency // 2),
+            min_limit=1,
+            max_limit=max_concurrency,
+            latency_target_seconds=latency_target_seconds,
+        ),
+        bucket=TokenBucket(rate_per_minute / 60, burst),
+        breaker=CircuitBreaker(
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout_seconds=settings.CIRCUIT_RESET_SECONDS,
+            half_open_probes=settings.CIRCUIT_HALF_OPEN_PROBES,
+        ),
+        queue_timeout_seconds=settings.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+    )
+
+
+UPSTREAMS: Dict[str, Upstream] = {
+    "gemini": build_upstream("gemini", settings.AI_RATE_LIMIT_PER_MINUTE, settings.AI_RATE_LIMIT_BURST, settings.AI_MAX_CONCURRENCY, settings.AI_LATENCY_TARGET_SECONDS),
+    "pipefy": build_upstream("pipefy", settings.PIPEFY_RATE_LIMIT_PER_MINUTE, settings.PIPEFY_RATE_LIMIT_BURST, settings.PIPEFY_MAX_CONCURRENCY, settings.PIPEFY_LATENCY_TARGET_SECONDS),
+    "calendar": build_upstream("calendar", settings.CALENDAR_RATE_LIMIT_PER_MINUTE, settings.CALENDAR_RATE_LIMIT_BURST, settings.CALENDAR_MAX_CONCURRENCY, settings.CALENDAR_LATENCY_TARGET_SECONDS),
+}
+
+
+def get_upstream(name: str) -> Upstream:
+    return UPSTREAMS[name]
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: upstream.stats() for name, upstream in UPSTREAMS.items()}
\ No newline at end of file
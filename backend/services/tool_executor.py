@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from config import settings
+from services import pipefy_service, calendar_service
+from services.crm_outbox import crm_outbox
+from utils.session_manager import on_stage_enter
+from utils.metrics import UPSTREAM_ERRORS, timed
+
+# Uma chamada só começa depois que todas as chamadas listadas aqui (no mesmo lote) terminarem.
+DEPENDS_ON: Dict[str, set] = {
+    "create_or_update_card_pipefy": {"schedule_meeting"},
+}
+
+ToolResult = Tuple[Dict[str, Any], Dict[str, Any] | None]
+
+
+async def _save_lead(lead: dict, session_id: str | None) -> dict:
+    # Com a outbox ativa o turno responde na hora e o Pipefy é atualizado pelos workers.
+    if crm_outbox.running:
+        return {"queued": True, "job_id": await crm_outbox.enqueue(lead, session_id)}
+    return await pipefy_service.create_or_update_card_pipefy(client=None, lead=lead)
+
+
+async def _create_or_update_card(args: dict, upstream: List[ToolResult], batch: List[str], session_id: str | None = None) -> ToolResult:
+    lead_data = dict(args.get("lead") or {})
+    for function_result, _ in upstream:
+        if function_result.get("meeting_link"):
+            lead_data["meeting_link"] = function_result["meeting_link"]
+            lead_data["meeting_datetime"] = function_result.get("datetime")
+    result = await _save_lead(lead_data, session_id)
+    if result.get("queued"):
+        function_result = {"status": "enfileirado", "job_id": result["job_id"]}
+    else:
+        function_result = {"status": "sucesso", "card_id": (result.get('card') or {}).get('id', 'N/A')}
+    return function_result, {"action": "create_or_update_card_pipefy", "result": result}
+
+
+async def _get_available_slots(args: dict, upstream: List[ToolResult], batch: List[str], session_id: str | None = None) -> ToolResult:
+    slots = await calendar_service.get_available_slots_next_7_days()
+    offered = slots[:3]
+    return {"available_slots": offered}, {"action": "get_available_slots_next_7_days", "result": offered}
+
+
+async def _schedule_meeting(args: dict, upstream: List[ToolResult], batch: List[str], session_id: str | None = None) -> ToolResult:
+    slot = args.get('slot', {})
+    lead = args.get('lead', {})
+    result = await calendar_service.schedule_meeting(slot, lead, session_id=session_id)
+
+    meeting_link = (result.get('data') or {}).get('meetingUrl')
+    if meeting_link is None:
+        function_result = {"status": "falha", "meeting_link": None, "datetime": None}
+        return function_result, {"action": "schedule_meeting", "result": function_result}
+
+    meeting_datetime = calendar_service.slot_start(slot)
+
+    # Se o modelo já pediu a atualização do card neste lote, ela recebe o link como dependência.
+    if "create_or_update_card_pipefy" not in batch:
+        lead['meeting_link'] = meeting_link
+        lead['meeting_datetime'] = meeting_datetime
+        await _save_lead(lead, session_id)
+
+    function_result = {"status": "sucesso", "meeting_link": meeting_link, "datetime": meeting_datetime}
+    return function_result, {"action": "schedule_meeting", "result": function_result}
+
+
+TOOL_HANDLERS: Dict[str, Callable[..., Awaitable[ToolResult]]] = {
+    "create_or_update_card_pipefy": _create_or_update_card,
+    "get_available_slots_next_7_days": _get_available_slots,
+    "schedule_meeting": _schedule_meeting,
+}
+
+
+async def _warm_availability(session_id: str, session) -> None:
+    # Só aquece o cache; a oferta sai na chamada da ferramenta, já sem os horários reservados nesse meio-tempo.
+    await calendar_service.AVAILABILITY.slots(settings.CAL_EVENT_TYPE_ID)
+
+
+async def _prefetch_card_id(session_id: str, session) -> str | None:
+    if session.pipefy_card_id:
+        return session.pipefy_card_id
+    return await pipefy_service.prefetch_card_id(session.lead.email)
+
+
+# Ao entrar em confirm_interest o próximo turno quase sempre oferece horários.
+on_stage_enter("confirm_interest", "get_available_slots_next_7_days", _warm_availability)
+on_stage_enter("confirm_interest", "pipefy_card_lookup", _prefetch_card_id)
+
+
+def tool_upstream(name: str) -> str:
+    return "pipefy" if name == "create_or_update_card_pipefy" else "calendar"
+
+
+def tool_timeout(name: str) -> float:
+    if tool_upstream(name) == "pipefy":
+        return settings.PIPEFY_TOOL_TIMEOUT_SECONDS
+    return settings.CALENDAR_TOOL_TIMEOUT_SECONDS
+
+
+async def execute_tool_calls(calls: List[Tuple[str, dict]], prefetched: Dict[str, asyncio.Task] | None = None, session_id: str | None = None) -> List[ToolResult]:
+    batch = [name for name, _ in calls]
+    tasks: List[asyncio.Task] = []
+
+    async def run(index: int, name: str, args: dict) -> ToolResult:
+        deps = [tasks[i] for i, dep in enumerate(batch) if i != index and dep in DEPENDS_ON.get(name, ())]
+        upstream = list(await asyncio.gather(*deps)) if deps else []
+
+        handler = TOOL_HANDLERS.get(name)
+        if handler is None:
+            return {"status": "falha", "erro": f"Função desconhecida: {name}"}, None
+        task = (prefetched or {}).pop(name, None)
+        if task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=tool_timeout(name))
+            except Exception as e:
+                print(f"Pré-carregamento de {name} falhou, executando sem ele: {e}")
+        try:
+            with timed("tool", name):
+                return await asyncio.wait_for(handler(args, upstream, batch, session_id), timeout=tool_timeout(name))
+        except asyncio.TimeoutError:
+            UPSTREAM_ERRORS.labels(tool_upstream(name), "tool_timeout").inc()
+            print(f"Tempo esgotado ao executar {name}")
+            error = {"status": "falha", "erro": "tempo esgotado"}
+        except Exception as e:
+            print(f"Erro ao executar {name}: {e}")
+            error = {"status": "falha", "erro": str(e)}
+        return error, {"action": name, "result": error}
+
+    for index, (name, args) in enumerate(calls):
+        tasks.append(asyncio.create_task(run(index, name, args)))
+    return list(await asyncio.gather(*tasks))
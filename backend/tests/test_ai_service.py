@@ -0,0 +1,95 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from google.genai import types
+from models.session import Message, Role
+from services import ai_service
+from services.ai_service import GenerationConfigRegistry
+
+FUNCTIONS = [
+    {"name": "get_available_slots_next_7_days", "description": "slots", "parameters": {"type": "object", "properties": {}, "required": []}},
+]
+
+
+def make_client(create=None):
+    return SimpleNamespace(caches=SimpleNamespace(create=create or AsyncMock(return_value=SimpleNamespace(name="cachedContents/abc"))))
+
+
+def test_configs_are_built_once_per_variant():
+    registry = GenerationConfigRegistry(cache_enabled=False, cache_ttl_seconds=60)
+    json_mode = registry.get("gemini", "prompt", None)
+    function_mode = registry.get("gemini", "prompt", FUNCTIONS)
+
+    assert registry.get("gemini", "prompt", None) is json_mode
+    assert registry.get("gemini", "prompt", FUNCTIONS) is function_mode
+    assert json_mode.response_schema is ai_service.RESPONSE_SCHEMA
+    assert json_mode.tools is None
+    assert function_mode.tools[0].function_declarations[0].name == "get_available_slots_next_7_days"
+
+
+def test_final_config_keeps_tools_but_disables_function_calls():
+    registry = GenerationConfigRegistry(cache_enabled=False, cache_ttl_seconds=60)
+    final = registry.get("gemini", "prompt", FUNCTIONS, tool_calls=False)
+
+    assert final is not registry.get("gemini", "prompt", FUNCTIONS)
+    assert final.tools[0].function_declarations[0].name == "get_available_slots_next_7_days"
+    assert final.tool_config.function_calling_config.mode == types.FunctionCallingConfigMode.NONE
+    assert registry.get("gemini", "prompt", FUNCTIONS).tool_config is None
+
+
+@pytest.mark.asyncio
+async def test_final_config_skips_context_cache():
+    registry = GenerationConfigRegistry(cache_enabled=True, cache_ttl_seconds=600)
+    client = make_client()
+
+    config = await registry.resolve(client, "gemini", "prompt", FUNCTIONS, tool_calls=False)
+
+    assert config.system_instruction == "prompt"
+    client.caches.create.assert_not_awaited()
+
+
+def test_system_prompt_is_built_once():
+    assert ai_service.system_prompt_for_agent("x") is ai_service.system_prompt_for_agent("x")
+
+
+@pytest.mark.asyncio
+async def test_static_prompt_and_tools_use_context_cache():
+    registry = GenerationConfigRegistry(cache_enabled=True, cache_ttl_seconds=600)
+    client = make_client()
+
+    config = await registry.resolve(client, "gemini", "prompt", FUNCTIONS)
+    again = await registry.resolve(client, "gemini", "prompt", FUNCTIONS)
+
+    assert config is again
+    assert config.cached_content == "cachedContents/abc"
+    assert config.system_instruction is None and config.tools is None
+    client.caches.create.assert_awaited_once()
+    cache_config = client.caches.create.await_args.kwargs["config"]
+    assert cache_config.system_instruction == "prompt"
+    assert cache_config.ttl == "600s"
+
+
+@pytest.mark.asyncio
+async def test_cache_failure_falls_back_to_full_config():
+    registry = GenerationConfigRegistry(cache_enabled=True, cache_ttl_seconds=600)
+    client = make_client(AsyncMock(side_effect=RuntimeError("too few tokens")))
+
+    config = await registry.resolve(client, "gemini", "prompt", None)
+    await registry.resolve(client, "gemini", "prompt", None)
+
+    assert config is registry.get("gemini", "prompt", None)
+    client.caches.create.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_chat_with_ai_reuses_registry_config(monkeypatch):
+    generate = AsyncMock(return_value=SimpleNamespace(text='{"reply": "Olá!"}'))
+    monkeypatch.setattr(ai_service, "CLIENT", SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate))))
+    monkeypatch.setattr(ai_service, "CONFIG_REGISTRY", GenerationConfigRegistry(cache_enabled=False, cache_ttl_seconds=60))
+
+    for _ in range(2):
+        reply = await ai_service.chat_with_ai([Message(Role.USER, "Oi")], "prompt")
+    assert reply == {"reply": "Olá!"}
+    configs = [call.kwargs["config"] for call in generate.await_args_list]
+    assert configs[0] is configs[1]
+    assert generate.await_args.kwargs["contents"][0].role == "user"
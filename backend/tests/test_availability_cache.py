@@ -0,0 +1,90 @@
+import pytest
+import respx
+import httpx
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+from services import calendar_service
+from services.availability_cache import AvailabilityCache, SlotIndex, parse_slot_time
+
+
+def slot_at(hours: int) -> dict:
+    return {"time": (datetime.now(timezone.utc) + timedelta(hours=hours)).isoformat()}
+
+
+def test_slot_index_is_sorted_and_skips_past_slots():
+    index = SlotIndex([slot_at(5), slot_at(-2), slot_at(1), {"time": "invalid"}])
+
+    upcoming = index.upcoming(datetime.now(timezone.utc))
+
+    assert len(index) == 3
+    assert [parse_slot_time(s["time"]) for s in upcoming] == sorted(parse_slot_time(s["time"]) for s in upcoming)
+    assert len(upcoming) == 2
+
+
+@pytest.mark.asyncio
+async def test_offer_reuses_cached_slots_until_ttl():
+    calls = []
+
+    async def fetcher(event_type_id):
+        calls.append(event_type_id)
+        return [slot_at(h) for h in range(1, 10)]
+
+    cache = AvailabilityCache(fetcher, ttl_seconds=60, refresh_seconds=0)
+
+    first = await cache.offer("42")
+    second = await cache.offer("42")
+
+    assert calls == ["42"]
+    assert len(first) == 3 and len(second) == 3
+    assert cache.metrics["hits"] == 1 and cache.metrics["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_booked_slot_is_not_offered_after_refresh():
+    slots = [slot_at(1), slot_at(2)]
+
+    async def fetcher(event_type_id):
+        return slots
+
+    cache = AvailabilityCache(fetcher, ttl_seconds=0, refresh_seconds=0)
+    await cache.refresh("42")
+    cache.mark_booked("42", slots[0]["time"])
+
+    assert await cache.offer("42") == [slots[1]]
+
+
+@pytest.mark.asyncio
+async def test_stale_slots_served_when_refresh_fails():
+    slots = [slot_at(1)]
+    failing = False
+
+    async def fetcher(event_type_id):
+        if failing:
+            raise httpx.ConnectError("down")
+        return slots
+
+    cache = AvailabilityCache(fetcher, ttl_seconds=0, refresh_seconds=0)
+    await cache.refresh("42")
+    failing = True
+
+    assert await cache.offer("42") == slots
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_calendar_service_uses_configured_event_type(monkeypatch):
+    monkeypatch.setattr(settings, "CAL_EVENT_TYPE_ID", "777")
+    monkeypatch.setattr(calendar_service, "BASE_URL", "https://api.cal.com")
+    calendar_service.AVAILABILITY.clear()
+    route = respx.get("https://api.cal.com/v1/slots").mock(
+        return_value=httpx.Response(200, json={"slots": {"day": [slot_at(3)]}})
+    )
+
+    slots = await calendar_service.get_available_slots_next_7_days()
+    await calendar_service.get_available_slots_next_7_days()
+
+    assert len(slots) == 1
+    assert route.call_count == 1
+    assert route.calls[0].request.url.params["eventTypeId"] == "777"
+    calendar_service.AVAILABILITY.clear()
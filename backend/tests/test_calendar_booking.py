@@ -0,0 +1,139 @@
+import asyncio
+import json
+import pytest
+import respx
+import httpx
+
+from config import settings
+from services import calendar_service
+
+BOOKINGS_URL = "https://api.cal.com/v2/bookings"
+SLOT = {"time": "2030-01-10T13:00:00Z"}
+LEAD = {"nome": "João", "email": "Joao@Acme.com", "empresa": "Acme", "necessidade": "CRM"}
+BOOKING = {"status": "success", "data": {"meetingUrl": "https://meet.google.com/abc"}}
+
+
+@pytest.fixture(autouse=True)
+def booking_settings(monkeypatch):
+    monkeypatch.setattr(calendar_service, "BASE_URL", "https://api.cal.com")
+    monkeypatch.setattr(settings, "CAL_BOOKING_BACKOFF_SECONDS", 0.001)
+    monkeypatch.setattr(settings, "CAL_BOOKING_MAX_ATTEMPTS", 4)
+    calendar_service.BOOKINGS.clear()
+    yield
+    calendar_service.BOOKINGS.clear()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_concurrent_duplicate_bookings_share_one_request():
+    async def slow_booking(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=BOOKING)
+
+    route = respx.post(BOOKINGS_URL).mock(side_effect=slow_booking)
+
+    results = await asyncio.gather(*[
+        calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1") for _ in range(5)
+    ])
+
+    assert route.call_count == 1
+    assert all(r == BOOKING for r in results)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_repeated_booking_returns_stored_outcome():
+    route = respx.post(BOOKINGS_URL).mock(return_value=httpx.Response(200, json=BOOKING))
+
+    first = await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1")
+    again = await calendar_service.schedule_meeting(SLOT, {**LEAD, "email": "joao@acme.com "}, session_id="s1")
+
+    assert first == again == BOOKING
+    assert route.call_count == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_retries_when_the_booking_was_not_processed():
+    lookup = respx.get(BOOKINGS_URL).mock(return_value=httpx.Response(200, json={"data": []}))
+    route = respx.post(BOOKINGS_URL).mock(side_effect=[
+        httpx.ConnectError("recusada"),
+        httpx.Response(429, json={"error": "rate"}),
+        httpx.Response(503, text="unavailable", headers={"Retry-After": "0"}),
+        httpx.Response(200, json=BOOKING),
+    ])
+
+    assert await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1") == BOOKING
+    assert route.call_count == 4
+    assert not lookup.called
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_ambiguous_failure_returns_booking_created_by_the_first_attempt():
+    existing = {"uid": "b1", "start": "2030-01-10T13:00:00.000Z", "status": "accepted", "meetingUrl": "https://meet.google.com/abc"}
+    lookup = respx.get(BOOKINGS_URL).mock(return_value=httpx.Response(200, json={"status": "success", "data": [existing]}))
+    route = respx.post(BOOKINGS_URL).mock(side_effect=httpx.ReadTimeout("sem resposta"))
+
+    result = await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1")
+
+    assert result == {"status": "success", "data": existing}
+    assert route.call_count == 1
+    assert lookup.calls.last.request.url.params["attendeeEmail"] == LEAD["email"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_ambiguous_failure_retries_only_after_confirming_no_booking():
+    cancelled = {"uid": "b0", "start": SLOT["time"], "status": "cancelled"}
+    respx.get(BOOKINGS_URL).mock(return_value=httpx.Response(200, json={"data": [cancelled]}))
+    route = respx.post(BOOKINGS_URL).mock(side_effect=[
+        httpx.Response(500, text="erro"),
+        httpx.Response(200, json=BOOKING),
+    ])
+
+    assert await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1") == BOOKING
+    assert route.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_ambiguous_failure_is_not_retried_when_lookup_fails():
+    respx.get(BOOKINGS_URL).mock(return_value=httpx.Response(502, text="bad gateway"))
+    route = respx.post(BOOKINGS_URL).mock(return_value=httpx.Response(503, text="unavailable"))
+
+    assert await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1") == {}
+    assert route.call_count == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_client_errors_are_not_retried_or_stored():
+    route = respx.post(BOOKINGS_URL).mock(return_value=httpx.Response(400, json={"error": "bad slot"}))
+
+    assert await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1") == {}
+    assert await calendar_service.schedule_meeting(SLOT, dict(LEAD), session_id="s1") == {}
+    assert route.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_slot_with_start_is_booked_and_slot_without_start_is_rejected():
+    route = respx.post(BOOKINGS_URL).mock(return_value=httpx.Response(200, json=BOOKING))
+
+    assert await calendar_service.schedule_meeting({"start": SLOT["time"]}, dict(LEAD), session_id="s1") == BOOKING
+    assert json.loads(route.calls.last.request.content)["start"] == SLOT["time"]
+    assert await calendar_service.schedule_meeting({}, dict(LEAD), session_id="s1") == {}
+    assert route.call_count == 1
+    assert ("s1", "", "joao@acme.com") not in calendar_service.BOOKINGS
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    monkeypatch.setattr(settings, "CAL_BOOKING_BACKOFF_SECONDS", 1.0)
+    monkeypatch.setattr(settings, "CAL_BOOKING_MAX_BACKOFF_SECONDS", 3.0)
+
+    delays = [calendar_service.backoff_delay(5) for _ in range(50)]
+
+    assert all(0 <= d <= 3.0 for d in delays)
+    assert len(set(delays)) > 1
+    assert calendar_service.backoff_delay(0, retry_after="2") == 2.0
@@ -1,7 +1,7 @@
 import pytest
 import respx
 import json
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
 from google.genai import types
@@ -10,10 +10,12 @@ import httpx
 import pytest_asyncio
 
 from app import app
+from routes import chat_routes
 from routes.chat_routes import router as chat_router 
 from services import ai_service, pipefy_service
 from config import settings 
 import services.calendar_service as calendar_service
+import utils.transcript_writer as transcript_writer
 
 @pytest.fixture(autouse=True)
 def setup_settings(monkeypatch):
@@ -24,6 +26,25 @@ def setup_settings(monkeypatch):
     monkeypatch.setattr(settings, "PIPEFY_TOKEN", "MOCKED_PIPEFY_TOKEN")
     monkeypatch.setattr(settings, "PIPEFY_PIPE_ID", 12345)
     monkeypatch.setattr(settings, "CALENDAR_API_KEY", "MOCKED_CALENDAR_KEY")
+    monkeypatch.setattr(settings, "LOCAL_EXTRACTION_ENABLED", False)
+    monkeypatch.setattr(chat_routes.response_cache, "stages", frozenset())
+    monkeypatch.setattr(calendar_service, "BASE_URL", "https://api.cal.com")
+    monkeypatch.setattr(pipefy_service, "PIPEFY_URL", "http://mocked-pipefy-api.com/graphql")
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    pipefy_service.CARD_ID_CACHE.clear()
+    calendar_service.AVAILABILITY.clear()
+    calendar_service.BOOKINGS.clear()
+    chat_routes.response_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def mock_db(monkeypatch):
+    monkeypatch.setattr(chat_routes, "create_session_db", AsyncMock())
+    monkeypatch.setattr(chat_routes, "update_session_lead_email", AsyncMock())
+    monkeypatch.setattr(transcript_writer, "add_message_db", AsyncMock())
 
 
 @pytest_asyncio.fixture
@@ -43,7 +64,7 @@ LEAD_DATA = {
 
 SLOT_TIME = (datetime.utcnow() + timedelta(days=2, hours=10)).isoformat()
 MOCKED_SLOTS = [
-    {"id": 1, "start": SLOT_TIME, "end": (datetime.utcnow() + timedelta(days=2, hours=11)).isoformat()},
+    {"id": 1, "time": SLOT_TIME, "end": (datetime.utcnow() + timedelta(days=2, hours=11)).isoformat()},
 ]
 
 PIPEFY_SUCCESS_RESPONSE = {
@@ -52,85 +73,269 @@ PIPEFY_SUCCESS_RESPONSE = {
 }
 
 
-def create_gemini_call_response(function_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-    return {
+def create_gemini_call_response(function_name: str, args: Dict[str, Any], *more_calls) -> types.GenerateContentResponse:
+    calls = [(function_name, args), *more_calls]
+    return types.GenerateContentResponse.model_validate({
         "candidates": [{
             "content": {
+                "role": "model",
                 "parts": [{
                     "function_call": {
-                        "name": function_name,
-                        "args": args
+                        "name": name,
+                        "args": call_args
                     }
-                }]
+                } for name, call_args in calls]
             }
         }]
-    }
+    })
 
-def create_gemini_text_response(text: str) -> Dict[str, Any]:
-    return {
+def create_gemini_text_response(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse.model_validate({
         "candidates": [{
             "content": {
+                "role": "model",
                 "parts": [{"text": text}]
             }
         }]
-    }
+    })
+
+def create_gemini_json_response(text: str, info: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    return {"reply": text, **({"info": info} if info else {})}
+
+
+def pipefy_handler(card_exists: bool):
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = request.content.decode()
+        if "findCards" in body:
+            edges = [{"node": {"id": "CARD-456", "fields": []}}] if card_exists else []
+            return httpx.Response(200, json={"data": {"findCards": {"edges": edges}}})
+        if "createCard" in body:
+            return httpx.Response(200, json={"data": {"createCard": {"card": {"id": "CARD-456", "title": LEAD_DATA['nome']}}}})
+        return httpx.Response(200, json={"data": {"updateCardField": {"card": {"id": "CARD-456", "title": LEAD_DATA['nome']}}}})
+    return handler
+
+
+async def start(ac_client: AsyncClient, mock_gemini) -> str:
+    mock_gemini.side_effect = [create_gemini_json_response("Olá! Sou a Selly-IA. Qual é o seu nome?")]
+    resp = await ac_client.post("/api/start-session")
+    assert resp.status_code == 200
+    return resp.json()["session_id"]
+
+
+async def advance_to_confirm_interest(ac_client: AsyncClient, mock_gemini, session_id: str):
+    steps = [
+        ("Meu nome é João", {"nome": LEAD_DATA["nome"]}),
+        (LEAD_DATA["email"], {"email": LEAD_DATA["email"]}),
+        ("Tech Solutions", {"empresa": LEAD_DATA["empresa"]}),
+        ("Gestão de equipes", {"necessidade": LEAD_DATA["necessidade"]}),
+        ("Em 30 dias", {"prazo": "30 dias"}),
+    ]
+    for message, info in steps:
+        mock_gemini.side_effect = [create_gemini_json_response("Próxima pergunta?", info)]
+        resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": message})
+        assert resp.status_code == 200
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_start_session_uses_greeting_pool(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(chat_routes.greeting_pool, "_pools", {})
+    mock_gemini.return_value = {"reply": "Olá! Qual é o seu nome?"}
+    await chat_routes.greeting_pool.fill(chat_routes.greeting_prompt())
+    mock_gemini.reset_mock()
+
+    resp = await ac_client.post("/api/start-session")
+
+    assert resp.json()["messages"] == "Olá! Qual é o seu nome?"
+    mock_gemini.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_session_document_is_created_on_first_user_message(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_LAZY_PERSISTENCE", True)
+    record = MagicMock()
+    monkeypatch.setattr(chat_routes.session_counter, "record", record)
+    session_id = await start(ac_client, mock_gemini)
+
+    chat_routes.create_session_db.assert_not_called()
+    transcript_writer.add_message_db.assert_not_called()
+    record.assert_called_once_with("started")
+
+    mock_gemini.side_effect = [create_gemini_json_response("Prazer, João! Qual o seu e-mail?", {"nome": "João"})]
+    await ac_client.post("/api/message", json={"session_id": session_id, "message": "Meu nome é João"})
+
+    chat_routes.create_session_db.assert_awaited_once_with(session_id=session_id, lead_email="")
+    roles = [c.args[1]["role"] for c in transcript_writer.add_message_db.await_args_list]
+    assert roles[:2] == ["assistant", "user"]
+    record.assert_called_with("engaged")
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_predictable_answers_are_handled_without_the_model(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_EXTRACTION_ENABLED", True)
+    session_id = await start(ac_client, mock_gemini)
+    mock_gemini.reset_mock()
+
+    replies = []
+    for text in ("Meu nome é João Silva", "joao.silva@acme.com", "Acme Tecnologia Ltda"):
+        resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": text})
+        replies.append(resp.json()["reply"])
+
+    mock_gemini.assert_not_called()
+    assert replies[0] == "Prazer, João! Qual é o seu e-mail para contato?"
+    assert "empresa" in replies[1]
+    session = await chat_routes.get_session(session_id)
+    assert session.stage == "ask_necessidade"
+    assert session.lead.email == "joao.silva@acme.com"
+    assert session.lead.empresa == "Acme Tecnologia Ltda"
+    chat_routes.update_session_lead_email.assert_awaited_with(session_id, "joao.silva@acme.com")
+
+    mock_gemini.side_effect = [create_gemini_json_response("Depende do escopo! Qual é a principal necessidade?", {})]
+    await ac_client.post("/api/message", json={"session_id": session_id, "message": "Qual o preço de vocês?"})
+    assert mock_gemini.call_count == 1
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_incomplete_local_extraction_is_left_to_the_model(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_EXTRACTION_ENABLED", True)
+    session_id = await start(ac_client, mock_gemini)
+
+    mock_gemini.side_effect = [create_gemini_json_response("Já te explico os preços! Qual é o seu e-mail?", {"nome": "Ana"})]
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "me chamo ana, e queria saber quanto custa?"})
+
+    assert resp.json()["reply"] == "Já te explico os preços! Qual é o seu e-mail?"
+    session = await chat_routes.get_session(session_id)
+    assert session.stage == "ask_email"
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_repeated_non_answer_is_served_from_response_cache(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(chat_routes.response_cache, "stages", frozenset({"initial"}))
+    first = await start(ac_client, mock_gemini)
+    second = await start(ac_client, mock_gemini)
+    mock_gemini.reset_mock()
+
+    mock_gemini.side_effect = [create_gemini_json_response("Somos a Selly! Antes, qual é o seu nome?")]
+    resp1 = await ac_client.post("/api/message", json={"session_id": first, "message": "Quem é você?"})
+    resp2 = await ac_client.post("/api/message", json={"session_id": second, "message": "quem e voce"})
+
+    assert resp1.json()["reply"] == resp2.json()["reply"] == "Somos a Selly! Antes, qual é o seu nome?"
+    assert mock_gemini.call_count == 1
+    assert chat_routes.response_cache.stats()["hits"] >= 1
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_json_stage_turn_makes_one_model_call(mock_gemini, ac_client: AsyncClient):
+    session_id = await start(ac_client, mock_gemini)
+    mock_gemini.reset_mock()
+
+    mock_gemini.side_effect = [create_gemini_json_response("Prazer, João! Qual o seu e-mail?", {"nome": "João"})]
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Meu nome é João"})
+
+    assert resp.json() == {"reply": "Prazer, João! Qual o seu e-mail?", "actions": []}
+    assert mock_gemini.call_count == 1
+    assert mock_gemini.call_args.kwargs["functions"] is None
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_function_stage_without_tool_makes_one_model_call(mock_gemini, ac_client: AsyncClient):
+    session_id = await start(ac_client, mock_gemini)
+    await advance_to_confirm_interest(ac_client, mock_gemini, session_id)
+    mock_gemini.reset_mock()
+
+    mock_gemini.side_effect = [create_gemini_text_response("Posso agendar uma reunião com você?")]
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Como funciona?"})
+
+    assert resp.json()["reply"] == "Posso agendar uma reunião com você?"
+    assert mock_gemini.call_count == 1
+    assert mock_gemini.call_args.kwargs["functions"] is not None
+
 
 @pytest.mark.asyncio
 @patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
 @respx.mock
-async def test_full_agent_flow(mock_gemini, ac_client: AsyncClient):
+async def test_confirmation_runs_tools_with_one_extra_model_call(mock_gemini, ac_client: AsyncClient):
+    session_id = await start(ac_client, mock_gemini)
+    await advance_to_confirm_interest(ac_client, mock_gemini, session_id)
+    mock_gemini.reset_mock()
 
-    start_resp = await ac_client.post("/api/start-session")
-    assert start_resp.status_code == 200
-    session_id = start_resp.json()["session_id"]
-    
-    mock_gemini.side_effect = [
-        create_gemini_text_response("Olá! Sou o agente de pré-vendas. Qual o seu nome e empresa?"),
-    ]
-    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Olá! Meu nome é João e sou da Tech Solutions."})
-    print("\nFirst Message Response:", resp.json())
-    assert "Qual o seu nome e empresa?" in resp.json()["reply"]
+    respx.post("http://mocked-pipefy-api.com/graphql").mock(side_effect=pipefy_handler(card_exists=False))
+    respx.get("https://api.cal.com/v1/slots").mock(return_value=httpx.Response(200, json={"slots": MOCKED_SLOTS}))
 
     mock_gemini.side_effect = [
-        create_gemini_text_response("Perfeito, João. Qual o seu melhor email e qual a sua principal necessidade hoje?"),
+        create_gemini_call_response(
+            "create_or_update_card_pipefy", {"lead": LEAD_DATA},
+            ("get_available_slots_next_7_days", {}),
+        ),
+        create_gemini_text_response(f"Tenho este horário: {SLOT_TIME}. Pode ser?"),
     ]
-    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": f"Meu email é {LEAD_DATA['email']} e preciso de um software de gestão de equipes."})
-    assert "qual a sua principal necessidade hoje?" in resp.json()["reply"]
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Sim, quero agendar!"})
 
+    body = resp.json()
+    assert body["reply"] == f"Tenho este horário: {SLOT_TIME}. Pode ser?"
+    assert [a["action"] for a in body["actions"]] == ["create_or_update_card_pipefy", "get_available_slots_next_7_days"]
+    assert mock_gemini.call_count == 2
 
-    mock_gemini.side_effect = [
-        create_gemini_call_response("create_or_update_card_pipefy", {"lead": LEAD_DATA}),
-        
-        create_gemini_text_response("Obrigado, João. Seus dados foram registrados com sucesso no nosso sistema. Gostaria de agendar uma demonstração?"),
-    ]
-    
-    pipefy_no_card_route = respx.post("http://mocked-pipefy-api.com/graphql").mock(
-        side_effect=[
-            httpx.Response(200, json={"data": {"findCards": {"edges": []}}}),
-            httpx.Response(200, json={"data": {"createCard": {"card": {"id": "CARD-456", "title": LEAD_DATA['nome']}}}}),
-        ]
-    )
+    follow_up = mock_gemini.call_args_list[1].kwargs["extra_contents"]
+    assert follow_up[0].role == "model"
+    responses = [part.function_response for part in follow_up[1].parts]
+    assert [r.name for r in responses] == ["create_or_update_card_pipefy", "get_available_slots_next_7_days"]
+    assert responses[1].response == {"available_slots": MOCKED_SLOTS}
 
-    pipefy_service.PIPEFY_URL = "http://mocked-pipefy-api.com/graphql"
 
-    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Sim, tenho muito interesse!"})
-    
-    assert "Gostaria de agendar uma demonstração?" in resp.json()["reply"]
-    assert any(a['action'] == 'create_or_update_card_pipefy' for a in resp.json()["actions"])
-    
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_final_call_after_tool_rounds_cannot_call_tools(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    session_id = await start(ac_client, mock_gemini)
+    await advance_to_confirm_interest(ac_client, mock_gemini, session_id)
+    monkeypatch.setattr(calendar_service, "get_available_slots_next_7_days", AsyncMock(return_value=MOCKED_SLOTS))
+
+    # O modelo insiste em chamar ferramentas enquanto elas estiverem liberadas.
+    async def fake_chat(**kwargs):
+        if kwargs.get("tool_calls", True):
+            return create_gemini_call_response("get_available_slots_next_7_days", {})
+        return create_gemini_text_response("Tenho estes horários. Qual prefere?")
+    mock_gemini.side_effect = fake_chat
+    mock_gemini.reset_mock()
+
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Sim, quero agendar"})
+
+    assert resp.json()["reply"] == "Tenho estes horários. Qual prefere?"
+    assert mock_gemini.call_count == settings.AI_MAX_TOOL_ROUNDS + 1
+    assert mock_gemini.call_args.kwargs["tool_calls"] is False
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+@respx.mock
+async def test_full_agent_flow(mock_gemini, ac_client: AsyncClient):
+
+    session_id = await start(ac_client, mock_gemini)
+    await advance_to_confirm_interest(ac_client, mock_gemini, session_id)
+
     mock_gemini.side_effect = [
-        create_gemini_call_response("get_available_slots_next_7_days", {}),
-        
+        create_gemini_call_response(
+            "create_or_update_card_pipefy", {"lead": LEAD_DATA},
+            ("get_available_slots_next_7_days", {}),
+        ),
         create_gemini_text_response(f"Tenho estes horários: {SLOT_TIME}, amanhã às 14h, ou depois de amanhã às 15h. Qual prefere?"),
     ]
     
+    respx.post("http://mocked-pipefy-api.com/graphql").mock(side_effect=pipefy_handler(card_exists=False))
     calendar_slots_route = respx.get("https://api.cal.com/v1/slots").mock(
         return_value=httpx.Response(200, json={"slots": MOCKED_SLOTS})
     )
-    
-    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Sim, quais são os horários disponíveis?"})
 
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Sim, tenho muito interesse!"})
+    
     assert "Qual prefere?" in resp.json()["reply"]
+    assert any(a['action'] == 'create_or_update_card_pipefy' for a in resp.json()["actions"])
     assert any(a['action'] == 'get_available_slots_next_7_days' for a in resp.json()["actions"])
     
     mock_gemini.side_effect = [
@@ -139,16 +344,11 @@ async def test_full_agent_flow(mock_gemini, ac_client: AsyncClient):
         create_gemini_text_response(f"Ótimo! Sua reunião foi agendada para {SLOT_TIME}. Você receberá um convite por e-mail."),
     ]
     
-    calendar_booking_route = respx.post("https://api.cal.com/v1/bookings").mock(
-        return_value=httpx.Response(200, json={"join_url": "https://meet.link/abc", "start_time": SLOT_TIME})
+    calendar_booking_route = respx.post("https://api.cal.com/v2/bookings").mock(
+        return_value=httpx.Response(200, json={"data": {"meetingUrl": "https://meet.link/abc", "start": SLOT_TIME}})
     )
 
-    pipefy_update_route = respx.post("http://mocked-pipefy-api.com/graphql").mock(
-        side_effect=[
-            httpx.Response(200, json={"data": {"findCards": {"edges": [{"node": {"id": "CARD-456", "fields": []}}]}}}),
-            httpx.Response(200, json={"data": {"updateCardField": {"card": {"id": "CARD-456", "title": LEAD_DATA['nome']}}}}),
-        ]
-    )
+    respx.post("http://mocked-pipefy-api.com/graphql").mock(side_effect=pipefy_handler(card_exists=True))
 
     resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": f"Eu escolho o horário de {SLOT_TIME}"})
     
@@ -157,4 +357,112 @@ async def test_full_agent_flow(mock_gemini, ac_client: AsyncClient):
 
     assert calendar_slots_route.called
     assert calendar_booking_route.called
-    assert mock_gemini.call_count == 8
\ No newline at end of file
+    # Saudação do template (pool vazio), 5 etapas em modo JSON + 2 chamadas por turno com ferramentas
+    assert mock_gemini.call_count == 9
+
+
+def stream_of(*responses):
+    batches = list(responses)
+
+    def fake_stream(**kwargs):
+        fake_stream.calls.append(kwargs)
+        chunks = batches.pop(0)
+
+        async def gen():
+            for chunk in chunks:
+                yield chunk
+        return gen()
+
+    fake_stream.calls = []
+    return fake_stream
+
+
+def parse_sse(body: str) -> List[tuple]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_stream_json_stage_emits_reply_tokens(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    session_id = await start(ac_client, mock_gemini)
+    raw = json.dumps({"reply": "Prazer, João! Qual o seu e-mail?", "info": {"nome": "João"}}, ensure_ascii=False)
+    chunks = [create_gemini_text_response(raw[i:i + 7]) for i in range(0, len(raw), 7)]
+    monkeypatch.setattr(ai_service, "stream_chat_with_ai", stream_of(chunks))
+
+    resp = await ac_client.post("/api/message/stream", json={"session_id": session_id, "message": "Meu nome é João"})
+
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(resp.text)
+    tokens = [data["text"] for event, data in events if event == "token"]
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Prazer, João! Qual o seu e-mail?"
+    assert events[-1] == ("done", {"reply": "Prazer, João! Qual o seu e-mail?", "actions": []})
+
+    session = await chat_routes.get_session(session_id)
+    assert session.stage == "ask_email"
+    assert session.messages[-1].content == "Prazer, João! Qual o seu e-mail?"
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_stream_emits_action_events(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    session_id = await start(ac_client, mock_gemini)
+    await advance_to_confirm_interest(ac_client, mock_gemini, session_id)
+    monkeypatch.setattr(calendar_service, "get_available_slots_next_7_days", AsyncMock(return_value=MOCKED_SLOTS))
+    fake_stream = stream_of(
+        [create_gemini_call_response("get_available_slots_next_7_days", {})],
+        [create_gemini_text_response("Tenho estes "), create_gemini_text_response("horários. Qual prefere?")],
+    )
+    monkeypatch.setattr(ai_service, "stream_chat_with_ai", fake_stream)
+
+    resp = await ac_client.post("/api/message/stream", json={"session_id": session_id, "message": "Sim, quero agendar"})
+
+    events = parse_sse(resp.text)
+    assert [event for event, _ in events] == ["slots_offered", "token", "token", "done"]
+    assert events[0][1] == MOCKED_SLOTS
+    assert events[-1][1]["reply"] == "Tenho estes horários. Qual prefere?"
+    assert len(fake_stream.calls) == 2
+    assert fake_stream.calls[1]["extra_contents"][1].parts[0].function_response.name == "get_available_slots_next_7_days"
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_stream_final_round_disables_tool_calls(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    session_id = await start(ac_client, mock_gemini)
+    await advance_to_confirm_interest(ac_client, mock_gemini, session_id)
+    monkeypatch.setattr(calendar_service, "get_available_slots_next_7_days", AsyncMock(return_value=MOCKED_SLOTS))
+    fake_stream = stream_of(
+        [create_gemini_call_response("get_available_slots_next_7_days", {})],
+        [create_gemini_text_response("Tenho estes horários. Qual prefere?")],
+    )
+    monkeypatch.setattr(ai_service, "stream_chat_with_ai", fake_stream)
+
+    resp = await ac_client.post("/api/message/stream", json={"session_id": session_id, "message": "Sim, quero agendar"})
+
+    assert parse_sse(resp.text)[-1][1]["reply"] == "Tenho estes horários. Qual prefere?"
+    assert [call["tool_calls"] for call in fake_stream.calls] == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_stream_unknown_session_returns_404(ac_client: AsyncClient):
+    resp = await ac_client.post("/api/message/stream", json={"session_id": "missing", "message": "Oi"})
+    assert resp.status_code == 404
+
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, 'chat_with_ai', new_callable=AsyncMock)
+async def test_concurrent_session_write_returns_conflict(mock_gemini, ac_client: AsyncClient, monkeypatch):
+    session_id = await start(ac_client, mock_gemini)
+    monkeypatch.setattr(chat_routes, "add_message", AsyncMock(side_effect=chat_routes.SessionConflictError("s")))
+
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Oi"})
+    stream = await ac_client.post("/api/message/stream", json={"session_id": session_id, "message": "Oi"})
+
+    assert resp.status_code == 409
+    assert stream.status_code == 409
+    mock_gemini.assert_not_awaited()
\ No newline at end of file
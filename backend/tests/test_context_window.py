@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from models.lead import Lead
+from models.session import Message, Role, Session
+from utils.context_window import build_context, estimate_tokens
+
+
+def make_session(messages) -> Session:
+    return Session(
+        created_at=datetime.utcnow(),
+        expires_at=datetime.utcnow() + timedelta(minutes=30),
+        stage="completed",
+        lead=Lead(nome="João", email="joao@acme.com", empresa="Acme"),
+        messages=messages,
+    )
+
+
+def test_short_history_is_sent_verbatim():
+    messages = [Message(Role.USER, "Olá"), Message(Role.ASSISTANT, "Qual o seu nome?")]
+    assert build_context(make_session(messages), recent_messages=10, max_tokens=1000, action_result_chars=100) == messages
+
+
+def test_older_turns_become_lead_summary():
+    messages = [Message(Role.USER, f"mensagem {i}") for i in range(20)]
+    messages.insert(2, Message(Role.ASSISTANT, "Action: create_or_update_card_pipefy, Result: {'card': {'id': '1'}}"))
+    context = build_context(make_session(messages), recent_messages=4, max_tokens=1000, action_result_chars=100)
+
+    assert len(context) == 5
+    assert context[1:] == messages[-4:]
+    summary = context[0].content
+    assert "Etapa atual: completed" in summary
+    assert "- email: joao@acme.com" in summary
+    assert "create_or_update_card_pipefy" in summary
+
+
+def test_action_results_are_truncated():
+    raw = "Action: get_available_slots_next_7_days, Result: " + "x" * 500
+    context = build_context(make_session([Message(Role.ASSISTANT, raw)]), recent_messages=4, max_tokens=1000, action_result_chars=50)
+    assert len(context[0].content) < 120
+    assert context[0].content.startswith("Action: get_available_slots_next_7_days, Result: ")
+
+
+def test_context_stays_under_token_cap_as_conversation_grows():
+    for turns in (10, 100, 1000):
+        messages = [Message(Role.USER, "uma mensagem razoavelmente longa " * 10) for _ in range(turns)]
+        context = build_context(make_session(messages), recent_messages=50, max_tokens=500, action_result_chars=100)
+        assert sum(estimate_tokens(m.content) for m in context) <= 500
+        assert context[-1] == messages[-1]
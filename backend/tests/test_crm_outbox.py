@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from unittest.mock import AsyncMock
+from mongomock_motor import AsyncMongoMockClient
+from services import crm_outbox as outbox_module, tool_executor
+from services.crm_outbox import CrmOutbox, DONE, FAILED, PENDING, PROCESSING
+from services.tool_executor import execute_tool_calls
+
+
+def make_outbox() -> CrmOutbox:
+    return CrmOutbox(workers=2, poll_interval_ms=10, max_attempts=2, backoff_seconds=0, max_backoff_seconds=0, lease_seconds=60)
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(outbox_module, "get_database", lambda: db)
+    monkeypatch.setattr(outbox_module, "set_pipefy_card_id", AsyncMock())
+    return make_outbox()
+
+
+@pytest.mark.asyncio
+async def test_pending_jobs_for_same_email_are_coalesced(outbox, monkeypatch):
+    upsert = AsyncMock(return_value={"card": {"id": "c1"}})
+    monkeypatch.setattr(outbox_module.pipefy_service, "create_or_update_card_pipefy", upsert)
+
+    first = await outbox.enqueue({"email": "joao@acme.com", "nome": "João"}, "s1")
+    await outbox.enqueue({"email": "JOAO@acme.com", "empresa": "Acme"}, "s1")
+    await outbox.enqueue({"email": "maria@acme.com", "nome": "Maria"}, "s2")
+
+    jobs = await outbox.claim()
+    await outbox.process(jobs)
+
+    assert len(jobs) == 2
+    upsert.assert_awaited_once()
+    assert upsert.await_args.kwargs["lead"] == {"email": "JOAO@acme.com", "nome": "João", "empresa": "Acme"}
+    assert (await outbox.get_job(first))["status"] == DONE
+    assert (await outbox.status_counts())[PENDING] == 1
+    outbox_module.set_pipefy_card_id.assert_awaited_once_with("s1", "c1")
+
+
+@pytest.mark.asyncio
+async def test_failed_upsert_is_retried_then_marked_failed(outbox, monkeypatch):
+    monkeypatch.setattr(outbox_module.pipefy_service, "create_or_update_card_pipefy", AsyncMock(return_value={"error": "pipefy fora"}))
+    job_id = await outbox.enqueue({"email": "joao@acme.com"}, "s1")
+
+    await outbox.process(await outbox.claim())
+    job = await outbox.get_job(job_id)
+    assert job["status"] == PENDING and job["attempts"] == 1 and job["last_error"] == "pipefy fora"
+
+    await outbox.process(await outbox.claim())
+    assert (await outbox.get_job(job_id))["status"] == FAILED
+
+
+@pytest.mark.asyncio
+async def test_field_errors_in_update_results_are_retried(outbox, monkeypatch):
+    result = {"message": "Processo concluído", "results": [{"field_id": "nome", "status": "ok"}, {"field_id": "empresa", "error": [{"message": "inválido"}]}], "card": {"id": "c1"}}
+    monkeypatch.setattr(outbox_module.pipefy_service, "create_or_update_card_pipefy", AsyncMock(return_value=result))
+    job_id = await outbox.enqueue({"email": "joao@acme.com"}, "s1")
+
+    await outbox.process(await outbox.claim())
+
+    job = await outbox.get_job(job_id)
+    assert job["status"] == PENDING and job["attempts"] == 1
+    assert "empresa" in job["last_error"]
+    outbox_module.set_pipefy_card_id.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_email_lease_is_shared_between_processes(outbox, monkeypatch):
+    monkeypatch.setattr(outbox_module.pipefy_service, "create_or_update_card_pipefy", AsyncMock(return_value={"card": {"id": "c1"}}))
+    other_process = make_outbox()
+    await outbox.enqueue({"email": "joao@acme.com"}, "s1")
+    jobs = await outbox.claim()
+
+    # Um novo job do mesmo e-mail não pode ir para outro processo enquanto o lease estiver vigente.
+    late_job = await other_process.enqueue({"email": "joao@acme.com", "empresa": "Acme"}, "s1")
+    await other_process.enqueue({"email": "maria@acme.com"}, "s2")
+    other_jobs = await other_process.claim()
+    assert [job["email"] for job in other_jobs] == ["maria@acme.com"]
+
+    await outbox.process(jobs)
+    assert [job["_id"] for job in await other_process.claim()] == [late_job]
+
+
+@pytest.mark.asyncio
+async def test_stale_processing_jobs_are_reclaimed(outbox, monkeypatch):
+    job_id = await outbox.enqueue({"email": "joao@acme.com"}, "s1")
+    await outbox.claim()
+    assert await outbox.claim() == []
+
+    # Worker morreu no meio do upsert: depois do lease o job volta para a fila sem reiniciar o processo.
+    await outbox.collection.update_one({"_id": job_id}, {"$set": {"claimed_at": datetime.utcnow() - timedelta(seconds=120)}})
+    await outbox.leases.delete_many({})
+    outbox._active.clear()
+    jobs = await outbox.claim()
+    assert [job["_id"] for job in jobs] == [job_id]
+    assert jobs[0]["status"] == PROCESSING
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_session_and_database_errors(outbox, monkeypatch):
+    monkeypatch.setattr(outbox_module.pipefy_service, "create_or_update_card_pipefy", AsyncMock(return_value={"card": {"id": "c1"}}))
+    monkeypatch.setattr(outbox_module, "set_pipefy_card_id", AsyncMock(side_effect=RuntimeError("conflito")))
+    process = outbox.process
+    calls = 0
+
+    async def flaky_process(jobs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("mongo fora")
+        await process(jobs)
+
+    monkeypatch.setattr(outbox, "process", flaky_process)
+    first = await outbox.enqueue({"email": "joao@acme.com"}, "s1")
+    second = await outbox.enqueue({"email": "maria@acme.com"}, "s2")
+    await outbox.start()
+    try:
+        for _ in range(50):
+            if (await outbox.get_job(second))["status"] == DONE:
+                break
+            await asyncio.sleep(0.02)
+        assert (await outbox.get_job(second))["status"] == DONE
+        assert all(not task.done() for task in outbox._tasks)
+        assert (await outbox.get_job(first))["status"] == PROCESSING
+    finally:
+        await outbox.stop()
+
+
+@pytest.mark.asyncio
+async def test_workers_drain_outbox_and_tool_call_returns_immediately(outbox, monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_upsert(client, lead):
+        await release.wait()
+        return {"card": {"id": "c1"}}
+
+    monkeypatch.setattr(outbox_module.pipefy_service, "create_or_update_card_pipefy", slow_upsert)
+    monkeypatch.setattr(tool_executor, "crm_outbox", outbox)
+    await outbox.start()
+    try:
+        results = await asyncio.wait_for(
+            execute_tool_calls([("create_or_update_card_pipefy", {"lead": {"email": "joao@acme.com"}})], session_id="s1"),
+            timeout=1.0,
+        )
+        job_id = results[0][0]["job_id"]
+        assert results[0][0]["status"] == "enfileirado"
+        # O upsert só termina depois que a ferramenta já respondeu.
+        assert (await outbox.get_job(job_id))["status"] != DONE
+        release.set()
+
+        for _ in range(50):
+            if (await outbox.get_job(job_id))["status"] == DONE:
+                break
+            await asyncio.sleep(0.02)
+        assert (await outbox.get_job(job_id))["card_id"] == "c1"
+    finally:
+        await outbox.stop()
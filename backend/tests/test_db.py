@@ -0,0 +1,134 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from models import db
+
+
+@pytest.fixture(autouse=True)
+def reset_client():
+    db.close_motor_client()
+    yield
+    db.close_motor_client()
+
+
+def test_motor_client_is_shared():
+    client = db.init_motor_client()
+    assert db.init_motor_client() is client
+    assert db.get_database().client is client
+
+
+def test_motor_client_uses_pool_settings():
+    client = db.init_motor_client()
+    assert client.options.pool_options.max_pool_size == db.settings.MONGODB_MAX_POOL_SIZE
+    assert client.options.server_selection_timeout == db.settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS / 1000
+
+
+def test_close_motor_client_resets_pool():
+    client = db.init_motor_client()
+    db.close_motor_client()
+    assert db.init_motor_client() is not client
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(db, "get_database", lambda: database)
+    monkeypatch.setattr(db.settings, "TRANSCRIPT_BUCKET_SIZE", 3)
+    return database
+
+
+def msg(i: int) -> dict:
+    return {"role": "user", "content": f"m{i}"}
+
+
+@pytest.mark.asyncio
+async def test_messages_are_stored_in_fixed_size_buckets(mongo_db):
+    await db.create_session_db("s1", "")
+    for i in range(4):
+        await db.add_message_db("s1", msg(i))
+    await db.add_messages_bulk_db({"s1": [msg(4), msg(5), msg(6)], "s2": [msg(0)]})
+
+    buckets = await mongo_db.session_messages.find({"session_id": "s1"}).sort("bucket", 1).to_list(None)
+    assert [b["count"] for b in buckets] == [3, 3, 1]
+    assert [m["seq"] for m in buckets[1]["messages"]] == [3, 4, 5]
+    session = await mongo_db.sessions.find_one({"session_id": "s1"})
+    assert session["message_count"] == 7
+    assert "messages" not in session
+
+
+@pytest.mark.asyncio
+async def test_get_session_db_reads_pages_and_tail(mongo_db):
+    await db.create_session_db("s1", "a@b.com")
+    await db.add_messages_bulk_db({"s1": [msg(i) for i in range(8)]})
+
+    full = await db.get_session_db("s1")
+    page = await db.get_session_db("s1", offset=2, limit=3)
+    tail = await db.get_session_db("s1", limit=2, tail=True)
+
+    assert [m["content"] for m in full["messages"]] == [f"m{i}" for i in range(8)]
+    assert [m["content"] for m in page["messages"]] == ["m2", "m3", "m4"]
+    assert [m["content"] for m in tail["messages"]] == ["m6", "m7"]
+    assert tail["message_count"] == 8
+    assert tail["lead_email"] == "a@b.com"
+    assert await db.get_session_db("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_get_session_db_reads_legacy_message_array(mongo_db):
+    await mongo_db.sessions.insert_one({"session_id": "old", "messages": [msg(i) for i in range(5)]})
+
+    tail = await db.get_session_db("old", limit=2, tail=True)
+
+    assert [m["content"] for m in tail["messages"]] == ["m3", "m4"]
+    assert tail["message_count"] == 5
+
+
+@pytest.mark.asyncio
+async def test_new_messages_on_legacy_session_keep_the_old_transcript(mongo_db):
+    await mongo_db.sessions.insert_one({"session_id": "old", "messages": [msg(i) for i in range(5)]})
+
+    await db.add_message_db("old", msg(5))
+    await db.add_messages_bulk_db({"old": [msg(6), msg(7)]})
+
+    full = await db.get_session_db("old")
+    assert [m["content"] for m in full["messages"]] == [f"m{i}" for i in range(8)]
+    assert [m["seq"] for m in full["messages"]] == list(range(8))
+    assert full["message_count"] == 8
+    page = await db.get_session_db("old", offset=3, limit=4)
+    assert [m["content"] for m in page["messages"]] == ["m3", "m4", "m5", "m6"]
+    buckets = await mongo_db.session_messages.find({"session_id": "old"}).to_list(None)
+    assert sorted(m["seq"] for b in buckets for m in b["messages"]) == [5, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_first_message_without_session_document_starts_at_zero(mongo_db):
+    await db.add_message_db("fresh", msg(0))
+
+    doc = await db.get_session_db("fresh")
+    assert [m["seq"] for m in doc["messages"]] == [0]
+
+
+@pytest.mark.asyncio
+async def test_bulk_write_reports_failures_per_session_and_retry_keeps_seqs(mongo_db, monkeypatch):
+    collection_type = type(mongo_db.session_messages)
+    update_one = collection_type.update_one
+    failing = {"bucket": 1}
+
+    async def flaky_update_one(self, filter, *args, **kwargs):
+        if filter.get("session_id") == "s1" and filter.get("bucket") == failing.get("bucket"):
+            failing.clear()
+            raise RuntimeError("timeout")
+        return await update_one(self, filter, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "update_one", flaky_update_one)
+    await db.create_session_db("s1", "")
+
+    failures = await db.add_messages_bulk_db({"s1": [msg(i) for i in range(5)], "s2": [msg(0)]})
+
+    assert list(failures) == ["s1"]
+    assert [(m["content"], m["seq"]) for m in failures["s1"].pending] == [("m3", 3), ("m4", 4)]
+    assert (await db.get_session_db("s2"))["message_count"] == 1
+
+    assert await db.add_messages_bulk_db({"s1": failures["s1"].pending + [msg(5)]}) == {}
+    full = await db.get_session_db("s1")
+    assert [m["content"] for m in full["messages"]] == [f"m{i}" for i in range(6)]
+    assert [m["seq"] for m in full["messages"]] == list(range(6))
\ No newline at end of file
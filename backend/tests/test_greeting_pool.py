@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from config import settings
+from services import greeting_pool as greeting_module
+from services.greeting_pool import GreetingPool, greeting_key
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    replies = iter(f"Olá {i}! Qual é o seu nome?" for i in range(100))
+    mock = AsyncMock(side_effect=lambda **kwargs: {"reply": next(replies)})
+    monkeypatch.setattr(greeting_module.ai_service, "chat_with_ai", mock)
+    return mock
+
+
+def test_key_changes_with_prompt_and_model():
+    assert greeting_key("p", "m1") == greeting_key("p", "m1")
+    assert greeting_key("p", "m1") != greeting_key("p", "m2")
+    assert greeting_key("p", "m1") != greeting_key("q", "m1")
+
+
+@pytest.mark.asyncio
+async def test_warm_pool_serves_greetings_without_model_calls(chat):
+    pool = GreetingPool(size=4, refresh_seconds=3600)
+    await pool.fill("prompt")
+    chat.reset_mock()
+
+    greetings = {await pool.get("prompt") for _ in range(50)}
+
+    chat.assert_not_called()
+    assert len(greetings) > 1
+    assert greetings <= {f"Olá {i}! Qual é o seu nome?" for i in range(4)}
+    assert pool.metrics["hits"] == 50
+
+
+@pytest.mark.asyncio
+async def test_model_change_invalidates_pool_and_refills_in_background(chat, monkeypatch):
+    pool = GreetingPool(size=3, refresh_seconds=3600)
+    pool.start("prompt")
+    for _ in range(20):
+        if pool.pick("prompt"):
+            break
+        await asyncio.sleep(0.01)
+    assert pool.pick("prompt")
+
+    monkeypatch.setattr(settings, "AI_MODEL", "outro-modelo")
+    assert pool.pick("prompt") is None
+
+    chat.reset_mock()
+    assert await pool.get("prompt") == greeting_module.FALLBACK_GREETING
+    await pool._filling
+    assert chat.call_count == 3
+    assert pool.pick("prompt")
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_pool_miss_returns_template_without_waiting_for_the_model(chat):
+    pool = GreetingPool(size=2, refresh_seconds=3600)
+
+    assert await pool.get("prompt") == greeting_module.FALLBACK_GREETING
+    chat.assert_not_called()
+    assert pool.metrics["fallbacks"] == 1
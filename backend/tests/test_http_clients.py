@@ -0,0 +1,42 @@
+import pytest
+import pytest_asyncio
+import respx
+import httpx
+from services import http_clients, pipefy_service, calendar_service
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def reset_clients():
+    await http_clients.close_http_clients()
+    yield
+    await http_clients.close_http_clients()
+
+
+@pytest.mark.asyncio
+async def test_one_pooled_client_per_integration():
+    http_clients.init_http_clients()
+    pipefy = http_clients.get_http_client("pipefy")
+    assert http_clients.get_http_client("pipefy") is pipefy
+    assert http_clients.get_http_client("calendar") is not pipefy
+    assert pipefy.timeout.connect == http_clients.settings.HTTP_CONNECT_TIMEOUT_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_closed_client_is_recreated():
+    client = http_clients.get_http_client("calendar")
+    await http_clients.close_http_clients()
+    assert client.is_closed
+    assert http_clients.get_http_client("calendar") is not client
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_integrations_reuse_the_shared_client(monkeypatch):
+    monkeypatch.setattr(calendar_service, "BASE_URL", "https://api.cal.com")
+    respx.get("https://api.cal.com/v1/slots").mock(return_value=httpx.Response(200, json={"slots": []}))
+    respx.post(pipefy_service.PIPEFY_URL).mock(return_value=httpx.Response(200, json={"data": {"findCards": {"edges": []}, "createCard": {"card": {"id": "1"}}}}))
+
+    await calendar_service.get_available_slots_next_7_days()
+    await pipefy_service.create_or_update_card_pipefy(client=None, lead={"email": "a@b.com", "nome": "A"})
+
+    assert set(http_clients._clients) == {"calendar", "pipefy"}
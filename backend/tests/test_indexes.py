@@ -0,0 +1,151 @@
+import pytest
+import pytest_asyncio
+from mongomock_motor import AsyncMongoMockClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from config import settings
+from models import indexes
+from models.indexes import bootstrap_indexes, index_specs, plan_index_changes
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(indexes, "get_database", lambda: db)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_creates_session_indexes(mongo_db):
+    report = await bootstrap_indexes()
+
+    sessions = await mongo_db.sessions.index_information()
+    assert sessions["session_id_unique"]["unique"] is True
+    assert sessions["lead_email"]["key"] == [("lead_email", 1)]
+    assert sessions["updated_at_ttl"]["expireAfterSeconds"] == settings.SESSION_TIMEOUT * 60 + settings.SESSION_RETENTION_SECONDS
+    assert "session_messages.session_bucket" in report["created"]
+    assert await bootstrap_indexes() == {"created": [], "dropped": [], "ttl_updated": []}
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_repairs_drifted_indexes(mongo_db):
+    await mongo_db.sessions.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=60)
+    await mongo_db.sessions.create_index("session_id")
+    await mongo_db.sessions.create_index("lead_email", name="lead_email", unique=True)
+
+    report = await bootstrap_indexes()
+
+    existing = await mongo_db.sessions.index_information()
+    assert "expires_at_ttl" not in existing
+    assert "session_id_1" not in existing
+    assert existing["session_id_unique"]["unique"] is True
+    assert not existing["lead_email"].get("unique")
+    assert set(report["dropped"]) == {"sessions.expires_at_ttl", "sessions.session_id_1", "sessions.lead_email"}
+
+
+def test_ttl_change_is_applied_in_place():
+    specs = [s for s in index_specs() if s.collection == "sessions"]
+    ttl = next(s for s in specs if s.name == "updated_at_ttl")
+    existing = {
+        "_id_": {"key": [("_id", 1)]},
+        "session_id_unique": {"key": [("session_id", 1)], "unique": True},
+        "lead_email": {"key": [("lead_email", 1)]},
+        "updated_at_ttl": {"key": [("updated_at", 1)], "expireAfterSeconds": 60},
+    }
+
+    assert plan_index_changes("sessions", existing, specs) == [("ttl", ttl)]
+
+
+# Consultas quentes de models/db.py e do MongoSessionStore; o explain exige um mongod real (mongomock não tem explain).
+HOT_QUERIES = {
+    "sessions.find(session_id)": ({"find": "sessions", "filter": {"session_id": "s1"}}, "session_id_unique"),
+    "sessions.update(session_id)": (
+        {"update": "sessions", "updates": [{"q": {"session_id": "s1"}, "u": {"$set": {"lead_email": "a@b.com"}}}]},
+        "session_id_unique",
+    ),
+    "sessions.findAndModify(session_id)": (
+        {"findAndModify": "sessions", "query": {"session_id": "s1"}, "update": {"$inc": {"message_count": 1}}},
+        "session_id_unique",
+    ),
+    "sessions.find(lead_email)": ({"find": "sessions", "filter": {"lead_email": "a@b.com"}}, "lead_email"),
+    "session_messages.find(session_id, bucket)": (
+        {"find": "session_messages", "filter": {"session_id": "s1", "bucket": {"$gte": 0, "$lte": 2}}},
+        "session_bucket",
+    ),
+}
+
+
+def hot_query_target(command) -> tuple:
+    collection = command.get("find") or command.get("findAndModify") or command.get("update")
+    query = command.get("filter") or command.get("query") or command["updates"][0]["q"]
+    return collection, list(query)
+
+
+@pytest.mark.parametrize("query", HOT_QUERIES)
+def test_hot_queries_are_covered_by_an_index_prefix(query):
+    command, index_name = HOT_QUERIES[query]
+    collection, fields = hot_query_target(command)
+
+    spec = next(s for s in index_specs() if s.collection == collection and s.name == index_name)
+    assert [key for key, _ in spec.keys][:len(fields)] == fields
+
+
+def plan_stages(plan):
+    stages = [plan]
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            stages += plan_stages(plan[child])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+@pytest.fixture(scope="module")
+def mongo_uri():
+    probe = MongoClient(settings.MONGODB_URI, serverSelectionTimeoutMS=500)
+    try:
+        probe.admin.command("ping")
+        reachable = True
+    except PyMongoError:
+        reachable = False
+    finally:
+        probe.close()
+    if reachable:
+        yield settings.MONGODB_URI
+        return
+
+    # Sem MongoDB em MONGODB_URI, sobe um mongod embutido (o binário é baixado na primeira execução).
+    pymongo_inmemory = pytest.importorskip("pymongo_inmemory")
+    try:
+        mongod = pymongo_inmemory.Mongod(None)
+        mongod.start()
+    except Exception as e:
+        pytest.skip(f"MongoDB indisponível em MONGODB_URI e mongod embutido não iniciou: {e}")
+    yield mongod.connection_string
+    mongod.stop()
+
+
+@pytest_asyncio.fixture
+async def live_db(monkeypatch, mongo_uri):
+    client = AsyncIOMotorClient(mongo_uri, serverSelectionTimeoutMS=2000)
+    db = client[f"{settings.MONGODB_DB}_index_test"]
+    monkeypatch.setattr(indexes, "get_database", lambda: db)
+    yield db
+    await client.drop_database(db.name)
+    client.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query", HOT_QUERIES)
+async def test_hot_queries_use_indexes(live_db, query):
+    await bootstrap_indexes()
+    await live_db.sessions.insert_many([{"session_id": f"s{i}", "lead_email": f"l{i}@b.com"} for i in range(50)])
+    await live_db.session_messages.insert_many([{"session_id": f"s{i % 10}", "bucket": i // 10} for i in range(50)])
+    command, index_name = HOT_QUERIES[query]
+
+    explain = await live_db.command({"explain": command, "verbosity": "queryPlanner"})
+
+    stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+    assert not any(s.get("stage") == "COLLSCAN" for s in stages)
+    assert index_name in {s.get("indexName") for s in stages}
\ No newline at end of file
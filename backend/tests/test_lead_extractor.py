@@ -0,0 +1,60 @@
+import pytest
+from models.lead import Lead
+from utils.lead_extractor import extract, template_reply
+
+
+@pytest.mark.parametrize("stage, message, info, complete", [
+    ("initial", "Meu nome é João da Silva", {"nome": "João da Silva"}, True),
+    ("initial", "Maria Souza", {"nome": "Maria Souza"}, True),
+    ("initial", "me chamo ana, e queria saber quanto custa?", {"nome": "Ana"}, False),
+    ("ask_email", "joao.silva@acme.com.br", {"email": "joao.silva@acme.com.br"}, True),
+    ("ask_email", "claro, meu email é Joao@Acme.com", {"email": "Joao@acme.com"}, True),
+    ("ask_empresa", "Trabalho na Acme Tecnologia", {"empresa": "Acme Tecnologia"}, True),
+    ("ask_empresa", "é a Padaria Pão Quente Ltda.", {"empresa": "Padaria Pão Quente Ltda"}, True),
+    ("ask_empresa", "Acme", {"empresa": "Acme"}, True),
+    ("ask_prazo", "em 30 dias", {"prazo": "em 30 dias"}, True),
+    ("ask_prazo", "é urgente pra gente", {"prazo": "urgente"}, True),
+    ("ask_prazo", "até março de 2026", {"prazo": "até março de 2026"}, True),
+])
+def test_extracts_fields_for_the_current_stage(stage, message, info, complete):
+    extraction = extract(stage, message)
+    assert extraction.info == info
+    assert extraction.complete is complete
+
+
+@pytest.mark.parametrize("stage, message", [
+    ("initial", "oi"),
+    ("initial", "Oii"),
+    ("initial", "Oie"),
+    ("initial", "Hello"),
+    ("ask_empresa", "Você pode me ajudar?"),
+    ("initial", "quanto custa o sistema?"),
+    ("ask_email", "joao arroba acme"),
+    ("ask_email", "joao@"),
+    ("ask_empresa", "prefiro não dizer"),
+    ("ask_empresa", "Prefiro não dizer"),
+    ("ask_necessidade", "precisamos de um CRM"),
+    ("ask_prazo", "não sei ainda"),
+    ("confirm_interest", "sim, pode agendar"),
+    ("confirm_interest", "não, obrigado"),
+    ("confirm_interest", "Não quero esperar, vamos agendar logo"),
+    ("confirm_interest", "Depois das 14h fica bom"),
+    ("initial", "Obrigado"),
+    ("initial", "Preço"),
+    ("initial", "Entendi"),
+    ("initial", "Sou a responsável pela compra"),
+    ("ask_empresa", "Trabalho sozinho"),
+    ("ask_empresa", "Ainda estou abrindo"),
+    ("ask_empresa", "Nenhuma"),
+    ("ask_prazo", "em 2 dias não, prefiro em 3 meses"),
+])
+def test_leaves_ambiguous_messages_to_the_model(stage, message):
+    assert extract(stage, message) is None
+
+
+def test_templates_use_lead_fields():
+    lead = Lead(nome="João Silva", empresa="Acme", necessidade="um CRM", prazo="30 dias")
+    assert template_reply("initial", lead) == "Prazer, João! Qual é o seu e-mail para contato?"
+    assert "Acme precisa de um CRM, com prazo de 30 dias" in template_reply("ask_prazo", lead)
+    assert template_reply("ask_necessidade", lead) is None
+    assert template_reply("ask_prazo", Lead(nome="João", empresa="Acme", prazo="30 dias")) is None
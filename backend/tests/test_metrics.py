@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, patch
+from httpx import AsyncClient, ASGITransport
+from prometheus_client import REGISTRY
+from app import app
+from config import settings
+from routes import chat_routes
+from services import ai_service
+from services.resilience import AIMDLimiter, CircuitBreaker, CircuitOpenError, TokenBucket, Upstream
+from utils import metrics
+import utils.transcript_writer as transcript_writer
+
+
+def sample(metric: str, **labels) -> float:
+    return REGISTRY.get_sample_value(metric, labels) or 0.0
+
+
+def test_timed_observes_histogram_and_request_timings():
+    timings = metrics.start_request_timings()
+    before = sample("sdr_phase_seconds_count", phase="db", name="unit")
+
+    with metrics.timed("db", "unit"):
+        pass
+    with metrics.timed("db", "unit"):
+        pass
+
+    assert sample("sdr_phase_seconds_count", phase="db", name="unit") == before + 2
+    assert len(timings["db"]) == 2
+    header = metrics.server_timing_header({"model": [0.5, 0.25]}, 1.0)
+    assert header == 'model;dur=750.0;desc="2x", total;dur=1000.0'
+
+
+@pytest.mark.asyncio
+async def test_timed_fn_wraps_coroutines():
+    @metrics.timed_fn("db")
+    async def fetch_thing():
+        return 42
+
+    assert await fetch_thing() == 42
+    assert fetch_thing.__name__ == "fetch_thing"
+    assert sample("sdr_phase_seconds_count", phase="db", name="fetch_thing") == 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_rejections_and_timeouts_are_counted():
+    upstream = Upstream(
+        "metrics-stand-in",
+        limiter=AIMDLimiter(initial=4, min_limit=1, max_limit=8, latency_target_seconds=1),
+        bucket=TokenBucket(0, 1),
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout_seconds=60),
+        queue_timeout_seconds=1,
+    )
+    with pytest.raises(asyncio.TimeoutError):
+        async with upstream.guard():
+            raise asyncio.TimeoutError()
+    with pytest.raises(CircuitOpenError):
+        async with upstream.guard():
+            pass
+
+    assert sample("sdr_upstream_errors_total", upstream="metrics-stand-in", kind="timeout") == 1
+    assert sample("sdr_upstream_errors_total", upstream="metrics-stand-in", kind="circuit_open") == 1
+
+
+@pytest_asyncio.fixture
+async def ac_client(monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_EXTRACTION_ENABLED", True)
+    monkeypatch.setattr(chat_routes, "create_session_db", AsyncMock())
+    monkeypatch.setattr(chat_routes, "update_session_lead_email", AsyncMock())
+    monkeypatch.setattr(transcript_writer, "add_message_db", AsyncMock())
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.mark.asyncio
+@patch.object(ai_service, "chat_with_ai", new_callable=AsyncMock)
+async def test_message_exposes_server_timing_and_stage_metrics(mock_gemini, ac_client: AsyncClient):
+    mock_gemini.return_value = {"reply": "Olá! Qual é o seu nome?"}
+    before = sample("sdr_stage_transitions_total", from_stage="initial", to_stage="ask_email")
+    session_id = (await ac_client.post("/api/start-session")).json()["session_id"]
+
+    resp = await ac_client.post("/api/message", json={"session_id": session_id, "message": "Meu nome é Ana"})
+
+    timing = resp.headers["Server-Timing"]
+    assert "session;dur=" in timing
+    assert "total;dur=" in timing
+    assert sample("sdr_stage_transitions_total", from_stage="initial", to_stage="ask_email") == before + 1
+    assert sample("sdr_request_seconds_count", method="POST", route="/api/message", status="200") >= 1
+
+    body = (await ac_client.get("/metrics")).text
+    assert "sdr_phase_seconds_bucket" in body
+    assert 'sdr_stage_transitions_total{from_stage="initial",to_stage="ask_email"}' in body
\ No newline at end of file
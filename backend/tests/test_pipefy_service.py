@@ -1,4 +1,7 @@
+import json
 import pytest
+import respx
+from services import pipefy_service
 from services.pipefy_service import create_or_update_card_pipefy, find_card_by_email, update_card
 import httpx
 
@@ -58,3 +61,91 @@ async def test_create_or_update_card_pipefy():
     print("\nCreate or Update Card Result:", result)
     assert result is not None
     assert any(key in result for key in ["card"])
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_update_card_sends_one_aliased_mutation():
+    route = respx.post(pipefy_service.PIPEFY_URL).mock(return_value=httpx.Response(200, json={"data": {
+        "f0": {"card": {"id": "1", "title": "Lucas"}},
+        "f1": {"card": {"id": "1", "title": "Lucas"}},
+    }}))
+    fields = [
+        {"field_id": "nome", "field_value": 'Lucas "Gomes"'},
+        {"field_id": "email", "field_value": "lucas@email.com"},
+        {"field_id": "empresa", "field_value": "Minha Empresa"},
+    ]
+
+    async with httpx.AsyncClient() as client:
+        result = await update_card(client, "1", fields)
+
+    assert route.call_count == 1
+    body = json.loads(route.calls[0].request.content)
+    assert "f0: updateCardField(input: $f0)" in body["query"]
+    assert body["variables"]["f0"] == {"card_id": "1", "field_id": "nome", "new_value": 'Lucas "Gomes"'}
+    assert result["results"] == [
+        {"field_id": "nome", "status": "ok"},
+        {"field_id": "empresa", "status": "ok"},
+    ]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_update_card_maps_errors_to_fields():
+    error = {"message": "Field not found", "path": ["f1"]}
+    respx.post(pipefy_service.PIPEFY_URL).mock(return_value=httpx.Response(200, json={
+        "data": {"f0": {"card": {"id": "1", "title": "Lucas"}}, "f1": None},
+        "errors": [error],
+    }))
+    fields = [{"field_id": "nome", "field_value": "Lucas"}, {"field_id": "prazo", "field_value": "30 dias"}]
+
+    async with httpx.AsyncClient() as client:
+        result = await update_card(client, "1", fields)
+
+    assert result["results"] == [
+        {"field_id": "nome", "status": "ok"},
+        {"field_id": "prazo", "error": [error]},
+    ]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_upsert_reuses_card_id_from_create():
+    pipefy_service.CARD_ID_CACHE.clear()
+    bodies = []
+
+    def handler(request):
+        body = request.content.decode()
+        bodies.append(body)
+        if "findCards" in body:
+            return httpx.Response(200, json={"data": {"findCards": {"edges": []}}})
+        if "createCard" in body:
+            return httpx.Response(200, json={"data": {"createCard": {"card": {"id": "CARD-1", "title": "Lucas"}}}})
+        return httpx.Response(200, json={"data": {"f0": {"card": {"id": "CARD-1"}}}})
+
+    respx.post(pipefy_service.PIPEFY_URL).mock(side_effect=handler)
+    lead = {"nome": "Lucas", "email": "Lucas@Email.com "}
+
+    async with httpx.AsyncClient() as client:
+        await pipefy_service.upsert_lead_card(client, lead)
+        result = await pipefy_service.upsert_lead_card(client, {**lead, "email": "lucas@email.com"})
+
+    assert sum("findCards" in b for b in bodies) == 1
+    assert len(bodies) == 3
+    assert result["card"] == {"id": "CARD-1"}
+    assert pipefy_service.cached_card_id("lucas@email.com") == "CARD-1"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_update_error_invalidates_cached_card_id():
+    pipefy_service.CARD_ID_CACHE.clear()
+    pipefy_service.remember_card_id("lucas@email.com", "CARD-GONE")
+    respx.post(pipefy_service.PIPEFY_URL).mock(return_value=httpx.Response(200, json={
+        "data": {"f0": None}, "errors": [{"message": "Card not found", "path": ["f0"]}],
+    }))
+
+    async with httpx.AsyncClient() as client:
+        await pipefy_service.upsert_lead_card(client, {"nome": "Lucas", "email": "lucas@email.com"})
+
+    assert pipefy_service.cached_card_id("lucas@email.com") is None
@@ -0,0 +1,172 @@
+import asyncio
+import time
+import pytest
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from services import resilience
+from services.resilience import (
+    AIMDLimiter, CircuitBreaker, CircuitOpenError, OverloadedError, ResilientTransport, TokenBucket, Upstream,
+    CLOSED, HALF_OPEN, OPEN,
+)
+
+
+def stand_in(latency: float = 0.0, status: int = 200):
+    state = {"latency": latency, "status": status, "hits": 0, "inflight": 0, "max_inflight": 0}
+    app = FastAPI()
+
+    @app.post("/graphql")
+    async def handler():
+        state["hits"] += 1
+        state["inflight"] += 1
+        state["max_inflight"] = max(state["max_inflight"], state["inflight"])
+        try:
+            await asyncio.sleep(state["latency"])
+        finally:
+            state["inflight"] -= 1
+        return JSONResponse({"data": {}}, status_code=state["status"])
+
+    return app, state
+
+
+def make_upstream(limit=4, max_limit=8, latency_target=0.2, rate=0, burst=1, threshold=3, reset=0.1, queue_timeout=1.0) -> Upstream:
+    return Upstream(
+        "stand-in",
+        limiter=AIMDLimiter(initial=limit, min_limit=1, max_limit=max_limit, latency_target_seconds=latency_target),
+        bucket=TokenBucket(rate, burst),
+        breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout_seconds=reset),
+        queue_timeout_seconds=queue_timeout,
+    )
+
+
+def client_for(upstream: Upstream, app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=ResilientTransport(upstream, httpx.ASGITransport(app=app)), base_url="http://stand-in")
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_on_errors_and_fails_fast():
+    app, state = stand_in(status=503)
+    upstream = make_upstream(threshold=3, reset=60)
+    async with client_for(upstream, app) as client:
+        for _ in range(3):
+            assert (await client.post("/graphql")).status_code == 503
+        assert upstream.breaker.state == OPEN
+
+        start = time.perf_counter()
+        with pytest.raises(CircuitOpenError):
+            await client.post("/graphql")
+        assert time.perf_counter() - start < 0.05
+    assert state["hits"] == 3
+    assert upstream.stats()["rejected_open"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_or_reopens_the_circuit():
+    app, state = stand_in(status=500)
+    upstream = make_upstream(threshold=1, reset=0.05)
+    async with client_for(upstream, app) as client:
+        await client.post("/graphql")
+        assert upstream.breaker.state == OPEN
+
+        await asyncio.sleep(0.06)
+        await client.post("/graphql")
+        assert upstream.breaker.state == OPEN
+
+        state["status"] = 200
+        await asyncio.sleep(0.06)
+        assert upstream.breaker.allow() and upstream.breaker.state == HALF_OPEN
+        assert not upstream.breaker.allow()
+        upstream.breaker.record_abandoned()
+        assert (await client.post("/graphql")).status_code == 200
+        assert upstream.breaker.state == CLOSED
+    assert state["hits"] == 3
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_is_returned_when_the_call_never_starts():
+    app, state = stand_in(status=500)
+    upstream = make_upstream(limit=1, max_limit=1, threshold=1, reset=0.05, queue_timeout=0.05)
+    async with client_for(upstream, app) as client:
+        await client.post("/graphql")
+        assert upstream.breaker.state == OPEN
+        state["status"] = 200
+        await asyncio.sleep(0.06)
+
+        # A sondagem é rejeitada por concorrência e depois cancelada enquanto espera vaga.
+        upstream.limiter.inflight = 1
+        with pytest.raises(OverloadedError):
+            await client.post("/graphql")
+        waiting = asyncio.create_task(client.post("/graphql"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert upstream.breaker.state == HALF_OPEN
+
+        upstream.limiter.inflight = 0
+        assert (await client.post("/graphql")).status_code == 200
+        assert upstream.breaker.state == CLOSED
+    assert state["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrency_never_exceeds_limit_and_overload_is_rejected():
+    app, state = stand_in(latency=0.1)
+    upstream = make_upstream(limit=3, max_limit=3, latency_target=1.0, queue_timeout=0.05)
+    async with client_for(upstream, app) as client:
+        results = await asyncio.gather(*[client.post("/graphql") for _ in range(10)], return_exceptions=True)
+
+    assert state["max_inflight"] <= 3
+    assert sum(isinstance(r, OverloadedError) for r in results) == 7
+    assert upstream.stats()["rejected_overload"] == 7
+
+
+@pytest.mark.asyncio
+async def test_limit_shrinks_on_slow_upstream_and_recovers_when_fast():
+    app, state = stand_in(latency=0.05)
+    upstream = make_upstream(limit=8, max_limit=8, latency_target=0.02)
+    async with client_for(upstream, app) as client:
+        for _ in range(3):
+            await client.post("/graphql")
+        assert upstream.limiter.limit == 1
+
+        state["latency"] = 0
+        for _ in range(10):
+            await client.post("/graphql")
+    assert upstream.limiter.limit > 3
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_and_rejects_above_quota():
+    bucket = TokenBucket(rate_per_second=20, burst=2)
+    start = time.perf_counter()
+    assert all([await bucket.acquire(timeout=1) for _ in range(4)])
+    assert time.perf_counter() - start >= 0.09
+    assert not await bucket.acquire(timeout=0)
+
+
+@pytest.mark.asyncio
+async def test_pipefy_fails_fast_when_its_circuit_is_open(monkeypatch):
+    from services import http_clients, pipefy_service
+
+    upstream = make_upstream(threshold=1, reset=60)
+    upstream.breaker.record_failure()
+    monkeypatch.setitem(resilience.UPSTREAMS, "pipefy", upstream)
+    await http_clients.close_http_clients()
+    try:
+        with pytest.raises(CircuitOpenError):
+            await pipefy_service.create_or_update_card_pipefy(client=None, lead={"email": "a@b.com"})
+    finally:
+        await http_clients.close_http_clients()
+
+
+@pytest.mark.asyncio
+async def test_gemini_calls_go_through_the_guard(monkeypatch):
+    from services import ai_service
+    from models.session import Message, Role
+
+    upstream = make_upstream(threshold=1, reset=60)
+    upstream.breaker.record_failure()
+    monkeypatch.setattr(ai_service, "GEMINI", upstream)
+    with pytest.raises(CircuitOpenError):
+        await ai_service.chat_with_ai([Message(Role.USER, "Olá")], "sistema")
@@ -0,0 +1,66 @@
+import time
+from datetime import datetime
+from models.lead import Lead
+from models.session import Session
+from utils.response_cache import ResponseCache, normalize
+
+
+def make_session(stage="ask_email", **lead) -> Session:
+    return Session(created_at=datetime.utcnow(), expires_at=datetime.utcnow(), stage=stage, lead=Lead(**lead))
+
+
+def test_normalize_ignores_case_accents_and_punctuation():
+    assert normalize("  Olá!!  Tudo   BEM? ") == "ola tudo bem"
+
+
+def test_stores_and_serves_generic_replies():
+    cache = ResponseCache(maxsize=10, ttl_seconds=60, stages=["ask_email"])
+    session = make_session(nome="Ana")
+    key = cache.key(session, "Pra que vocês precisam disso?")
+    assert cache.get(key) is None
+
+    cache.put(key, session, "Usamos o e-mail só para enviar o convite. Qual é o seu e-mail?", None)
+
+    other = make_session(nome="Bruno")
+    assert cache.get(cache.key(other, "pra que voces precisam disso")) == "Usamos o e-mail só para enviar o convite. Qual é o seu e-mail?"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_key_depends_on_which_lead_fields_are_filled():
+    cache = ResponseCache(maxsize=10, ttl_seconds=60, stages=["ask_empresa"])
+    assert cache.key(make_session("ask_empresa", nome="Ana"), "ok") != cache.key(make_session("ask_empresa", nome="Ana", email="a@b.com"), "ok")
+
+
+def test_personalised_replies_and_extractions_are_not_stored():
+    cache = ResponseCache(maxsize=10, ttl_seconds=60, stages=["ask_email"])
+    session = make_session(nome="Ana Souza")
+    key = cache.key(session, "por quê?")
+
+    cache.put(key, session, "Claro, Ana! Qual é o seu e-mail?", None)
+    cache.put(key, session, "Anotado!", {"email": "ana@acme.com"})
+
+    assert cache.stats()["stores"] == 0
+    assert cache.stats()["skipped"] == 2
+
+
+def test_stages_outside_allow_list_always_miss():
+    cache = ResponseCache(maxsize=10, ttl_seconds=60, stages=["ask_email"])
+    session = make_session("confirm_interest")
+    assert cache.key(session, "oi") is None
+    assert cache.get(None) is None
+
+
+def test_greetings_get_a_template_for_the_current_question():
+    cache = ResponseCache(maxsize=10, ttl_seconds=60, stages=["ask_empresa"])
+    reply = cache.get(cache.key(make_session("ask_empresa", nome="Ana"), "Bom dia!"))
+    assert reply == "Olá! Qual é o nome da sua empresa?"
+
+
+def test_entries_expire():
+    cache = ResponseCache(maxsize=10, ttl_seconds=0.01, stages=["ask_email"])
+    session = make_session()
+    key = cache.key(session, "como assim")
+    cache.put(key, session, "Qual é o seu e-mail?", None)
+    time.sleep(0.02)
+    assert cache.get(key) is None
\ No newline at end of file
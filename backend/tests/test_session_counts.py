@@ -0,0 +1,30 @@
+import pytest
+from datetime import datetime
+from mongomock_motor import AsyncMongoMockClient
+from utils import session_counts
+from utils.session_counts import SessionCounter
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(session_counts, "get_database", lambda: db)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_counts_are_buffered_and_flushed_as_daily_increments(mongo_db):
+    counter = SessionCounter(flush_interval_seconds=60)
+    for _ in range(5):
+        counter.record("started")
+    counter.record("engaged")
+    assert await mongo_db.session_counts.count_documents({}) == 0
+
+    await counter.flush()
+    await counter.flush()
+    counter.record("started")
+    await counter.stop()
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    assert await counter.daily(today) == {"started": 6, "engaged": 1, "abandoned": 5}
+    assert counter.metrics["flushes"] == 2
@@ -0,0 +1,74 @@
+import asyncio
+from collections import defaultdict
+import pytest
+from models.session import Message, Role, Session
+from utils import session_manager
+from utils.session_store import InMemorySessionStore
+
+
+@pytest.fixture(autouse=True)
+def memory_store(monkeypatch):
+    store = InMemorySessionStore()
+    monkeypatch.setattr(session_manager, "_store", store)
+    monkeypatch.setattr(session_manager, "_stage_hooks", defaultdict(dict))
+    return store
+
+
+@pytest.mark.asyncio
+async def test_create_session_starts_at_initial_stage():
+    sid = await session_manager.create_session()
+    session = await session_manager.get_session(sid)
+    assert isinstance(session, Session)
+    assert session.stage == "initial"
+    assert session.lead.nome is None
+
+
+@pytest.mark.asyncio
+async def test_add_message_appends_slotted_message():
+    sid = await session_manager.create_session()
+    assert await session_manager.add_message(sid, Message(Role.USER, "Olá"))
+    session = await session_manager.get_session(sid)
+    assert session.messages == [Message(Role.USER, "Olá")]
+    assert session.messages[0].to_dict() == {"role": "user", "content": "Olá"}
+    assert not await session_manager.add_message("missing", Message(Role.USER, "Olá"))
+
+
+@pytest.mark.asyncio
+async def test_update_lead_info_advances_stages():
+    sid = await session_manager.create_session()
+    steps = [
+        ({"nome": "João"}, "ask_email"),
+        ({"email": "joao@acme.com"}, "ask_empresa"),
+        ({"empresa": "Acme"}, "ask_necessidade"),
+        ({"necessidade": "CRM"}, "ask_prazo"),
+        ({"prazo": "30 dias"}, "confirm_interest"),
+        ({"interesse_confirmado": True}, "completed"),
+    ]
+    for info, stage in steps:
+        session = await session_manager.update_lead_info(sid, info)
+        assert session.stage == stage
+    assert session.lead.email == "joao@acme.com"
+    assert session.lead.interesse_confirmado is True
+
+
+@pytest.mark.asyncio
+async def test_stage_hook_runs_in_background_on_stage_enter():
+    seen = []
+
+    async def hook(session_id, session):
+        seen.append((session_id, session.stage))
+        return "slots"
+
+    session_manager.on_stage_enter("confirm_interest", "prefetch", hook)
+    sid = await session_manager.create_session()
+    session = await session_manager.update_lead_info(sid, {"nome": "João"})
+    assert session.prefetch == {}
+
+    for info in ({"email": "joao@acme.com"}, {"empresa": "Acme"}, {"necessidade": "CRM"}, {"prazo": "30 dias"}):
+        session = await session_manager.update_lead_info(sid, info)
+
+    assert await session.prefetch["prefetch"] == "slots"
+    assert seen == [(sid, "confirm_interest")]
+
+    await session_manager.update_lead_info(sid, {"email": "outro@acme.com"})
+    assert len(seen) == 1
\ No newline at end of file
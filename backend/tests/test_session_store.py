@@ -0,0 +1,267 @@
+import pytest
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+from models.lead import Lead
+from models.session import Message, Role, Session
+from utils import session_store
+from utils.context_window import build_context
+from utils.session_store import InMemorySessionStore, MongoSessionStore
+
+
+def make_session(minutes: int = 30) -> Session:
+    return Session(
+        created_at=datetime.utcnow(),
+        expires_at=datetime.utcnow() + timedelta(minutes=minutes),
+        stage="ask_email",
+        lead=Lead(nome="João"),
+        messages=[Message(Role.USER, "Olá")],
+    )
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(session_store, "get_database", lambda: db)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_drops_expired_sessions():
+    store = InMemorySessionStore()
+    await store.save("s1", make_session(minutes=-1))
+    assert await store.get("s1") is None
+
+
+@pytest.mark.asyncio
+async def test_in_memory_sweep_removes_abandoned_sessions():
+    store = InMemorySessionStore()
+    await store.save("old", make_session(minutes=-1))
+    await store.save("live", make_session())
+    assert store.sweep() == 1
+    assert store.stats()["live_sessions"] == 1
+    assert store.stats()["bytes_held"] > 0
+
+
+@pytest.mark.asyncio
+async def test_in_memory_bytes_held_tracks_saves_and_removals():
+    store = InMemorySessionStore(max_sessions=2)
+
+    def measured() -> int:
+        return sum(session_store.deep_sizeof(s) for s in store._sessions.values())
+
+    session = make_session()
+    await store.save("a", session)
+    session.messages.append(Message(Role.USER, "uma mensagem bem mais longa " * 20))
+    await store.save("a", session)
+    await store.save("b", make_session(minutes=-1))
+    assert store.stats()["bytes_held"] == measured()
+
+    await store.save("c", make_session())
+    await store.delete("c")
+    assert store.sweep() == 1
+    assert store.stats()["live_sessions"] == 0
+    assert store.stats()["bytes_held"] == 0
+
+
+@pytest.mark.asyncio
+async def test_in_memory_save_only_measures_new_messages(monkeypatch):
+    store = InMemorySessionStore()
+    session = make_session()
+    measured_messages = []
+    deep_sizeof = session_store.deep_sizeof
+
+    def counting_sizeof(obj):
+        if isinstance(obj, Message):
+            measured_messages.append(obj)
+        return deep_sizeof(obj)
+
+    monkeypatch.setattr(session_store, "deep_sizeof", counting_sizeof)
+    for i in range(10):
+        session.messages.append(Message(Role.USER, f"mensagem {i}"))
+        await store.save("a", session)
+    assert len(measured_messages) == len(session.messages)
+    assert store.stats()["bytes_held"] == deep_sizeof(session)
+
+    # Uma sessão nova com o mesmo id é medida do zero.
+    replacement = make_session()
+    await store.save("a", replacement)
+    assert store.stats()["bytes_held"] == deep_sizeof(replacement)
+
+
+@pytest.mark.asyncio
+async def test_in_memory_sweep_respects_renewed_sessions():
+    store = InMemorySessionStore()
+    session = make_session(minutes=1)
+    await store.save("s1", session)
+    session.expires_at = datetime.utcnow() + timedelta(minutes=30)
+    await store.save("s1", session)
+    assert store.sweep(now=datetime.utcnow() + timedelta(minutes=5)) == 0
+    assert store.sweep(now=datetime.utcnow() + timedelta(minutes=31)) == 1
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_evicts_least_recently_used():
+    store = InMemorySessionStore(max_sessions=2)
+    await store.save("a", make_session())
+    await store.save("b", make_session())
+    await store.get("a")
+    await store.save("c", make_session())
+    assert await store.get("b") is None
+    assert await store.get("a") is not None
+    assert store.stats()["evicted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_round_trip_between_workers(mongo_db):
+    worker_a = MongoSessionStore(cache_ttl_seconds=60)
+    worker_b = MongoSessionStore(cache_ttl_seconds=60)
+
+    await worker_a.save("s1", make_session())
+    session = await worker_b.get("s1")
+
+    assert session.stage == "ask_email"
+    assert session.lead.nome == "João"
+    assert session.messages == [Message(Role.USER, "Olá")]
+    doc = await mongo_db.sessions.find_one({"session_id": "s1"})
+    assert "messages" not in doc
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_serves_reads_from_cache(mongo_db):
+    store = MongoSessionStore(cache_ttl_seconds=60)
+    await store.save("s1", make_session())
+    await mongo_db.sessions.delete_one({"session_id": "s1"})
+    assert await store.get("s1") is not None
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_refresh_keeps_object_identity(mongo_db):
+    store = MongoSessionStore(cache_ttl_seconds=0)
+    await store.save("s1", make_session())
+    first = await store.get("s1")
+    await mongo_db.sessions.update_one({"session_id": "s1"}, {"$set": {"stage": "ask_empresa"}})
+    second = await store.get("s1")
+    assert second is first
+    assert first.stage == "ask_empresa"
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_rejects_save_over_a_newer_version(mongo_db):
+    await mongo_db.sessions.create_index("session_id", unique=True)
+    await MongoSessionStore(cache_ttl_seconds=0).save("s1", make_session())
+    worker_a, worker_b = MongoSessionStore(cache_ttl_seconds=0), MongoSessionStore(cache_ttl_seconds=0)
+    session_a, session_b = await worker_a.get("s1"), await worker_b.get("s1")
+
+    session_a.messages.append(Message(Role.USER, "turno do worker A"))
+    await worker_a.save("s1", session_a)
+    session_b.stage = "ask_email"
+    with pytest.raises(session_store.SessionConflictError):
+        await worker_b.save("s1", session_b)
+
+    # Relida, a sessão traz o turno do outro worker e volta a poder ser gravada.
+    session_b = await worker_b.get("s1")
+    assert session_b.messages[-1].content == "turno do worker A"
+    session_b.stage = "ask_email"
+    await worker_b.save("s1", session_b)
+    doc = await mongo_db.sessions.find_one({"session_id": "s1"})
+    assert doc["version"] == 3 and doc["stage"] == "ask_email"
+    assert doc["context_messages"][-1]["content"] == "turno do worker A"
+
+    with pytest.raises(session_store.SessionConflictError):
+        await MongoSessionStore(cache_ttl_seconds=0).save("s1", make_session())
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_version_is_not_bumped_twice_by_a_concurrent_refresh(mongo_db, monkeypatch):
+    store = MongoSessionStore(cache_ttl_seconds=0)
+    session = make_session()
+    collection = mongo_db.sessions
+    update_one = collection.update_one
+
+    async def refresh_during_write(*args, **kwargs):
+        result = await update_one(*args, **kwargs)
+        # Um get() concorrente atualiza a sessão em cache com a versão recém-gravada antes do save terminar.
+        session.version = (await mongo_db.sessions.find_one({"session_id": "s1"}))["version"]
+        return result
+
+    monkeypatch.setattr(collection, "update_one", refresh_during_write)
+    monkeypatch.setattr(MongoSessionStore, "collection", property(lambda self: collection))
+    await store.save("s1", session)
+    assert session.version == 1
+    await MongoSessionStore(cache_ttl_seconds=0).save("s1", session)
+
+
+def test_mongo_store_cache_is_bounded():
+    store = MongoSessionStore(cache_ttl_seconds=60, cache_max=2)
+    for session_id in ("s1", "s2", "s3"):
+        store._cache[session_id] = (0.0, make_session())
+    assert len(store._cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_hides_expired_and_deleted_sessions(mongo_db):
+    store = MongoSessionStore(cache_ttl_seconds=0)
+    await store.save("s1", make_session(minutes=-1))
+    assert await store.get("s1") is None
+
+    await store.save("s2", make_session())
+    await store.delete("s2")
+    assert await store.get("s2") is None
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_shares_pipefy_card_id(mongo_db):
+    session = make_session()
+    session.pipefy_card_id = "CARD-1"
+    await MongoSessionStore(cache_ttl_seconds=0).save("s1", session)
+    other_worker = MongoSessionStore(cache_ttl_seconds=0)
+    assert (await other_worker.get("s1")).pipefy_card_id == "CARD-1"
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_keeps_staged_sessions_in_memory_until_saved(mongo_db):
+    store = MongoSessionStore(cache_ttl_seconds=0)
+    session = make_session()
+    await store.stage("s1", session)
+
+    assert await store.get("s1") is session
+    assert await mongo_db.sessions.count_documents({}) == 0
+
+    await store.save("s1", session)
+    assert await mongo_db.sessions.count_documents({"session_id": "s1"}) == 1
+
+    await store.stage("s2", make_session())
+    await store.delete("s2")
+    assert await store.get("s2") is None
+    assert await mongo_db.sessions.count_documents({}) == 1
+
+
+@pytest.mark.asyncio
+async def test_mongo_store_keeps_only_the_context_window(mongo_db, monkeypatch):
+    monkeypatch.setattr(session_store.settings, "CONTEXT_RECENT_MESSAGES", 4)
+    session = make_session()
+    session.messages = [Message(Role.USER, f"m{i}") for i in range(9)] + [Message(Role.SYSTEM, "Action: schedule_meeting, Result: ok")]
+    session.messages = session.messages[-1:] + session.messages[:-1]
+    expected_context = build_context(session, recent_messages=4)
+    store = MongoSessionStore(cache_ttl_seconds=0)
+
+    await store.save("s1", session)
+
+    doc = await mongo_db.sessions.find_one({"session_id": "s1"})
+    assert [m["content"] for m in doc["context_messages"]] == ["m5", "m6", "m7", "m8"]
+    assert doc["omitted_messages"] == 6
+    assert doc["omitted_actions"] == ["schedule_meeting"]
+    loaded = await MongoSessionStore(cache_ttl_seconds=0).get("s1")
+    assert build_context(loaded, recent_messages=4) == expected_context
+
+
+@pytest.mark.parametrize("store, configured, expected", [
+    ("memory", None, True),
+    ("mongo", None, False),
+    ("mongo", True, True),
+    ("memory", False, False),
+])
+def test_lazy_persistence_defaults_off_for_mongo(monkeypatch, store, configured, expected):
+    monkeypatch.setattr(session_store.settings, "SESSION_STORE", store)
+    monkeypatch.setattr(session_store.settings, "SESSION_LAZY_PERSISTENCE", configured)
+    assert session_store.lazy_persistence_enabled() is expected
\ No newline at end of file
@@ -0,0 +1,126 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock
+from config import settings
+from services import tool_executor
+from services.tool_executor import execute_tool_calls
+
+LEAD = {"nome": "João", "email": "joao@acme.com"}
+SLOTS = [{"time": "2025-12-01T12:00:00Z"}]
+
+
+async def slow(result, delay):
+    await asyncio.sleep(delay)
+    return result
+
+
+@pytest.mark.asyncio
+async def test_independent_tools_run_concurrently(monkeypatch):
+    monkeypatch.setattr(tool_executor.pipefy_service, "create_or_update_card_pipefy", lambda client, lead: slow({"card": {"id": "1"}}, 0.2))
+    monkeypatch.setattr(tool_executor.calendar_service, "get_available_slots_next_7_days", lambda: slow(SLOTS, 0.2))
+
+    start = time.perf_counter()
+    results = await execute_tool_calls([
+        ("create_or_update_card_pipefy", {"lead": LEAD}),
+        ("get_available_slots_next_7_days", {}),
+    ])
+
+    assert time.perf_counter() - start < 0.35
+    assert results[0][0] == {"status": "sucesso", "card_id": "1"}
+    assert results[1][0] == {"available_slots": SLOTS}
+
+
+@pytest.mark.asyncio
+async def test_slow_pipefy_does_not_block_slots(monkeypatch):
+    monkeypatch.setattr(settings, "PIPEFY_TOOL_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(tool_executor.pipefy_service, "create_or_update_card_pipefy", lambda client, lead: slow({}, 5))
+    monkeypatch.setattr(tool_executor.calendar_service, "get_available_slots_next_7_days", AsyncMock(return_value=SLOTS))
+
+    results = await execute_tool_calls([
+        ("create_or_update_card_pipefy", {"lead": LEAD}),
+        ("get_available_slots_next_7_days", {}),
+    ])
+
+    assert results[0][0] == {"status": "falha", "erro": "tempo esgotado"}
+    assert results[1][1] == {"action": "get_available_slots_next_7_days", "result": SLOTS}
+
+
+@pytest.mark.asyncio
+async def test_failed_tool_is_reported_without_raising(monkeypatch):
+    monkeypatch.setattr(tool_executor.calendar_service, "get_available_slots_next_7_days", AsyncMock(side_effect=RuntimeError("cal.com fora")))
+    results = await execute_tool_calls([("get_available_slots_next_7_days", {})])
+    assert results[0][0] == {"status": "falha", "erro": "cal.com fora"}
+
+
+@pytest.mark.asyncio
+async def test_failed_booking_is_reported_without_meeting_link(monkeypatch):
+    monkeypatch.setattr(tool_executor.calendar_service, "schedule_meeting", AsyncMock(return_value={}))
+    results = await execute_tool_calls([("schedule_meeting", {"slot": SLOTS[0], "lead": dict(LEAD)})], session_id="s1")
+    assert results[0][0] == {"status": "falha", "meeting_link": None, "datetime": None}
+    assert tool_executor.calendar_service.schedule_meeting.await_args.kwargs["session_id"] == "s1"
+
+
+@pytest.mark.asyncio
+async def test_pipefy_update_waits_for_schedule_meeting(monkeypatch):
+    order = []
+
+    async def schedule(slot, lead, session_id=None):
+        await asyncio.sleep(0.05)
+        order.append("schedule")
+        return {"data": {"meetingUrl": "https://meet.link/abc"}}
+
+    upsert = AsyncMock(side_effect=lambda client, lead: order.append("pipefy") or {"card": {"id": "1"}})
+    monkeypatch.setattr(tool_executor.calendar_service, "schedule_meeting", schedule)
+    monkeypatch.setattr(tool_executor.pipefy_service, "create_or_update_card_pipefy", upsert)
+
+    await execute_tool_calls([
+        ("create_or_update_card_pipefy", {"lead": dict(LEAD)}),
+        ("schedule_meeting", {"slot": SLOTS[0], "lead": dict(LEAD)}),
+    ])
+
+    assert order == ["schedule", "pipefy"]
+    upsert.assert_awaited_once()
+    assert upsert.await_args.kwargs["lead"]["meeting_link"] == "https://meet.link/abc"
+
+
+@pytest.mark.asyncio
+async def test_tool_call_waits_for_warm_up_and_still_offers_slots(monkeypatch):
+    order = []
+    fetch = AsyncMock(side_effect=lambda: order.append("offer") or [{"time": "t2"}])
+    monkeypatch.setattr(tool_executor.calendar_service, "get_available_slots_next_7_days", fetch)
+
+    async def warm_up():
+        await asyncio.sleep(0.01)
+        order.append("warm_up")
+
+    prefetched = {"get_available_slots_next_7_days": asyncio.create_task(warm_up())}
+    results = await execute_tool_calls([("get_available_slots_next_7_days", {})], prefetched)
+
+    assert results[0][0] == {"available_slots": [{"time": "t2"}]}
+    assert order == ["warm_up", "offer"]
+    assert prefetched == {}
+
+
+@pytest.mark.asyncio
+async def test_warm_up_hook_only_fills_the_availability_cache(monkeypatch):
+    slots = AsyncMock()
+    monkeypatch.setattr(tool_executor.calendar_service.AVAILABILITY, "slots", slots)
+
+    assert await tool_executor._warm_availability("s1", None) is None
+    slots.assert_awaited_once_with(tool_executor.settings.CAL_EVENT_TYPE_ID)
+
+
+@pytest.mark.asyncio
+async def test_failed_prefetch_falls_back_to_live_call(monkeypatch):
+    fetch = AsyncMock(return_value=[{"time": "t2"}])
+    monkeypatch.setattr(tool_executor.calendar_service, "get_available_slots_next_7_days", fetch)
+
+    async def prefetch():
+        raise RuntimeError("cal.com fora do ar")
+
+    prefetched = {"get_available_slots_next_7_days": asyncio.create_task(prefetch())}
+    results = await execute_tool_calls([("get_available_slots_next_7_days", {})], prefetched)
+
+    assert results[0][0] == {"available_slots": [{"time": "t2"}]}
+    fetch.assert_awaited_once()
\ No newline at end of file
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from models.session import Message, Role
+from models.db import TranscriptWriteError
+from utils.transcript_writer import TranscriptWriter
+
+
+@pytest.mark.asyncio
+@patch("utils.transcript_writer.add_messages_bulk_db", new_callable=AsyncMock, return_value={})
+async def test_messages_are_grouped_per_session_in_order(mock_bulk):
+    writer = TranscriptWriter(flush_interval_ms=50, batch_size=100, max_queue=100)
+    writer.start()
+    await writer.enqueue("s1", Message(Role.USER, "a"))
+    await writer.enqueue("s2", Message(Role.USER, "b"))
+    await writer.enqueue("s1", Message(Role.ASSISTANT, "c"))
+    await writer.stop()
+
+    mock_bulk.assert_awaited_once_with({
+        "s1": [{"role": "user", "content": "a"}, {"role": "assistant", "content": "c"}],
+        "s2": [{"role": "user", "content": "b"}],
+    })
+    assert writer.stats()["flushed"] == 3
+    assert writer.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+@patch("utils.transcript_writer.add_messages_bulk_db", new_callable=AsyncMock, return_value={})
+async def test_batch_size_triggers_flush(mock_bulk):
+    writer = TranscriptWriter(flush_interval_ms=10_000, batch_size=2, max_queue=10)
+    writer.start()
+    for i in range(4):
+        await writer.enqueue("s1", Message(Role.USER, str(i)))
+    await writer.stop()
+
+    assert mock_bulk.await_count == 2
+    assert writer.stats()["batches"] == 2
+
+
+@pytest.mark.asyncio
+@patch("utils.transcript_writer.add_message_db", new_callable=AsyncMock)
+async def test_enqueue_writes_directly_when_not_started(mock_add):
+    writer = TranscriptWriter(flush_interval_ms=50, batch_size=10, max_queue=10)
+    await writer.enqueue("s1", Message(Role.USER, "oi"))
+    mock_add.assert_awaited_once_with("s1", {"role": "user", "content": "oi"})
+
+
+@pytest.mark.asyncio
+@patch("utils.transcript_writer.add_messages_bulk_db", new_callable=AsyncMock, side_effect=RuntimeError("down"))
+async def test_failed_batches_are_retried_then_dropped(mock_bulk):
+    writer = TranscriptWriter(flush_interval_ms=1, batch_size=10, max_queue=10, max_retries=2)
+    writer.start()
+    await writer.enqueue("s1", Message(Role.USER, "oi"))
+    for _ in range(100):
+        if mock_bulk.await_count == 3:
+            break
+        await asyncio.sleep(0.01)
+    await writer.stop()
+
+    assert mock_bulk.await_count == 3
+    assert writer.stats()["errors"] == 3
+    assert writer.stats()["dropped"] == 1
+    assert writer.stats()["retry_pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_only_failed_sessions_are_requeued_ahead_of_new_messages():
+    calls = []
+
+    async def bulk(grouped):
+        calls.append({sid: [m["content"] for m in messages] for sid, messages in grouped.items()})
+        if len(calls) == 1:
+            pending = [{**grouped["s2"][0], "seq": 7}]
+            return {"s2": TranscriptWriteError("s2", pending, RuntimeError("timeout"))}
+        return {}
+
+    writer = TranscriptWriter(flush_interval_ms=10_000, batch_size=2, max_queue=10)
+    with patch("utils.transcript_writer.add_messages_bulk_db", bulk):
+        writer.start()
+        await writer.enqueue("s1", Message(Role.USER, "a"))
+        await writer.enqueue("s2", Message(Role.USER, "b"))
+        await writer.enqueue("s2", Message(Role.USER, "c"))
+        await writer.enqueue("s1", Message(Role.USER, "d"))
+        await writer.stop()
+
+    assert calls == [{"s1": ["a"], "s2": ["b"]}, {"s2": ["b", "c"], "s1": ["d"]}]
+    assert writer.stats()["flushed"] == 4
+    assert writer.stats()["retried"] == 1
+    assert writer.stats()["dropped"] == 0
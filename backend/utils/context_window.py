@@ -0,0 +1,74 @@
+import re
+from typing import List
+from config import settings
+from models.session import Message, Role, Session
+
+ACTION_RE = re.compile(r"^Action: (?P<name>\w+), Result: (?P<result>.*)$", re.DOTALL)
+
+LEAD_FIELDS = ("nome", "email", "empresa", "necessidade", "prazo", "interesse_confirmado", "meeting_link", "meeting_datetime")
+
+
+def estimate_tokens(text: str) -> int:
+    # Aproximação de ~4 caracteres por token, suficiente para limitar o tamanho do prompt.
+    return len(text) // 4 + 1
+
+
+def compact_action(message: Message, max_chars: int) -> Message:
+    match = ACTION_RE.match(message.content)
+    if not match or len(match.group("result")) <= max_chars:
+        return message
+    result = match.group("result")[:max_chars]
+    return Message(message.role, f"Action: {match.group('name')}, Result: {result}…")
+
+
+def action_names(messages: List[Message]) -> List[str]:
+    return [m.group("name") for m in (ACTION_RE.match(msg.content) for msg in messages) if m]
+
+
+def trim_history(session: Session, keep: int) -> None:
+    # Move as mensagens mais antigas para os contadores da sessão, mantendo o resumo de build_context igual.
+    split = max(len(session.messages) - keep, 0)
+    if not split:
+        return
+    dropped = session.messages[:split]
+    session.omitted_messages += split
+    session.omitted_actions = list(dict.fromkeys(session.omitted_actions + action_names(dropped)))
+    del session.messages[:split]
+
+
+def lead_state_summary(session: Session, older: List[Message]) -> str:
+    lead = session.lead
+    omitted = session.omitted_messages + len(older)
+    lines = [f"Resumo da conversa anterior ({omitted} mensagens omitidas).", f"Etapa atual: {session.stage}."]
+    collected = [f"- {name}: {getattr(lead, name)}" for name in LEAD_FIELDS if getattr(lead, name) not in (None, "", False)]
+    if collected:
+        lines.append("Dados do lead já coletados:")
+        lines.extend(collected)
+    actions = session.omitted_actions + action_names(older)
+    if actions:
+        lines.append(f"Ações já executadas: {', '.join(dict.fromkeys(actions))}.")
+    return "\n".join(lines)
+
+
+def build_context(
+    session: Session,
+    recent_messages: int | None = None,
+    max_tokens: int | None = None,
+    action_result_chars: int | None = None,
+) -> List[Message]:
+    recent_messages = recent_messages or settings.CONTEXT_RECENT_MESSAGES
+    max_tokens = max_tokens or settings.CONTEXT_MAX_TOKENS
+    action_result_chars = action_result_chars or settings.CONTEXT_ACTION_RESULT_CHARS
+
+    history = session.messages
+    split = max(len(history) - recent_messages, 0)
+    older = history[:split]
+    recent = [compact_action(m, action_result_chars) for m in history[split:]]
+
+    while True:
+        summary = [Message(Role.USER, lead_state_summary(session, older))] if older or session.omitted_messages else []
+        total = sum(estimate_tokens(m.content) for m in summary + recent)
+        if total <= max_tokens or len(recent) <= 1:
+            return summary + recent
+        recent.pop(0)
+        older = history[: len(older) + 1]
@@ -0,0 +1,215 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from models.lead import Lead
+
+EMAIL_ADAPTER = TypeAdapter(EmailStr)
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+NAME_INTRO_RE = re.compile(
+    r"\b(?:meu nome (?:é|e)|me chamo|pode me chamar de|aqui (?:é|e) (?:o|a)|sou (?:o|a))\s+"
+    r"([A-Za-zÀ-ÿ]+(?:\s+(?:d[aeo]s?\s+)?[A-Za-zÀ-ÿ]+){0,3})",
+    re.IGNORECASE,
+)
+NAME_BARE_RE = re.compile(r"^[A-ZÀ-Ý][a-zà-ÿ]+(?:\s+(?:d[aeo]s?\s+)?[A-ZÀ-Ý][a-zà-ÿ]+){0,3}$")
+COMPANY_SUFFIX_RE = re.compile(
+    r"([\wÀ-ÿ&.\- ]{2,60}?\s+(?:ltda\.?|s\.?\s?a\.?|s/a|eireli|epp|inc\.?|llc|corp\.?))(?=[\s.,!]|$)",
+    re.IGNORECASE,
+)
+COMPANY_INTRO_RE = re.compile(
+    r"\b(?:(?:a |minha )?empresa (?:é|e|se chama|chama)|trabalho (?:na|no|em)|sou da|sou do)\s+"
+    r"([\wÀ-ÿ&.\-]+(?:\s+[\wÀ-ÿ&.\-]+){0,4})",
+    re.IGNORECASE,
+)
+COMPANY_LEADING_RE = re.compile(r"^(?:(?:é|e|a|o|na|no|da|do|minha empresa|empresa)\s+)+", re.IGNORECASE)
+COMPANY_BARE_RE = re.compile(r"^[A-ZÀ-Ý0-9][\wÀ-ÿ&.\-]*(?:\s+[\wÀ-ÿ&.\-]+){0,3}$")
+NUMBER_WORDS = r"\d+|um|uma|dois|duas|tr[eê]s|quatro|cinco|seis|sete|oito|nove|dez|doze|quinze|vinte|trinta|sessenta|noventa"
+MONTHS = r"janeiro|fevereiro|mar[cç]o|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro"
+DEADLINE_RE = re.compile(
+    rf"(?:em |at[eé] |dentro de |daqui a |no m[aá]ximo |uns |umas |cerca de )?(?:{NUMBER_WORDS})\s+(?:dias?|semanas?|m[eê]s(?:es)?|anos?)(?: [uú]teis)?"
+    rf"|(?:at[eé] |em |no come[cç]o de |no fim de |no final de )(?:{MONTHS})(?: de \d{{4}})?"
+    r"|(?:no |at[eé] o |para o )?(?:pr[oó]ximo|fim do|final do|come[cç]o do|in[ií]cio do) (?:m[eê]s|ano|semestre|trimestre)"
+    r"|urgente|imediatamente|o quanto antes|o mais r[aá]pido poss[ií]vel|pra ontem|para ontem|asap|sem pressa|sem prazo definido",
+    re.IGNORECASE,
+)
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+SPACES_RE = re.compile(r"\s+")
+REPEATED_RE = re.compile(r"(\w)\1+")
+# Comparadas já normalizadas e sem letras repetidas ("Oiii!" -> "oi"); usadas também pelo cache de respostas.
+GREETINGS = {
+    "oi", "oie", "ola", "opa", "eai", "e ai", "hey", "hi", "hello", "bom dia", "boa tarde", "boa noite",
+    "tudo bem", "oi tudo bem", "ola tudo bem", "oi bom dia", "ola bom dia", "oi boa tarde", "ola boa tarde",
+}
+SHORT_ANSWERS = {"sim", "nao", "ok"}
+FILLER_RE = re.compile(
+    r"\b(?:meu|minha|o|a|e|é|email|e-mail|seria|pode ser|segue|aqui|está|esta|ta|tá|claro|sim|ok|obrigad[oa])\b|[.,!:;]",
+    re.IGNORECASE,
+)
+NON_ANSWER_RE = re.compile(r"\b(?:n[aã]o|prefiro|sei|talvez|depois|quanto|como|qual|quem|porque|por que)\b", re.IGNORECASE)
+NEGATION_RE = re.compile(r"\b(?:n[aã]o|nem|nunca)\b", re.IGNORECASE)
+NAME_PARTICLES = {"da", "de", "do", "das", "dos"}
+# Respostas curtas capitalizadas que casam com os padrões "soltos" de nome/empresa mas não são respostas (normalizadas).
+COMMON_REPLIES = {
+    "obrigado", "obrigada", "valeu", "entendi", "certo", "beleza", "blz", "legal", "perfeito", "otimo", "show",
+    "combinado", "claro", "tchau", "ajuda", "duvida", "preco", "precos", "valor", "valores", "custo", "orcamento",
+    "demonstracao", "demo", "teste", "informacao", "informacoes", "pergunta", "sim", "nao", "ok", "talvez",
+}
+NOT_NAME_WORDS = COMMON_REPLIES | {
+    "responsavel", "gerente", "diretor", "diretora", "dono", "dona", "socio", "socia", "ceo", "cto", "analista",
+    "coordenador", "coordenadora", "comprador", "compradora", "vendedor", "vendedora", "compra", "compras", "vendas",
+    "area", "setor", "time", "equipe", "empresa", "pela", "pelo", "para", "com", "sem", "na", "no", "em", "um", "uma",
+}
+NOT_COMPANY_WORDS = COMMON_REPLIES | {
+    "nenhuma", "nenhum", "nada", "sozinho", "sozinha", "autonomo", "autonoma", "freelancer", "freela", "ainda",
+    "estou", "sou", "trabalho", "abrindo", "abrir", "tenho", "propria", "proprio", "particular", "pessoal",
+    "area", "setor", "compras", "empresa",
+}
+MAX_LEFTOVER_WORDS = 4
+
+
+@dataclass(slots=True)
+class Extraction:
+    info: Dict[str, Any] = field(default_factory=dict)
+    complete: bool = False
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def normalize(message: str) -> str:
+    text = _strip_accents(message.lower())
+    return SPACES_RE.sub(" ", PUNCTUATION_RE.sub(" ", text)).strip()
+
+
+def _collapse(text: str) -> str:
+    return REPEATED_RE.sub(r"\1", text)
+
+
+_GREETINGS_COLLAPSED = {_collapse(g) for g in GREETINGS}
+_SHORT_ANSWERS_COLLAPSED = {_collapse(a) for a in SHORT_ANSWERS}
+
+
+def is_greeting(message: str) -> bool:
+    return _collapse(normalize(message)) in _GREETINGS_COLLAPSED
+
+
+def _is_small_talk(message: str) -> bool:
+    collapsed = _collapse(normalize(message))
+    return collapsed in _GREETINGS_COLLAPSED or collapsed in _SHORT_ANSWERS_COLLAPSED
+
+
+def _leftover_words(message: str, matched: str) -> int:
+    rest = FILLER_RE.sub(" ", message.replace(matched, " "))
+    return len(rest.split())
+
+
+def _complete(message: str, matched: str) -> bool:
+    return "?" not in message and _leftover_words(message, matched) <= MAX_LEFTOVER_WORDS
+
+
+def extract_email(message: str) -> Extraction | None:
+    match = EMAIL_RE.search(message)
+    if not match:
+        return None
+    try:
+        email = str(EMAIL_ADAPTER.validate_python(match.group(0).rstrip(".")))
+    except ValidationError:
+        return None
+    return Extraction({"email": email}, _complete(message, match.group(0)))
+
+
+def _has_stopword(text: str, stopwords: set) -> bool:
+    return any(word in stopwords for word in normalize(text).split())
+
+
+def _title_name(name: str) -> str:
+    return " ".join(w.lower() if w.lower() in NAME_PARTICLES else w.capitalize() for w in name.split())
+
+
+def extract_name(message: str) -> Extraction | None:
+    text = message.strip().rstrip(".!")
+    match = NAME_INTRO_RE.search(text)
+    if match:
+        name = match.group(1)
+        if _has_stopword(name, NOT_NAME_WORDS):
+            return None
+        return Extraction({"nome": _title_name(name)}, "?" not in message and len(text.split()) <= len(name.split()) + 4)
+    if _is_small_talk(text) or _has_stopword(text, NOT_NAME_WORDS):
+        return None
+    if NAME_BARE_RE.match(text) and not NON_ANSWER_RE.search(text):
+        return Extraction({"nome": text}, True)
+    return None
+
+
+def extract_company(message: str) -> Extraction | None:
+    text = message.strip().rstrip(".!")
+    for pattern in (COMPANY_INTRO_RE, COMPANY_SUFFIX_RE):
+        match = pattern.search(text)
+        if match:
+            company = COMPANY_LEADING_RE.sub("", match.group(1).strip(" .,"))
+            if pattern is COMPANY_INTRO_RE and _has_stopword(company, NOT_COMPANY_WORDS):
+                return None
+            return Extraction({"empresa": company}, "?" not in message and len(text.split()) <= len(company.split()) + 4)
+    if _has_stopword(text, NOT_COMPANY_WORDS):
+        return None
+    if "?" not in text and not _is_small_talk(text) and not NON_ANSWER_RE.search(text) and COMPANY_BARE_RE.match(text):
+        return Extraction({"empresa": text}, True)
+    return None
+
+
+def extract_deadline(message: str) -> Extraction | None:
+    matches = list(DEADLINE_RE.finditer(message))
+    # "em 2 dias não, prefiro em 3 meses": negação ou mais de um prazo fica com o modelo.
+    if len(matches) != 1 or NEGATION_RE.search(message):
+        return None
+    prazo = matches[0].group(0).strip()
+    return Extraction({"prazo": prazo}, "?" not in message and len(message.split()) <= len(prazo.split()) + 6)
+
+
+# confirm_interest fica sempre com o modelo: tanto o "sim" quanto a recusa passam pelas ferramentas (agenda e Pipefy).
+EXTRACTORS: Dict[str, Callable[[str], Extraction | None]] = {
+    "initial": extract_name,
+    "ask_email": extract_email,
+    "ask_empresa": extract_company,
+    "ask_prazo": extract_deadline,
+}
+
+
+def extract(stage: str, message: str) -> Extraction | None:
+    extractor = EXTRACTORS.get(stage)
+    if extractor is None or not message or not message.strip():
+        return None
+    return extractor(message)
+
+
+def _first_name(lead: Lead) -> str:
+    return (lead.nome or "").split(" ")[0]
+
+
+TEMPLATES: Dict[str, Callable[[Lead], str]] = {
+    "initial": lambda lead: f"Prazer, {_first_name(lead)}! Qual é o seu e-mail para contato?",
+    "ask_email": lambda lead: f"Obrigado, {_first_name(lead)}! Qual é o nome da sua empresa?",
+    "ask_empresa": lambda lead: f"Legal! E qual é hoje a principal necessidade ou desafio da {lead.empresa} que você gostaria de resolver?",
+    "ask_prazo": lambda lead: (
+        f"Perfeito, {_first_name(lead)}! Resumindo: a {lead.empresa} precisa de {lead.necessidade}, "
+        f"com prazo de {lead.prazo}. Posso agendar uma reunião com nosso time para conversarmos sobre a solução?"
+    ),
+}
+
+
+TEMPLATE_FIELDS: Dict[str, tuple] = {
+    "initial": ("nome",),
+    "ask_email": ("nome",),
+    "ask_empresa": ("empresa",),
+    "ask_prazo": ("nome", "empresa", "necessidade", "prazo"),
+}
+
+
+def template_reply(stage: str, lead: Lead) -> str | None:
+    template = TEMPLATES.get(stage)
+    if template is None or not all(getattr(lead, f) for f in TEMPLATE_FIELDS.get(stage, ())):
+        return None
+    return template(lead)
\ No newline at end of file
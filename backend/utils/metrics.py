@@ -0,0 +1,52 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterator, List
+from prometheus_client import Counter, Histogram
+
+PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_SECONDS = Histogram("sdr_request_seconds", "Duração das requisições HTTP", ["method", "route", "status"], buckets=PHASE_BUCKETS)
+PHASE_SECONDS = Histogram("sdr_phase_seconds", "Duração de cada fase de um turno (modelo, ferramenta, MongoDB, sessão)", ["phase", "name"], buckets=PHASE_BUCKETS)
+STAGE_TRANSITIONS = Counter("sdr_stage_transitions", "Transições de etapa da conversa", ["from_stage", "to_stage"])
+UPSTREAM_ERRORS = Counter("sdr_upstream_errors", "Erros, timeouts e rejeições por provedor externo", ["upstream", "kind"])
+
+# Fases acumuladas da requisição atual, para o cabeçalho Server-Timing; None fora de uma requisição.
+_timings: ContextVar[Dict[str, List[float]] | None] = ContextVar("server_timings", default=None)
+
+
+def start_request_timings() -> Dict[str, List[float]]:
+    timings: Dict[str, List[float]] = {}
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def timed(phase: str, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.labels(phase, name).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings.setdefault(phase, []).append(elapsed)
+
+
+def timed_fn(phase: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    def decorator(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with timed(phase, fn.__name__):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(timings: Dict[str, List[float]], total_seconds: float) -> str:
+    # Chamadas concorrentes (ferramentas em paralelo) somam mais que o tempo de parede; desc traz o número de chamadas.
+    entries = [f'{phase};dur={sum(durations) * 1000:.1f};desc="{len(durations)}x"' for phase, durations in timings.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
\ No newline at end of file
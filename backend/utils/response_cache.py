@@ -0,0 +1,82 @@
+from typing import Any, Dict, Iterable, Tuple
+from cachetools import TTLCache
+from config import settings
+from models.session import Session
+from utils.context_window import LEAD_FIELDS
+from utils.lead_extractor import is_greeting, normalize
+
+STAGE_QUESTIONS = {
+    "initial": "Para começarmos, qual é o seu nome?",
+    "ask_email": "Qual é o seu e-mail para contato?",
+    "ask_empresa": "Qual é o nome da sua empresa?",
+    "ask_necessidade": "Qual é a principal necessidade ou desafio que você gostaria de resolver?",
+    "ask_prazo": "Em quanto tempo você precisa da solução?",
+}
+
+CacheKey = Tuple[str, str, Tuple[bool, ...]]
+
+
+def personal_values(session: Session) -> Iterable[str]:
+    lead = session.lead
+    for name in ("nome", "email", "empresa"):
+        value = getattr(lead, name)
+        if value:
+            yield str(value).lower()
+            if name == "nome":
+                yield str(value).split(" ")[0].lower()
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl_seconds: float, stages: Iterable[str]):
+        self.stages = frozenset(stages)
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0, "skipped": 0}
+
+    def key(self, session: Session, message: str) -> CacheKey | None:
+        if session.stage not in self.stages:
+            return None
+        normalized = normalize(message)
+        if not normalized:
+            return None
+        present = tuple(getattr(session.lead, name) not in (None, "", False) for name in LEAD_FIELDS)
+        return session.stage, normalized, present
+
+    def get(self, key: CacheKey | None) -> str | None:
+        if key is None:
+            return None
+        stage, normalized, _ = key
+        reply = self._cache.get(key)
+        if reply is None and is_greeting(normalized) and stage in STAGE_QUESTIONS:
+            reply = f"Olá! {STAGE_QUESTIONS[stage]}"
+        self.metrics["hits" if reply is not None else "misses"] += 1
+        return reply
+
+    def put(self, key: CacheKey | None, session: Session, reply: str, info: Dict[str, Any] | None) -> None:
+        if key is None or not reply:
+            return
+        # Turnos que trouxeram dados do lead ou citam o lead são pessoais e nunca vão para o cache.
+        lowered = reply.lower()
+        if info or any(value in lowered for value in personal_values(session)):
+            self.metrics["skipped"] += 1
+            return
+        self._cache[key] = reply
+        self.metrics["stores"] += 1
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            "entries": len(self._cache),
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0,
+            "stages": sorted(self.stages),
+            **self.metrics,
+        }
+
+
+response_cache = ResponseCache(
+    maxsize=settings.RESPONSE_CACHE_SIZE,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    stages=[s.strip() for s in settings.RESPONSE_CACHE_STAGES.split(",") if s.strip()] if settings.RESPONSE_CACHE_ENABLED else [],
+)
\ No newline at end of file
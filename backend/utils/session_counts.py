@@ -0,0 +1,67 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict
+from config import settings
+from models.db import get_database
+
+
+class SessionCounter:
+    def __init__(self, flush_interval_seconds: float):
+        self.flush_interval = flush_interval_seconds
+        self._pending: Counter = Counter()
+        self._task: asyncio.Task | None = None
+        self.metrics = {"flushes": 0, "errors": 0}
+
+    @property
+    def collection(self):
+        return get_database().session_counts
+
+    def record(self, event: str) -> None:
+        self._pending[(datetime.utcnow().strftime("%Y-%m-%d"), event)] += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, Counter()
+        by_day: Dict[str, Dict[str, int]] = {}
+        for (day, event), count in pending.items():
+            by_day.setdefault(day, {})[event] = count
+        try:
+            for day, counts in by_day.items():
+                await self.collection.update_one({"_id": day}, {"$inc": counts}, upsert=True)
+            self.metrics["flushes"] += 1
+        except Exception as e:
+            self.metrics["errors"] += 1
+            self._pending.update(pending)
+            print(f"Erro ao gravar contagem de sessões: {e}")
+
+    async def daily(self, day: str) -> Dict[str, int]:
+        doc = await self.collection.find_one({"_id": day}) or {}
+        started, engaged = doc.get("started", 0), doc.get("engaged", 0)
+        return {"started": started, "engaged": engaged, "abandoned": max(0, started - engaged)}
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": sum(self._pending.values()), **self.metrics}
+
+
+session_counter = SessionCounter(flush_interval_seconds=settings.SESSION_COUNTS_FLUSH_SECONDS)
\ No newline at end of file
@@ -1,54 +1,101 @@
+import asyncio
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict
 import uuid
-from typing import Dict, Any
 from config import settings
-from models.lead import Lead
+from models.session import Message, Session
+from utils.metrics import STAGE_TRANSITIONS, timed
+from utils.session_store import SessionStore, build_session_store
 
 
-_sessions: Dict[str, Dict[str, Any]] = {}
+_store: SessionStore = build_session_store()
 
+StageHook = Callable[[str, Session], Awaitable[Any]]
+_stage_hooks: Dict[str, Dict[str, StageHook]] = defaultdict(dict)
 
-def create_session() -> str:
+
+def get_session_store() -> SessionStore:
+    return _store
+
+
+def on_stage_enter(stage: str, name: str, hook: StageHook) -> None:
+    _stage_hooks[stage][name] = hook
+
+
+def _log_hook_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception():
+        print(f"Erro em tarefa de etapa ({task.get_name()}): {task.exception()}")
+
+
+def fire_stage_hooks(session_id: str, session: Session) -> None:
+    session.prefetch.clear()
+    for name, hook in _stage_hooks.get(session.stage, {}).items():
+        task = asyncio.create_task(hook(session_id, session), name=name)
+        task.add_done_callback(_log_hook_failure)
+        session.prefetch[name] = task
+
+
+async def _save(session_id: str, session: Session) -> None:
+    with timed("session", "save"):
+        if session.persisted:
+            await _store.save(session_id, session)
+        else:
+            await _store.stage(session_id, session)
+
+
+async def create_session(persist: bool = True) -> str:
     session_id = str(uuid.uuid4())
-    _sessions[session_id] = {
-    "messages": [],
-    "created_at": datetime.utcnow(),
-    "expires_at": datetime.utcnow() + timedelta(minutes=settings.SESSION_TIMEOUT),
-    "stage": "initial",
-    "lead": Lead(nome=None, email=None, empresa=None, necessidade=None, prazo=None, interesse_confirmado=False),
-    }
+    await _save(session_id, Session(
+        created_at=datetime.utcnow(),
+        expires_at=datetime.utcnow() + timedelta(minutes=settings.SESSION_TIMEOUT),
+        persisted=persist,
+    ))
     return session_id
 
 
-def get_session(session_id: str) -> dict | None:
-    s = _sessions.get(session_id)
-    if not s:
-        return None
-    if datetime.utcnow() > s["expires_at"]:
-        _sessions.pop(session_id, None)
+async def persist_session(session_id: str) -> Session | None:
+    s = await get_session(session_id)
+    if not s or s.persisted:
         return None
+    s.persisted = True
+    await _store.save(session_id, s)
     return s
 
 
-def add_message(session_id: str, message: dict) -> bool:
-    s = get_session(session_id)
+async def get_session(session_id: str) -> Session | None:
+    with timed("session", "get"):
+        return await _store.get(session_id)
+
+
+async def add_message(session_id: str, message: Message) -> bool:
+    s = await get_session(session_id)
     if not s:
         return False
-    s["messages"].append(message)
-    s["expires_at"] = datetime.utcnow() + timedelta(minutes=settings.SESSION_TIMEOUT)
+    s.messages.append(message)
+    s.expires_at = datetime.utcnow() + timedelta(minutes=settings.SESSION_TIMEOUT)
+    await _save(session_id, s)
     return True
 
 
-def end_session(session_id: str) -> None:
-    _sessions.pop(session_id, None)
+async def set_pipefy_card_id(session_id: str, card_id: str | None) -> None:
+    s = await get_session(session_id)
+    if not s or s.pipefy_card_id == card_id:
+        return
+    s.pipefy_card_id = card_id
+    await _save(session_id, s)
+
+
+async def end_session(session_id: str) -> None:
+    await _store.delete(session_id)
     
-def update_lead_info(session_id: str, info: dict):
-    session = _sessions.get(session_id)
+async def update_lead_info(session_id: str, info: dict):
+    session = await _store.get(session_id)
     if not session:
         return None
 
-    lead = session["lead"]
-    stage = session["stage"]
+    lead = session.lead
+    stage = session.stage
     
     if "nome" in info:
         lead.nome = info.get("nome")
@@ -72,22 +119,26 @@ def update_lead_info(session_id: str, info: dict):
             pass
     
     if stage == "initial" and info.get("nome"):
-        session["stage"] = "ask_email"
+        session.stage = "ask_email"
     
     elif stage == "ask_email" and info.get("email"):
-        session["stage"] = "ask_empresa"
+        session.stage = "ask_empresa"
         
     elif stage == "ask_empresa" and info.get("empresa"):
-        session["stage"] = "ask_necessidade"
+        session.stage = "ask_necessidade"
         
     elif stage == "ask_necessidade" and info.get("necessidade"):
-        session["stage"] = "ask_prazo"
+        session.stage = "ask_prazo"
         
     elif stage == "ask_prazo" and info.get("prazo"):
-        session["stage"] = "confirm_interest"
+        session.stage = "confirm_interest"
     
     elif stage == "confirm_interest" and "interesse_confirmado" in info:
         lead.interesse_confirmado = info.get("interesse_confirmado", False)
-        session["stage"] = "completed"
-        
+        session.stage = "completed"
+
+    await _save(session_id, session)
+    if session.stage != stage:
+        STAGE_TRANSITIONS.labels(stage, session.stage).inc()
+        fire_stage_hooks(session_id, session)
     return session
\ No newline at end of file
@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import fields
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Tuple
+from cachetools import TTLCache
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from models.db import get_database
+from models.lead import Lead
+from models.session import Message, Session
+from utils.context_window import trim_history
+
+
+class SessionConflictError(Exception):
+    pass
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    async def get(self, session_id: str) -> Session | None:
+        ...
+
+    @abstractmethod
+    async def save(self, session_id: str, session: Session) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        ...
+
+    async def stage(self, session_id: str, session: Session) -> None:
+        await self.save(session_id, session)
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+def deep_sizeof(obj: Any) -> int:
+    if isinstance(obj, Enum):
+        return 0
+    if isinstance(obj, BaseModel):
+        return sys.getsizeof(obj) + deep_sizeof(obj.__dict__)
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__slots__"):
+        return size + sum(deep_sizeof(getattr(obj, name)) for name in obj.__slots__)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(i) for i in obj)
+    return size
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, max_sessions: int = 0, sweep_interval_seconds: float = 0):
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._expiry: List[Tuple[datetime, str]] = []
+        # Tamanho de cada sessão medido no último save(); bytes_held é a soma, mantida a cada gravação e remoção.
+        self._sizes: Dict[str, int] = {}
+        # (mensagens já medidas, bytes delas) por sessão: cada save() só mede as mensagens novas.
+        self._message_sizes: Dict[str, Tuple[int, int]] = {}
+        self._bytes_held = 0
+        self._sweeper: asyncio.Task | None = None
+        self.metrics = {"expired": 0, "evicted": 0}
+
+    async def get(self, session_id: str) -> Session | None:
+        s = self._sessions.get(session_id)
+        if not s:
+            return None
+        if datetime.utcnow() > s.expires_at:
+            self._forget(session_id)
+            self.metrics["expired"] += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        return s
+
+    def _forget(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._bytes_held -= self._sizes.pop(session_id, 0)
+        self._message_sizes.pop(session_id, None)
+
+    def _measure(self, session_id: str, session: Session) -> int:
+        counted, message_bytes = self._message_sizes.get(session_id, (0, 0))
+        # Outro objeto de sessão ou histórico encurtado: mede todas as mensagens de novo.
+        if self._sessions.get(session_id) is not session or counted > len(session.messages):
+            counted, message_bytes = 0, 0
+        message_bytes += sum(deep_sizeof(m) for m in session.messages[counted:])
+        self._message_sizes[session_id] = (len(session.messages), message_bytes)
+        others = sum(deep_sizeof(getattr(session, name)) for name in session.__slots__ if name != "messages")
+        return sys.getsizeof(session) + sys.getsizeof(session.messages) + message_bytes + others
+
+    async def save(self, session_id: str, session: Session) -> None:
+        if session_id not in self._sessions:
+            heapq.heappush(self._expiry, (session.expires_at, session_id))
+        size = self._measure(session_id, session)
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self._bytes_held += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+        while self.max_sessions and len(self._sessions) > self.max_sessions:
+            self._forget(next(iter(self._sessions)))
+            self.metrics["evicted"] += 1
+
+    async def delete(self, session_id: str) -> None:
+        self._forget(session_id)
+
+    def sweep(self, now: datetime | None = None) -> int:
+        now = now or datetime.utcnow()
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, session_id = heapq.heappop(self._expiry)
+            s = self._sessions.get(session_id)
+            if s is None:
+                continue
+            if s.expires_at > now:
+                # A sessão foi renovada depois de entrar no heap: reagenda com o prazo atual.
+                heapq.heappush(self._expiry, (s.expires_at, session_id))
+                continue
+            self._forget(session_id)
+            removed += 1
+        self.metrics["expired"] += removed
+        if len(self._expiry) > 2 * len(self._sessions) + 64:
+            self._expiry = [(s.expires_at, sid) for sid, s in self._sessions.items()]
+            heapq.heapify(self._expiry)
+        return removed
+
+    async def start(self) -> None:
+        if self.sweep_interval and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Erro ao limpar sessões expiradas: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live_sessions": len(self._sessions),
+            "bytes_held": self._bytes_held,
+            "max_sessions": self.max_sessions,
+            **self.metrics,
+        }
+
+
+class MongoSessionStore(SessionStore):
+    def __init__(self, cache_ttl_seconds: float, unsaved_max: int = 10000, unsaved_ttl_seconds: float = 1800, cache_max: int = 10000, cache_hold_seconds: float = 1800):
+        self.cache_ttl = cache_ttl_seconds
+        # Cada entrada fica até cache_hold_seconds para manter a identidade do objeto; após cache_ttl é relida do MongoDB.
+        self._cache: TTLCache = TTLCache(maxsize=cache_max, ttl=max(cache_hold_seconds, cache_ttl_seconds))
+        # Sessões ainda sem mensagem do usuário: só existem neste processo até o primeiro save().
+        self._unsaved: TTLCache = TTLCache(maxsize=unsaved_max, ttl=unsaved_ttl_seconds)
+
+    @property
+    def collection(self):
+        return get_database().sessions
+
+    async def stage(self, session_id: str, session: Session) -> None:
+        self._unsaved[session_id] = session
+
+    async def get(self, session_id: str) -> Session | None:
+        unsaved = self._unsaved.get(session_id)
+        if unsaved is not None:
+            return unsaved
+        cached = self._cache.get(session_id)
+        if cached and time.monotonic() - cached[0] < self.cache_ttl:
+            if datetime.utcnow() > cached[1].expires_at:
+                self._cache.pop(session_id, None)
+                return None
+            return cached[1]
+
+        doc = await self.collection.find_one(
+            {"session_id": session_id, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "stage": 1, "lead": 1, "context_messages": 1, "created_at": 1, "expires_at": 1, "pipefy_card_id": 1, "omitted_messages": 1, "omitted_actions": 1, "version": 1},
+        )
+        if not doc or "stage" not in doc:
+            self._cache.pop(session_id, None)
+            return None
+
+        session = self._from_document(doc)
+        if cached:
+            # Atualiza o mesmo objeto para que referências já entregues continuem válidas.
+            for f in fields(Session):
+                if f.metadata.get("transient"):
+                    continue
+                setattr(cached[1], f.name, getattr(session, f.name))
+            session = cached[1]
+        self._cache[session_id] = (time.monotonic(), session)
+        return session
+
+    async def save(self, session_id: str, session: Session) -> None:
+        self._unsaved.pop(session_id, None)
+        # Só a janela de contexto vai para o documento, para cada gravação ter tamanho limitado.
+        trim_history(session, settings.CONTEXT_RECENT_MESSAGES)
+        now = datetime.utcnow()
+        # Só grava sobre a versão lida: se outro worker salvou antes, esta gravação falha em vez de apagar o turno dele.
+        # A versão é fixada antes do await: um get() concorrente pode atualizar session.version no meio da gravação.
+        version = session.version
+        expected = version or {"$in": [None, 0]}
+        try:
+            result = await self.collection.update_one(
+                {"session_id": session_id, "version": expected},
+                {
+                    "$set": {**self._to_document(session), "updated_at": now},
+                    "$inc": {"version": 1},
+                    "$setOnInsert": {"lead_email": "", "message_count": 0},
+                },
+                upsert=True,
+            )
+            conflict = not result.matched_count and result.upserted_id is None
+        except DuplicateKeyError:
+            conflict = True
+        if conflict:
+            self._cache.pop(session_id, None)
+            raise SessionConflictError(f"Sessão {session_id} foi alterada por outra requisição")
+        session.version = version + 1
+        self._cache[session_id] = (time.monotonic(), session)
+
+    async def delete(self, session_id: str) -> None:
+        self._cache.pop(session_id, None)
+        if self._unsaved.pop(session_id, None) is not None:
+            return
+        await self.collection.update_one(
+            {"session_id": session_id},
+            {"$set": {"expires_at": datetime.utcnow()}},
+        )
+
+    @staticmethod
+    def _to_document(session: Session) -> Dict[str, Any]:
+        return {
+            "stage": session.stage,
+            "lead": session.lead.model_dump(mode="json"),
+            "context_messages": [m.to_dict() for m in session.messages],
+            "created_at": session.created_at,
+            "expires_at": session.expires_at,
+            "pipefy_card_id": session.pipefy_card_id,
+            "omitted_messages": session.omitted_messages,
+            "omitted_actions": session.omitted_actions,
+        }
+
+    @staticmethod
+    def _from_document(doc: Dict[str, Any]) -> Session:
+        return Session(
+            created_at=doc["created_at"],
+            expires_at=doc["expires_at"],
+            stage=doc["stage"],
+            lead=Lead(**(doc.get("lead") or {})),
+            messages=[Message.from_dict(m) for m in doc.get("context_messages", [])],
+            pipefy_card_id=doc.get("pipefy_card_id"),
+            omitted_messages=doc.get("omitted_messages", 0),
+            omitted_actions=doc.get("omitted_actions") or [],
+            version=doc.get("version", 0),
+        )
+
+
+def lazy_persistence_enabled() -> bool:
+    if settings.SESSION_LAZY_PERSISTENCE is not None:
+        return settings.SESSION_LAZY_PERSISTENCE
+    # Com o MongoDB as sessões ainda não gravadas ficam só no processo que as criou; outro worker responderia 404.
+    return settings.SESSION_STORE != "mongo"
+
+
+def build_session_store() -> SessionStore:
+    if settings.SESSION_STORE == "mongo":
+        return MongoSessionStore(
+            cache_ttl_seconds=settings.SESSION_CACHE_TTL_SECONDS,
+            unsaved_max=settings.SESSION_MAX_COUNT,
+            unsaved_ttl_seconds=settings.SESSION_TIMEOUT * 60,
+            cache_max=settings.SESSION_MAX_COUNT,
+            cache_hold_seconds=settings.SESSION_TIMEOUT * 60,
+        )
+    if settings.SESSION_STORE == "memory":
+        return InMemorySessionStore(
+            max_sessions=settings.SESSION_MAX_COUNT,
+            sweep_interval_seconds=settings.SESSION_SWEEP_INTERVAL_SECONDS,
+        )
+    raise ValueError(f"SESSION_STORE inválido: {settings.SESSION_STORE}")
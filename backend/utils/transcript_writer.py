@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+from config import settings
+from models.db import TranscriptWriteError, add_message_db, add_messages_bulk_db
+from models.session import Message
+
+_STOP = object()
+
+
+class TranscriptWriter:
+    def __init__(self, flush_interval_ms: int, batch_size: int, max_queue: int, max_retries: int = 5):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        # Mensagens de sessões cuja gravação falhou, com o número de tentativas; vão na frente no próximo lote.
+        self._retry: Dict[str, Tuple[List[dict], int]] = {}
+        self._queue: asyncio.Queue | None = None
+        self._batch_ready: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._running = False
+        self.metrics = {"enqueued": 0, "flushed": 0, "batches": 0, "errors": 0, "retried": 0, "dropped": 0, "blocked": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._batch_ready = asyncio.Event()
+        self._running = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        await self._queue.put(_STOP)
+        self._batch_ready.set()
+        await self._task
+        self._task = None
+
+    async def enqueue(self, session_id: str, message: Message) -> None:
+        if not self._running:
+            await add_message_db(session_id, message.to_dict())
+            return
+        if self._queue.full():
+            self.metrics["blocked"] += 1
+        await self._queue.put((session_id, message))
+        self.metrics["enqueued"] += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_maxsize": self.max_queue,
+            "retry_pending": sum(len(pending) for pending, _ in self._retry.values()),
+            "running": self._running,
+            **self.metrics,
+        }
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                if self._retry:
+                    first = await asyncio.wait_for(self._queue.get(), self.flush_interval)
+                else:
+                    first = await self._queue.get()
+            except asyncio.TimeoutError:
+                await self._flush([])
+                continue
+            if first is _STOP:
+                break
+            if self._queue.qsize() + 1 < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+
+            batch = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Última tentativa para o que ainda falhava; o que sobrar é descartado.
+        if self._retry:
+            await self._flush([], final=True)
+
+    async def _flush(self, batch: List[Tuple[str, Message]], final: bool = False) -> None:
+        retrying, self._retry = self._retry, {}
+        grouped: Dict[str, List[dict]] = {session_id: list(pending) for session_id, (pending, _) in retrying.items()}
+        for session_id, message in batch:
+            grouped.setdefault(session_id, []).append(message.to_dict())
+        if not grouped:
+            return
+        try:
+            failures = await add_messages_bulk_db(grouped)
+        except Exception as e:
+            failures = {session_id: TranscriptWriteError(session_id, messages, e) for session_id, messages in grouped.items()}
+        written = sum(len(messages) for messages in grouped.values()) - sum(len(f.pending) for f in failures.values())
+        if written:
+            self.metrics["flushed"] += written
+            self.metrics["batches"] += 1
+
+        for session_id, failure in failures.items():
+            self.metrics["errors"] += 1
+            attempts = retrying.get(session_id, ([], 0))[1] + 1
+            if final or attempts > self.max_retries:
+                self.metrics["dropped"] += len(failure.pending)
+                print(f"Erro ao persistir mensagens da sessão {session_id}, descartando {len(failure.pending)}: {failure}")
+            else:
+                self.metrics["retried"] += len(failure.pending)
+                self._retry[session_id] = (failure.pending, attempts)
+                print(f"Erro ao persistir mensagens da sessão {session_id}, nova tentativa {attempts}: {failure}")
+
+
+transcript_writer = TranscriptWriter(
+    flush_interval_ms=settings.TRANSCRIPT_FLUSH_INTERVAL_MS,
+    batch_size=settings.TRANSCRIPT_BATCH_SIZE,
+    max_queue=settings.TRANSCRIPT_QUEUE_MAXSIZE,
+    max_retries=settings.TRANSCRIPT_MAX_RETRIES,
+)
@@ -0,0 +1,46 @@
+import { NextResponse } from "next/server";
+
+export async function POST(req: Request) {
+  const body = await req.json();
+
+  const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/message/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+
+  if (response.status === 404) {
+    let errorData = {};
+        try {
+            errorData = await response.json();
+        } catch {}
+    return new NextResponse(
+            JSON.stringify({ 
+                error: "Sessão expirada ou não encontrada.", 
+                detail: (errorData as any).detail || "Session not found" 
+            }),
+            {
+                status: 404,
+                headers: { "Content-Type": "application/json" },
+            }
+        );
+    }
+
+  // Erros (ex.: 409 de conflito na sessão) voltam como JSON com o status original, não como stream.
+  if (!response.ok) {
+    let errorData = {};
+    try {
+      errorData = await response.json();
+    } catch {}
+    return NextResponse.json(errorData, { status: response.status });
+  }
+
+  return new NextResponse(response.body, {
+    status: response.status,
+    headers: {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache",
+      Connection: "keep-alive",
+    },
+  });
+}